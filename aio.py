@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import asyncio
+import aiohttp
+from datetime import datetime, timedelta
+from market import (Base, Market, API_URL, REGISTER, INVALID_ACCOUNT_CODES, candle_windows, merge_candles,
+    MSG_REQUEST_ERR, MSG_CLIENT, MSG_CLIENT_ERR, MSG_TOKEN, MSG_ACCOUNT_ID, MSG_SANDBOX, MSG_MARKET_ERR,
+    MSG_MARKET_LIST)
+from orders import group_by_figi, MSG_ORDERS_ERR, MSG_PLACE_ORDER
+from codec import JsonCodec, get_codec
+from models import Instrument, Operation, Order, Position
+
+
+CONCURRENCY = 32
+POOL_MAXSIZE = 100
+
+
+class AsyncBase(object):
+
+    """ asyncio client, same methods and return shapes as market.Base,
+        all instances created with the same session share one connection pool
+    Usage:
+        async with AsyncOrders(token=TOKEN) as client:
+            stocks = await client.get_market() """
+
+    _load_credentials = Base._load_credentials
+    _save_sandbox = Base._save_sandbox
+    _get_from_db = Base._get_from_db
+
+
+    def __init__(self,
+        db: str = "test.db", token: str = None, account_id: str = None, sandbox: bool = True,
+        api_url: str = None, session: aiohttp.ClientSession = None,
+        concurrency: int = CONCURRENCY, pool_maxsize: int = POOL_MAXSIZE,
+        codec: JsonCodec = None):
+
+        """ Create new client, no I/O until connect()
+        Input:
+            token: str, stored in db,
+            account_id: str, stored in db,
+            db: str, file name for database,
+            sandbox: bool,
+            api_url: str, optional,
+            session: aiohttp.ClientSession, optional, shared connection pool,
+            concurrency: int, max requests in flight,
+            pool_maxsize: int, connection pool size for own session,
+            codec: JsonCodec, optional, default is the fastest installed """
+
+        self.db = db
+        credentials = self._load_credentials(token, account_id)
+        self.token = credentials.get("token")
+        self.account_id = credentials.get("account_id")
+
+        if not self.token:
+            raise Exception(MSG_CLIENT_ERR.format(MSG_TOKEN, self.token))
+
+        self.sandbox = sandbox
+        self.registered = not sandbox
+        self.cached_account = False
+        self.register_lock = asyncio.Lock()
+        self.last_response = None
+        self.api_url = api_url or API_URL
+        if sandbox:
+            self.api_url = self.api_url + "/sandbox"
+            cached = credentials.get("sandbox") or {}
+            if cached.get("token") == self.token and cached.get("api_url") == self.api_url:
+                self.account_id = cached.get("account_id")
+                self.registered = self.cached_account = True
+        self.headers = {'content-type': 'application/json'}
+        self.headers.update({"Authorization": "Bearer " + self.token})
+        self.session = session
+        self._own_session = session is None
+        self.pool_maxsize = pool_maxsize
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.codec = codec or get_codec()
+
+
+    async def connect(self):
+
+        """ Open connection pool, register sandbox client
+            unless its account is cached in the db """
+
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize)
+            self.session = aiohttp.ClientSession(connector=connector)
+
+        error = await self.register()
+        if error:
+            raise Exception(error)
+
+        return self
+
+
+    async def register(self):
+
+        """ Register sandbox client once, see Base.register
+            Output: None or error message string """
+
+        async with self.register_lock:
+            if self.registered:
+                return None
+
+            url = self.api_url + REGISTER
+            payload = { "brokerAccountType": "Tinkoff" }
+
+            res = await self._send_request(url, params=None, payload=payload)
+
+            if not isinstance(res, dict):
+                return MSG_CLIENT_ERR.format(MSG_ACCOUNT_ID.format(res))
+
+            self.account_id = res.get('payload').get('brokerAccountId')
+            self._save_sandbox(self.account_id)
+            self.registered = True
+            print(MSG_CLIENT.format(MSG_SANDBOX))
+            print(MSG_CLIENT.format(MSG_ACCOUNT_ID.format(self.account_id)))
+
+
+    async def close(self):
+
+        """ Close own connection pool, shared session is left open """
+
+        if self._own_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+    async def __aenter__(self):
+        return await self.connect()
+
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+    async def _send_request(self,
+        url: str,
+        params: dict = None,
+        payload: dict = None,
+        timeout: int = 11,
+        model = None,
+        key: str = None):
+
+        """ Send request, at most `concurrency` requests are in flight
+            Input: see Base._send_request
+            Output:
+                res: list/dict/str, expected type dict, list of model with model,
+                    str with an error message """
+
+        code, res = None, None
+        method = "POST" if payload else "GET"
+        data = self.codec.dumps(payload) if payload else None
+
+        try:
+            async with self.semaphore:
+                async with self.session.request(
+                    method, url, data=data, headers=self.headers, params=params,
+                    timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    self.last_response = response
+                    code, body = response.status, await response.read()
+                    if model is not None and code == 200:
+                        res = self.codec.decode(body, model, key)
+                    else:
+                        res = self.codec.loads(body)
+        except Exception as e:
+            return MSG_REQUEST_ERR.format(code, e)
+
+        if code != 200:
+            body = res.get('payload') or {}
+            if self.cached_account and body.get('code') in INVALID_ACCOUNT_CODES:
+                # sandbox account of the db is gone, register and resend
+                self.cached_account = self.registered = False
+                self._save_sandbox(None)
+                error = await self.register()
+                return error or await self._send_request(url, params, payload, timeout, model, key)
+            return MSG_REQUEST_ERR.format(code, body.get('message', res.get('message')))
+
+        return res
+
+
+    async def get_user_accounts(self):
+
+        """ Get list of user accounts, see Base.get_user_accounts """
+
+        url = self.api_url + "/user/accounts"
+
+        res = await self._send_request(url)
+
+        return res.get('payload').get('accounts') if isinstance(res, dict) else res
+
+
+class AsyncMarket(AsyncBase):
+
+
+    def __init__(self,
+        db: str = "test.db", token: str = None, account_id: str = None, sandbox: bool = True,
+        **kwargs):
+
+        super().__init__(db, token, account_id, sandbox, **kwargs)
+        self.markets = ("stocks", "etfs", "bonds", "currencies")
+
+
+    get_instruments_by_tickers = Market.get_instruments_by_tickers
+
+
+    async def get_market(self, market: str = None, typed: bool = False) -> list:
+
+        """ Get all instruments of the market, see Market.get_market """
+
+        if not market:
+            market = self.markets[0]
+
+        if market in self.markets:
+            url = self.api_url + "/market/" + market
+        else:
+            return MSG_MARKET_ERR.format(
+                MSG_MARKET_LIST.format(market, self.markets))
+
+        if typed:
+            return await self._send_request(url, model=Instrument, key='instruments')
+
+        res = await self._send_request(url)
+
+        return res.get('payload').get('instruments') if isinstance(res, dict) else res
+
+
+    async def get_candles(self,
+        instruments: list, depth: int = 30, interval: str = 'month'):
+
+        """ Add candles to list of instruments, all instruments and time windows
+            are requested concurrently with `asyncio.gather`, see Market.get_candles """
+
+        to = datetime.utcnow()
+        _from = to - timedelta(days=depth)
+
+        async def candles(instrument):
+            instrument['candles'] = await self._get_candles(
+                instrument['figi'], _from, to, interval)
+
+        await asyncio.gather(*(candles(instrument) for instrument in instruments))
+
+        return instruments
+
+
+    async def _get_candles(self, figi: str, _from: datetime, to: datetime, interval: str):
+
+        """ Get candles of one instrument for any time range, see Market._get_candles """
+
+        url = self.api_url + "/market/candles"
+
+        async def fetch(window):
+            params = {"from": window[0], "to": window[1], "interval": interval, "figi": figi}
+            res = await self._send_request(url, params=params)
+
+            return res.get('payload').get('candles') if isinstance(res, dict) else res
+
+        chunks = await asyncio.gather(
+            *(fetch(window) for window in candle_windows(_from, to, interval)))
+
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                return chunk
+
+        return chunks[0] if len(chunks) == 1 else merge_candles(chunks)
+
+
+class AsyncOperations(AsyncMarket):
+
+
+    async def get_operations(self,
+        depth: int = 365,
+        instruments: list = None,
+        figi:str = None,
+        account_id: str = None,
+        per_instrument: bool = False,
+        _from: datetime = None,
+        to: datetime = None,
+        typed: bool = False):
+
+        """ Add operations to the list instruments or get all operations in one request,
+            see Operations.get_operations """
+
+        url = self.api_url + "/operations"
+        to = to or datetime.utcnow()
+        _from = _from or to - timedelta(days=depth)
+        params = {"from": _from.isoformat() + '+00:00', "to": to.isoformat() + '+00:00'}
+        if account_id:
+            params.update({"brokerAccountId": account_id})
+        if figi:
+            params.update({"figi": figi})
+
+        if not instruments:
+            if typed:
+                return await self._send_request(
+                    url, params=params, model=Operation, key='operations')
+
+            res = await self._send_request(url, params=params)
+
+            return res.get('payload').get('operations') if isinstance(res, dict) else res
+
+        if per_instrument:
+            async def operations(instrument):
+                res = await self._send_request(url, params=dict(params, figi=instrument['figi']))
+
+                instrument['operations'] = (
+                    res.get('payload').get('operations') if isinstance(res, dict) else res)
+
+            await asyncio.gather(*(operations(instrument) for instrument in instruments))
+
+            return instruments
+
+        res = await self._send_request(url, params=params)
+        if isinstance(res, str):
+            for instrument in instruments:
+                instrument['operations'] = res
+            return instruments
+
+        by_figi = group_by_figi(res.get('payload').get('operations'))
+        for instrument in instruments:
+            instrument['operations'] = by_figi.get(instrument['figi'], [])
+
+        return instruments
+
+
+    async def get_portfolio(self, account_id: str = None, typed: bool = False):
+
+        """ Get client's portfolio, see Operations.get_portfolio """
+
+        url = self.api_url + "/portfolio"
+        params = {"brokerAccountId": account_id} if account_id else None
+
+        if typed:
+            return await self._send_request(url, params=params, model=Position, key='positions')
+
+        res = await self._send_request(url, params=params)
+
+        return res.get('payload').get('positions') if isinstance(res, dict) else res
+
+
+    async def get_currencies(self, account_id: str = None):
+
+        """ Get client's portfolio/currencies, see Operations.get_currencies """
+
+        url = self.api_url + "/portfolio/currencies"
+        params = {"brokerAccountId": account_id} if account_id else None
+
+        res = await self._send_request(url, params=params)
+
+        return res.get('payload').get('currencies') if isinstance(res, dict) else res
+
+
+class AsyncOrders(AsyncOperations):
+
+
+    async def get_orders(self, instruments: list = None, account_id: str = None, typed: bool = False):
+
+        """ Add active orders to list of instruments, see Orders.get_orders """
+
+        url = self.api_url + "/orders"
+        params = {"brokerAccountId": account_id} if account_id else None
+
+        if typed:
+            orders_list = await self._send_request(url, params=params, model=Order)
+        else:
+            res = await self._send_request(url, params=params)
+            orders_list = res.get('payload') if isinstance(res, dict) else res
+
+        if isinstance(orders_list, str):
+            return orders_list
+
+        if instruments:
+            for instrument in instruments:
+                instrument['orders'] = []
+                for order in orders_list:
+                    if instrument.get('figi') == (order.figi if typed else order.get('figi')):
+                        instrument['orders'].append(order)
+
+            return instruments
+        return orders_list
+
+
+    async def place_order(self,
+        figi: str,
+        lots: int,
+        op: str,
+        price: float,
+        account_id: str = None):
+
+        """ Place limit or market order, see Orders.place_order """
+
+        ops = ("Buy", "Sell")
+        if op not in ops:
+            msg = MSG_PLACE_ORDER.format(ops, op)
+            return MSG_ORDERS_ERR.format(msg)
+
+        url = self.api_url + "/orders/market-order"
+        params = {"figi": figi}
+        if account_id:
+            params.update({"brokerAccountId": account_id})
+        payload = {"lots": lots, "operation": op}
+        if price:
+            url = self.api_url + "/orders/limit-order"
+            payload.update({"price": price})
+        res = await self._send_request(url, params=params, payload=payload)
+
+        return res.get('payload') if isinstance(res, dict) else res
+
+
+    async def cancel_order(self, order_id: str, account_id: str = None):
+
+        """ Cancel order, see Orders.cancel_order """
+
+        url = self.api_url + "/orders/cancel"
+        params = {"orderId": order_id}
+        if account_id:
+            params.update({"brokerAccountId": account_id})
+
+        res = await self._send_request(url, params=params, payload=params)
+
+        return res.get('payload') if isinstance(res, dict) else res
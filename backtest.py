@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+from array import array
+from heapq import merge
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from candles import CandleSeries
+from store import COLUMNS, to_epoch, from_epoch
+from orders import group_by_figi, MSG_ORDERS_ERR, MSG_PLACE_ORDER
+from models import Operation, Order, Position, convert
+
+
+MSG_FIGI = "Backtest. Instrument {} has no candles"
+MSG_ORDER_NOT_FOUND = "Backtest. Active order {} is not found"
+COMMISSION = 0.0005
+SLIPPAGE = 0.0005
+CASH = 100000.
+DAY = 86400
+
+
+class Backtest(object):
+
+    """ Simulated broker replaying candles, same methods and return shapes as
+        orders.Orders: place_order, cancel_order, get_orders, get_portfolio,
+        get_currencies, get_operations.
+        Orders placed at a candle are filled by the next candles of the instrument:
+        market orders at the open with slippage, limit orders when the price
+        is reached, at the limit or the better open. Commission is charged on every fill.
+    Usage:
+        broker = Backtest.from_store(store, [figi], '5min', _from, to)
+        for time in broker.replay():
+            if broker.close(figi) > level and not broker.get_portfolio():
+                broker.place_order(figi, 1, "Buy", None)
+        broker.report() """
+
+    def __init__(self,
+        series: list,
+        cash: float = CASH,
+        currency: str = "USD",
+        commission: float = COMMISSION,
+        slippage: float = SLIPPAGE,
+        instruments: list = None):
+
+        """ Input:
+                series: list of CandleSeries, one interval,
+                cash: float, initial balance of every currency,
+                currency: str, currency of instruments unknown to instruments,
+                commission: float, part of the fill amount, 0.0005 is 0.05%,
+                slippage: float, part of the open price market orders lose,
+                instruments: list, optional, see Market.get_market, for lot, ticker,
+                    currency and type of the instruments """
+
+        # memoryview slices of the columns are zero-copy
+        self.series = {s.figi: CandleSeries(s.figi, s.interval,
+            *(memoryview(getattr(s, column)) for column, _ in COLUMNS)) for s in series}
+        self.instruments = {i['figi']: i for i in instruments or []}
+        self.initial = cash
+        self.currency = currency
+        self.commission = commission
+        self.slippage = slippage
+        self.reset()
+
+
+    @classmethod
+    def from_store(cls, store, figis: list, interval: str,
+        _from: datetime = None, to: datetime = None, **kwargs):
+
+        """ Replay candles of the CandleStore, the columns are memory-mapped,
+            so processes of a parameter sweep share one copy of the data
+            Input:
+                store: CandleStore,
+                figis: list of str,
+                interval: str,
+                _from: datetime, utc, optional,
+                to: datetime, utc, optional,
+                kwargs: see __init__ """
+
+        return cls([CandleSeries.from_columns(figi, interval, store.read(figi, interval, _from, to))
+            for figi in figis], **kwargs)
+
+
+    def reset(self):
+
+        """ Forget orders, positions and operations, the candles are replayed from the start """
+
+        self.cash = {}
+        for instrument in self.instruments.values():
+            self.cash.setdefault(instrument.get('currency') or self.currency, self.initial)
+        self.cash.setdefault(self.currency, self.initial)
+        self.currencies = {
+            figi: self._instrument(figi).get('currency') or self.currency for figi in self.series}
+        self.index = {figi: -1 for figi in self.series}
+        self.now = None
+        self.orders = {}
+        self.pending = {}
+        self.positions = {}
+        self.held = {}  # figi: balance of the opened positions
+        self.operations = []
+        self.order_id = 0
+        self.fees = {currency: 0. for currency in self.cash}
+        # currencies are not converted, every currency has its own equity
+        self.equity_curves = {currency: array('d') for currency in self.cash}
+
+
+    def replay(self):
+
+        """ Step through the candles of all instruments in time order,
+            at every step pending orders are filled by the new candles,
+            then the time is yielded and the strategy sees candles up to it
+            Output: generator of int, epoch seconds """
+
+        self.reset()
+        series = list(self.series.values())
+        if len(series) == 1:
+            # one instrument, the per candle work is inlined
+            # one instrument, the per candle work is inlined,
+            # only the equity of its currency changes
+            s = series[0]
+            figi, times, closes = s.figi, s.time, s.c
+            currency = self.currencies[figi]
+            index, pending, held, cash = self.index, self.pending, self.held, self.cash
+            curve = self.equity_curves[currency]
+            for i in range(len(times)):
+                self.now = times[i]
+                index[figi] = i
+                if pending.get(figi):
+                    self._fill(figi, i)
+                balance = held.get(figi)
+                curve.append(cash[currency] + balance * closes[i] if balance else cash[currency])
+                yield self.now
+            return
+
+        timeline = merge(*(s.time for s in series))
+        position = {s.figi: 0 for s in series}
+        last = None
+        for time in timeline:
+            if time == last:
+                continue
+            last = self.now = time
+            for s in series:
+                i = position[s.figi]
+                if i < len(s.time) and s.time[i] == time:
+                    position[s.figi] = i + 1
+                    self.index[s.figi] = i
+                    if self.pending.get(s.figi):
+                        self._fill(s.figi, i)
+            for currency, curve in self.equity_curves.items():
+                curve.append(self.equity(currency))
+            yield time
+
+
+    def run(self, strategy) -> dict:
+
+        """ Replay all candles, strategy(broker) is called at every step
+            Output: report: dict, see report """
+
+        for _ in self.replay():
+            strategy(self)
+
+        return self.report()
+
+
+    def close(self, figi: str) -> float:
+
+        """ Close of the last seen candle of the instrument, None before the first one """
+
+        i = self.index.get(figi, -1)
+        return self.series[figi].c[i] if i >= 0 else None
+
+
+    def candle(self, figi: str) -> dict:
+
+        """ Last seen candle of the instrument, API candle dict """
+
+        i = self.index.get(figi, -1)
+        return self.series[figi][i] if i >= 0 else None
+
+
+    def history(self, figi: str, n: int = None) -> CandleSeries:
+
+        """ Seen candles of the instrument, the last n ones, no copy """
+
+        end = self.index.get(figi, -1) + 1
+        return self.series[figi][max(0, end - n) if n else 0:end]
+
+
+    def equity(self, currency: str = None) -> float:
+
+        """ Cash and positions of the currency valued at the last close
+            Input:
+                currency: str, optional, default currency """
+
+        currency = currency or self.currency
+        value = self.cash[currency]
+        for figi, balance in self.held.items():
+            if self.currencies[figi] == currency:
+                value += balance * self.series[figi].c[self.index[figi]]
+
+        return value
+
+
+    def report(self) -> dict:
+
+        """ Results per currency, balances of different currencies are not converted
+            Output: dict = {
+                'currencies': {currency: {'equity': float, 'return': float,
+                    'max_drawdown': float, 'commission': float}},
+                'fills': int, 'candles': int} """
+
+        currencies = {}
+        for currency, curve in self.equity_curves.items():
+            equity = curve[-1] if curve else self.equity(currency)
+            peak, drawdown = self.initial, 0.
+            for value in curve:
+                if value > peak:
+                    peak = value
+                elif (peak - value) / peak > drawdown:
+                    drawdown = (peak - value) / peak
+            currencies[currency] = {'equity': equity, 'return': equity / self.initial - 1,
+                'max_drawdown': drawdown, 'commission': self.fees[currency]}
+
+        return {'currencies': currencies, 'fills': len(self.operations),
+            'candles': max(len(curve) for curve in self.equity_curves.values())}
+
+
+    def _instrument(self, figi: str) -> dict:
+        return self.instruments.get(figi) or {'figi': figi}
+
+
+    def _fill(self, figi: str, i: int):
+        s = self.series[figi]
+        o, h, l = s.o[i], s.h[i], s.l[i]
+        pending = self.pending[figi]
+
+        for order in list(pending):
+            buy = order['operation'] == "Buy"
+            if order['type'] == "Market":
+                price = o * (1 + self.slippage) if buy else o * (1 - self.slippage)
+            elif buy and l <= order['price']:
+                price = min(order['price'], o)
+            elif not buy and h >= order['price']:
+                price = max(order['price'], o)
+            else:
+                continue
+            pending.remove(order)
+            self._execute(order, price)
+
+
+    def _execute(self, order: dict, price: float):
+        figi = order['figi']
+        instrument = self._instrument(figi)
+        currency = instrument.get('currency') or self.currency
+        sign = 1 if order['operation'] == "Buy" else -1
+        quantity = order['requestedLots'] * instrument.get('lot', 1)
+        amount = quantity * price
+        fee = amount * self.commission
+        self.cash[currency] -= sign * amount + fee
+        self.fees[currency] += fee
+
+        position = self.positions.get(figi)
+        if position is None:
+            position = self.positions[figi] = {'figi': figi,
+                'ticker': instrument.get('ticker'), 'instrumentType': instrument.get('type', "Stock"),
+                'balance': 0, 'lots': 0,
+                'averagePositionPrice': {'currency': currency, 'value': price}}
+        balance = position['balance']
+        average = position['averagePositionPrice']
+        if balance == 0 or (balance > 0) != (sign > 0) and quantity > abs(balance):
+            average['value'] = price  # opened or reversed
+        elif (balance > 0) == (sign > 0):
+            average['value'] = (average['value'] * abs(balance) + amount) / (abs(balance) + quantity)
+        position['balance'] = balance + sign * quantity
+        if position['balance']:
+            self.held[figi] = position['balance']
+        else:
+            self.held.pop(figi, None)
+        position['lots'] += sign * order['requestedLots']
+
+        order.update({'status': "Fill", 'executedLots': order['requestedLots'], 'price': price})
+        date = from_epoch(self.now)
+        self.operations.append({'id': order['orderId'], 'status': "Done", 'figi': figi,
+            'operationType': order['operation'], 'payment': -sign * amount, 'price': price,
+            'quantity': quantity, 'quantityExecuted': quantity, 'currency': currency,
+            'instrumentType': position['instrumentType'], 'date': date, 'isMarginCall': False,
+            'commission': {'currency': currency, 'value': -fee},
+            'trades': [{'tradeId': order['orderId'], 'date': date,
+                'price': price, 'quantity': quantity}]})
+
+
+    def place_order(self,
+        figi: str,
+        lots: int,
+        op: str,
+        price: float,
+        account_id: str = None,
+        client_order_id: str = None):
+
+        """ Place limit order, market order without price, see Orders.place_order
+        Output:
+            expected type dict, str with an error message """
+
+        if client_order_id and client_order_id in self.orders:
+            order = self.orders[client_order_id]
+            return {'orderId': order['orderId'], 'operation': order['operation'],
+                'status': order['status'], 'requestedLots': order['requestedLots'],
+                'executedLots': order['executedLots']}
+
+        ops = ("Buy", "Sell")
+        if op not in ops:
+            return MSG_ORDERS_ERR.format(MSG_PLACE_ORDER.format(ops, op))
+        if figi not in self.series:
+            return MSG_ORDERS_ERR.format(MSG_FIGI.format(figi))
+
+        self.order_id += 1
+        order = {'orderId': "backtest-{}".format(self.order_id), 'figi': figi,
+            'operation': op, 'status': "New", 'requestedLots': lots, 'executedLots': 0,
+            'type': "Limit" if price else "Market", 'price': price}
+        self.orders[order['orderId']] = order
+        if client_order_id:
+            self.orders[client_order_id] = order
+        self.pending.setdefault(figi, []).append(order)
+
+        return {'orderId': order['orderId'], 'operation': op, 'status': "New",
+            'requestedLots': lots, 'executedLots': 0}
+
+
+    def cancel_order(self, order_id: str, account_id: str = None):
+
+        """ Cancel active order, see Orders.cancel_order
+        Output:
+            expected type dict, str with an error message """
+
+        order = self.orders.get(order_id)
+        if order is None or order['status'] != "New":
+            return MSG_ORDERS_ERR.format(MSG_ORDER_NOT_FOUND.format(order_id))
+
+        self.pending[order['figi']].remove(order)
+        order['status'] = "Cancelled"
+
+        return {}
+
+
+    def get_orders(self, instruments: list = None, account_id: str = None, typed: bool = False):
+
+        """ Active orders, see Orders.get_orders """
+
+        orders_list = [dict(order) for figi in self.pending for order in self.pending[figi]]
+        if typed:
+            orders_list = convert(orders_list, Order)
+
+        if instruments:
+            for instrument in instruments:
+                instrument['orders'] = [order for order in orders_list
+                    if instrument.get('figi') == (order.figi if typed else order['figi'])]
+            return instruments
+
+        return orders_list
+
+
+    def get_portfolio(self, account_id: str = None, typed: bool = False):
+
+        """ Opened positions, expectedYield at the last close, see Orders.get_portfolio """
+
+        positions = []
+        for figi, position in self.positions.items():
+            if not position['lots']:
+                continue
+            average = position['averagePositionPrice']
+            positions.append(dict(position,
+                averagePositionPrice=dict(average),
+                expectedYield={'currency': average['currency'],
+                    'value': (self.close(figi) - average['value']) * position['balance']}))
+
+        return convert(positions, Position) if typed else positions
+
+
+    def get_currencies(self, account_id: str = None):
+
+        """ Currency balances, see Orders.get_currencies """
+
+        return [{'currency': currency, 'balance': balance} for currency, balance in self.cash.items()]
+
+
+    def get_operations(self,
+        depth: int = 365,
+        instruments: list = None,
+        figi: str = None,
+        account_id: str = None,
+        per_instrument: bool = False,
+        _from: datetime = None,
+        to: datetime = None,
+        typed: bool = False):
+
+        """ Operations until the replayed time, see Orders.get_operations,
+            depth is counted from the replayed time """
+
+        end = to_epoch(to) if to else self.now if self.now is not None else to_epoch(datetime.utcnow())
+        start = to_epoch(_from) if _from else end - depth * DAY
+        _from, to = from_epoch(start), from_epoch(end)
+        operations = [operation for operation in self.operations
+            if (not figi or operation['figi'] == figi) and _from <= operation['date'] <= to]
+
+        if not instruments:
+            return convert(operations, Operation) if typed else operations
+
+        grouped = group_by_figi(operations)
+        for instrument in instruments:
+            instrument['operations'] = grouped.get(instrument['figi'], [])
+
+        return instruments
+
+
+def sweep(run, grid: list, processes: int = None, chunksize: int = 8) -> list:
+
+    """ Run backtests for every parameter set on a process pool
+        Input:
+            run: function(params) -> result, module level to be picklable,
+                e.g. builds Backtest.from_store and returns its report,
+            grid: list of params,
+            processes: int, optional, default number of CPUs,
+            chunksize: int, params sent to a process at once
+        Output:
+            results: list, in grid order """
+
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(run, grid, chunksize=chunksize))
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+bench.py
+Client benchmarks against the local stand-in server,
+p50/p99 latency, throughput and memory per client method
+Usage:
+    ./bench.py
+    ./bench.py --calls 200 --instruments 300 --latency 0.005 --json bench.json
+"""
+
+
+import os
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+import tracemalloc
+import requests
+from orders import Orders
+from fake_server import serve_process
+from transport import Transport
+from ratelimit import RateLimiter, RATE_LIMITS
+from codec import CODECS, INSTALLED
+from models import Instrument, Candle
+from store import CandleStore
+from backtest import Backtest, sweep
+
+
+CALLS = 200
+INSTRUMENTS = 100
+DB = "bench.db"
+TOKEN = "bench"
+FIGI = "BBG000HLJ7M4"
+TICKERS = 500
+CANDLES = 10000
+BACKTEST_STORE = "bench_candles"
+
+
+def percentile(timings: list, p: float) -> float:
+
+    """ Input: timings: sorted list, p: 0..100 """
+
+    return timings[min(len(timings) - 1, int(len(timings) * p / 100))]
+
+
+def measure(name: str, func, calls: int = CALLS, items: int = 1) -> dict:
+
+    """ Call func `calls` times, then once more under tracemalloc
+        Input:
+            name: str,
+            func: function without arguments,
+            calls: int,
+            items: int, records processed per call, for bulk paths
+        Output:
+            result: dict = {name, calls, p50, p99, mean, per_sec, items_per_sec, peak_kb} """
+
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    total = sum(timings)
+    timings.sort()
+    return {"name": name, "calls": calls,
+        "p50": percentile(timings, 50) * 1000, "p99": percentile(timings, 99) * 1000,
+        "mean": total / calls * 1000, "per_sec": calls / total,
+        "items_per_sec": calls * items / total, "peak_kb": peak / 1024}
+
+
+def report(result: dict):
+    print("{name:<34} calls: {calls:>5}  p50: {p50:>8.2f} ms  p99: {p99:>8.2f} ms  "
+        "calls/sec: {per_sec:>8.1f}  items/sec: {items_per_sec:>9.1f}  "
+        "peak: {peak_kb:>9.1f} KB".format(**result))
+
+
+def client(api_url: str, **kwargs) -> Orders:
+
+    """ Client without rate limits, the stand-in server limits instead """
+
+    limiter = RateLimiter({group: 10 ** 9 for group in RATE_LIMITS})
+    return Orders(db=DB, token=TOKEN, api_url=api_url, limiter=limiter, **kwargs)
+
+
+def bench_transport(api_url: str, calls: int = CALLS) -> list:
+
+    """ Module-level requests.get, new connection per call, vs pooled transport """
+
+    url = api_url + "/market/stocks"
+    headers = {'content-type': 'application/json', "Authorization": "Bearer " + TOKEN}
+    c = client(api_url, transport=Transport())
+
+    return [
+        measure("requests.get (no pool)",
+            lambda: requests.get(url, headers=headers, timeout=11).json(), calls),
+        measure("Transport (keep-alive)", lambda: c.get_market("stocks"), calls)]
+
+
+def bench_methods(api_url: str, calls: int = CALLS) -> list:
+
+    """ Every client method """
+
+    c = client(api_url)
+    stocks = c.get_market("stocks")
+    order = c.place_order(FIGI, 1, "Buy", 10)
+    methods = [
+        ("get_user_accounts", c.get_user_accounts),
+        ("get_market stocks", lambda: c.get_market("stocks")),
+        ("get_instruments_by_tickers", lambda: c.get_instruments_by_tickers(("IDCC",), stocks)),
+        ("get_candles 1 x 30d day", lambda: c.get_candles(stocks[:1], 30, "day")),
+        ("get_operations", lambda: c.get_operations(30)),
+        ("get_portfolio", c.get_portfolio),
+        ("get_currencies", c.get_currencies),
+        ("get_orders", c.get_orders),
+        ("place_order + cancel_order", lambda: c.cancel_order(
+            c.place_order(FIGI, 1, "Buy", 10).get("orderId"))),
+    ]
+    c.cancel_order(order.get("orderId"))
+
+    return [measure(name, func, calls) for name, func in methods]
+
+
+def bench_bulk(api_url: str, instruments: int = INSTRUMENTS, calls: int = 3) -> list:
+
+    """ Candles for N instruments, serial and parallel """
+
+    c = client(api_url, transport=Transport(pool_maxsize=16))
+    stocks = c.get_market("stocks")[:instruments]
+    n = len(stocks)
+
+    return [
+        measure("get_market stocks {}".format(n),
+            lambda: c.get_market("stocks"), calls, n),
+        measure("iter_market stocks {}".format(n),
+            lambda: sum(1 for _ in c.iter_market("stocks")), calls, n),
+        measure("candles {} x 7d hour serial".format(n),
+            lambda: c.get_candles([dict(s) for s in stocks], 7, "hour"), calls, n),
+        measure("candles {} x 7d hour workers=16".format(n),
+            lambda: c.get_candles([dict(s) for s in stocks], 7, "hour", workers=16), calls, n),
+        measure("candles 1 x 365d 5min chunked",
+            lambda: c.get_candles([dict(stocks[0])], 365, "5min"), 1)]
+
+
+def bench_codec(api_url: str, calls: int = CALLS) -> list:
+
+    """ Decode recorded response bodies with every installed codec,
+        to dicts and straight into typed structs """
+
+    c = client(api_url)
+    c.get_market("stocks")
+    market = c.last_response.content
+    to = datetime.utcnow()
+    c._send_request(c.api_url + "/market/candles", params={
+        "figi": FIGI, "from": (to - timedelta(days=1)).isoformat() + "+00:00",
+        "to": to.isoformat() + "+00:00", "interval": "1min"})
+    candles = c.last_response.content
+    n_market = len(c.codec.loads(market)["payload"]["instruments"])
+    n_candles = len(c.codec.loads(candles)["payload"]["candles"])
+
+    results = []
+    for name in CODECS:
+        if not INSTALLED[name]:
+            continue
+        codec = CODECS[name]()
+        results += [
+            measure("codec {} loads market {}".format(name, n_market),
+                lambda: codec.loads(market), calls, n_market),
+            measure("codec {} typed market {}".format(name, n_market),
+                lambda: codec.decode(market, Instrument, "instruments"), calls, n_market),
+            measure("codec {} loads candles {}".format(name, n_candles),
+                lambda: codec.loads(candles), calls, n_candles),
+            measure("codec {} typed candles {}".format(name, n_candles),
+                lambda: codec.decode(candles, Candle, "candles"), calls, n_candles)]
+    return results
+
+
+def bench_indicators(tickers: int = TICKERS, candles: int = CANDLES, calls: int = 3) -> list:
+
+    """ Indicators over a random (tickers x candles) universe,
+        whole matrix and incremental update per new candle of all tickers """
+
+    import numpy as np
+    import indicators as ind
+
+    rng = np.random.default_rng(0)
+    c = 100 + np.cumsum(rng.normal(size=(tickers, candles)), axis=1)
+    h, l = c + rng.random((tickers, candles)), c - rng.random((tickers, candles))
+    v = rng.integers(1, 1000, (tickers, candles)).astype(float)
+    time = 1609459200 + 60 * np.arange(candles)
+    size = tickers * candles
+    incremental = (ind.SMA(20, tickers), ind.EMA(12, tickers), ind.RSI(14, tickers),
+        ind.ATR(14, tickers), ind.VWAP(tickers))
+
+    def update(t=candles - 1):
+        sma, ema, rsi, atr, vwap = incremental
+        sma.update(c[:, t])
+        ema.update(c[:, t])
+        rsi.update(c[:, t])
+        atr.update(h[:, t], l[:, t], c[:, t])
+        vwap.update(h[:, t], l[:, t], c[:, t], v[:, t], int(time[t]))
+
+    label = "{} x {}".format(tickers, candles)
+    return [
+        measure("sma 20 " + label, lambda: ind.sma(c, 20), calls, size),
+        measure("ema 12 " + label, lambda: ind.ema(c, 12), calls, size),
+        measure("rsi 14 " + label, lambda: ind.rsi(c, 14), calls, size),
+        measure("atr 14 " + label, lambda: ind.atr(h, l, c, 14), calls, size),
+        measure("vwap daily " + label, lambda: ind.vwap(h, l, c, v, time), calls, size),
+        measure("incremental 5 indicators x {}".format(tickers), update, CALLS, tickers)]
+
+
+def crossover(broker, figi: str, fast: int, slow: int):
+
+    """ Moving average crossover strategy for the backtest benchmark,
+        always one lot long or short """
+
+    fast_alpha, slow_alpha = 2. / (fast + 1), 2. / (slow + 1)
+    averages = [None, None]
+
+    def step(broker):
+        price = broker.close(figi)
+        if averages[0] is None:
+            averages[:] = price, price
+        averages[0] += fast_alpha * (price - averages[0])
+        averages[1] += slow_alpha * (price - averages[1])
+        if broker.pending.get(figi):
+            return
+        lots = broker.held.get(figi, 0)
+        if averages[0] > averages[1] and lots <= 0:
+            broker.place_order(figi, 1 - lots, "Buy", None)
+        elif averages[0] < averages[1] and lots >= 0:
+            broker.place_order(figi, 1 + lots, "Sell", None)
+
+    return broker.run(step)
+
+
+def backtest_run(params: tuple) -> dict:
+
+    """ One backtest of the sweep, params = (store path, figi, fast, slow) """
+
+    path, figi, fast, slow = params
+    broker = Backtest.from_store(CandleStore(path), [figi], "5min")
+    return crossover(broker, figi, fast, slow)
+
+
+def bench_backtest(path: str = BACKTEST_STORE, days: int = 365, runs: int = 32) -> list:
+
+    """ Year of 5min candles replayed from the store, one run and a process pool sweep """
+
+    import random
+
+    store, figi = CandleStore(path), FIGI
+    start = datetime(2021, 1, 1)
+    if not len(store.read(figi, "5min")["time"]):
+        random.seed(0)
+        price, candles = 100., []
+        for i in range(days * 288):
+            close = price * (1 + random.gauss(0, 0.001))
+            candles.append({"o": price, "h": max(price, close) * 1.001,
+                "l": min(price, close) * 0.999, "c": close, "v": random.randint(1, 100),
+                "time": (start + timedelta(minutes=5 * i)).strftime("%Y-%m-%dT%H:%M:%SZ")})
+            price = close
+        store.append(figi, "5min", candles, start, start + timedelta(days=days))
+
+    n = len(store.read(figi, "5min")["time"])
+    grid = [(path, figi, fast, slow) for fast in (5, 10, 20, 40) for slow in range(50, 50 + runs // 4 * 25, 25)]
+    single = measure("backtest 1 x {} 5min candles".format(n),
+        lambda: backtest_run(grid[0]), 3, n)
+    result = measure("backtest sweep {} runs, {} processes".format(len(grid), os.cpu_count()),
+        lambda: sweep(backtest_run, grid), 1, len(grid))
+    result["runs_per_min"] = result["items_per_sec"] * 60
+
+    return [single, result]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="tinkoff_client benchmarks")
+    parser.add_argument("--calls", type=int, default=CALLS)
+    parser.add_argument("--instruments", type=int, default=INSTRUMENTS)
+    parser.add_argument("--tickers", type=int, default=TICKERS, help="indicators universe")
+    parser.add_argument("--candles", type=int, default=CANDLES, help="indicators universe")
+    parser.add_argument("--latency", type=float, default=0, help="server latency, seconds")
+    parser.add_argument("--json", help="save results to file for comparison between commits")
+    args = parser.parse_args(argv)
+
+    server, api_url = serve_process(latency=args.latency, stocks=args.instruments)
+    print("Stand-in server:", api_url, "latency:", args.latency)
+
+    results = []
+    for bench in (
+        lambda: bench_transport(api_url, args.calls),
+        lambda: bench_methods(api_url, args.calls),
+        lambda: bench_codec(api_url, args.calls),
+        lambda: bench_bulk(api_url, args.instruments),
+        lambda: bench_indicators(args.tickers, args.candles),
+        lambda: bench_backtest()):
+        for result in bench():
+            report(result)
+            results.append(result)
+
+    server.terminate()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__=="__main__":
+    main()
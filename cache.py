@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+
+# seconds a GET response is served from the cache, other endpoints are not cached
+TTLS = {
+    "/user/accounts": 60,
+    "/market/stocks": 3600,
+    "/market/etfs": 3600,
+    "/market/bonds": 3600,
+    "/market/currencies": 3600,
+    "/portfolio": 1,
+    "/portfolio/currencies": 1,
+    "/orders": 1,
+}
+# POST endpoint: cached endpoints it changes, prefixes
+INVALIDATES = {
+    "/orders/limit-order": ("/orders", "/portfolio"),
+    "/orders/market-order": ("/orders", "/portfolio"),
+    "/orders/cancel": ("/orders", "/portfolio"),
+}
+MAXSIZE = 256
+
+
+class _Call(object):
+
+    __slots__ = ('event', 'result')
+
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class ResponseCache(object):
+
+    """ Read-through cache of GET responses, TTL per endpoint, LRU eviction.
+        Identical concurrent GETs are coalesced into one request,
+        also for endpoints without TTL. Callers get their own copy.
+    Usage:
+        client = Orders(cache=ResponseCache()) """
+
+    def __init__(self, ttls: dict = None, maxsize: int = MAXSIZE, clock=time.monotonic):
+
+        """ Input:
+                ttls: dict, {endpoint: seconds}, default TTLS,
+                maxsize: int, max cached responses,
+                clock: function, seconds """
+
+        self.ttls = TTLS if ttls is None else ttls
+        self.maxsize = maxsize
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.calls = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = 0
+
+
+    @staticmethod
+    def key(endpoint: str, params: dict = None, model=None) -> tuple:
+        key = (endpoint, tuple(sorted((params or {}).items())))
+        return key + (model.__name__,) if model is not None else key
+
+
+    def fetch(self, endpoint: str, params: dict, func, model=None):
+
+        """ Get cached response or call func once for all concurrent callers
+            Input:
+                endpoint: str, e.g. '/portfolio',
+                params: dict,
+                func: function, sends the request, dict or list result is cached,
+                model: models struct, optional, func decodes typed payloads,
+                    typed and dict responses are cached apart
+            Output:
+                response """
+
+        key = self.key(endpoint, params, model)
+        ttl = self.ttls.get(endpoint)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > self.clock():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                generation = self.generation
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = func()
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+                if ttl and isinstance(call.result, (dict, list)) and generation == self.generation:
+                    self.entries[key] = (self.clock() + ttl, call.result)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.maxsize:
+                        self.entries.popitem(last=False)
+            call.event.set()
+
+        return copy.deepcopy(call.result)
+
+
+    def invalidate(self, *prefixes: str):
+
+        """ Drop cached responses of the endpoints starting with prefixes,
+            no prefixes drops all, in-flight responses are not cached """
+
+        with self.lock:
+            self.generation += 1
+            for key in list(self.entries):
+                if not prefixes or key[0].startswith(prefixes):
+                    del self.entries[key]
+
+
+    def changed(self, endpoint: str):
+
+        """ Invalidate cached endpoints changed by the POST endpoint """
+
+        prefixes = INVALIDATES.get(endpoint)
+        if prefixes:
+            self.invalidate(*prefixes)
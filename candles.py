@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+from array import array
+from bisect import bisect_left, bisect_right
+from store import COLUMNS, to_epoch, from_epoch
+
+
+def parse_times(times: list) -> array:
+
+    """ Parse candle times in bulk, '2021-03-18T04:00:00Z' to epoch seconds,
+        the date part is parsed once per day
+        Input:
+            times: list of str
+        Output:
+            array('q') """
+
+    days, result = {}, array('q')
+    append = result.append
+
+    for time in times:
+        if len(time) == 20 and time[-1] == 'Z':
+            day = days.get(time[:10])
+            if day is None:
+                day = days[time[:10]] = to_epoch(time[:10] + 'T00:00:00Z')
+            append(day + int(time[11:13]) * 3600 + int(time[14:16]) * 60 + int(time[17:19]))
+        else:
+            append(to_epoch(time))
+
+    return result
+
+
+class CandleSeries(object):
+
+    """ Candles of one instrument as columns:
+            time: epoch seconds, o, h, l, c: float, v: int
+        figi and interval are stored once per series,
+        columns are array.array or memoryview (e.g. from CandleStore) """
+
+    __slots__ = ('figi', 'interval', 'time', 'o', 'h', 'l', 'c', 'v')
+
+
+    def __init__(self, figi: str, interval: str,
+        time=None, o=None, h=None, l=None, c=None, v=None):
+
+        self.figi = figi
+        self.interval = interval
+        self.time = time if time is not None else array('q')
+        self.o = o if o is not None else array('d')
+        self.h = h if h is not None else array('d')
+        self.l = l if l is not None else array('d')
+        self.c = c if c is not None else array('d')
+        self.v = v if v is not None else array('q')
+
+
+    @classmethod
+    def from_candles(cls, candles: list, figi: str = None, interval: str = None):
+
+        """ Create series from the API candles list
+            Input:
+                candles: list = [{'o','c','h','l','v','time','interval','figi'}],
+                figi: str, optional, default from the first candle,
+                interval: str, optional, default from the first candle
+            Output:
+                CandleSeries """
+
+        first = candles[0] if candles else {}
+
+        return cls(
+            figi or first.get('figi'), interval or first.get('interval'),
+            parse_times([candle['time'] for candle in candles]),
+            array('d', [candle['o'] for candle in candles]),
+            array('d', [candle['h'] for candle in candles]),
+            array('d', [candle['l'] for candle in candles]),
+            array('d', [candle['c'] for candle in candles]),
+            array('q', [candle['v'] for candle in candles]))
+
+
+    @classmethod
+    def from_columns(cls, figi: str, interval: str, columns: dict):
+
+        """ Create series from columns dict, e.g. CandleStore.read, no copy """
+
+        return cls(figi, interval, *(columns[column] for column, _ in COLUMNS))
+
+
+    def columns(self) -> dict:
+
+        """ Output: dict = {'time': column, 'o': column, ...} """
+
+        return {column: getattr(self, column) for column, _ in COLUMNS}
+
+
+    def __len__(self):
+        return len(self.time)
+
+
+    def __getitem__(self, index):
+
+        """ series[i] is a candle dict, series[i:j] is a series, no copy for memoryviews """
+
+        if isinstance(index, slice):
+            return CandleSeries(self.figi, self.interval,
+                *(getattr(self, column)[index] for column, _ in COLUMNS))
+
+        return {'o': self.o[index], 'c': self.c[index], 'h': self.h[index],
+            'l': self.l[index], 'v': self.v[index], 'time': from_epoch(self.time[index]),
+            'interval': self.interval, 'figi': self.figi}
+
+
+    def between(self, _from=None, to=None):
+
+        """ Get candles in time range, inclusive
+            Input:
+                _from: datetime/str/epoch int, optional,
+                to: datetime/str/epoch int, optional
+            Output:
+                CandleSeries """
+
+        start = bisect_left(self.time, _epoch(_from)) if _from is not None else 0
+        end = bisect_right(self.time, _epoch(to)) if to is not None else len(self)
+
+        return self[start:end]
+
+
+    def extend(self, other):
+
+        """ Append newer candles of the same instrument,
+            a candle with the last time replaces it """
+
+        if not len(other):
+            return self
+        for column, typecode in COLUMNS:
+            if not isinstance(getattr(self, column), array):
+                setattr(self, column, array(typecode, getattr(self, column)))
+        if len(self) and other.time[0] == self.time[-1]:
+            for column, _ in COLUMNS:
+                del getattr(self, column)[-1]
+        for column, _ in COLUMNS:
+            getattr(self, column).extend(getattr(other, column))
+
+        return self
+
+
+    def to_candles(self) -> list:
+
+        """ Convert to the API candles list """
+
+        figi, interval = self.figi, self.interval
+
+        return [{'o': o, 'c': c, 'h': h, 'l': l, 'v': v, 'time': from_epoch(time),
+                'interval': interval, 'figi': figi}
+            for time, o, h, l, c, v in zip(*(getattr(self, col) for col, _ in COLUMNS))]
+
+
+    def to_numpy(self) -> dict:
+
+        """ Get numpy views of the columns, no copy, requires numpy
+            Output: dict = {'time': ndarray, 'o': ndarray, ...} """
+
+        import numpy as np
+
+        return {column: np.frombuffer(getattr(self, column), dtype=typecode)
+            for column, typecode in (('time', 'i8'), ('o', 'f8'), ('h', 'f8'),
+                ('l', 'f8'), ('c', 'f8'), ('v', 'i8'))}
+
+
+    @property
+    def close(self):
+        return self.c
+
+
+    @property
+    def volume(self):
+        return self.v
+
+
+def _epoch(time) -> int:
+    return time if isinstance(time, int) else to_epoch(time)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import time
+import shelve
+import hashlib
+import threading
+from market import MSG_ERR
+
+
+MSG_CATALOG = "Catalog. Response: {}"
+MSG_CATALOG_ERR = MSG_ERR + MSG_CATALOG
+TTL = 24 * 60 * 60
+# seconds a stored market is served after a failed refresh
+RETRY_TTL = 60
+
+
+class InstrumentCatalog(object):
+
+    """ All instruments of the markets, fetched once and stored in the db,
+        indexed by ticker, figi and isin
+    Usage:
+        catalog = InstrumentCatalog(client)
+        my_instruments = catalog.get_instruments_by_tickers(TICKERS) """
+
+    def __init__(self, client, db: str = "catalog.db", ttl: int = TTL, markets: tuple = None,
+        retry_ttl: int = RETRY_TTL):
+
+        """ Input:
+                client: Market,
+                db: str, file name for database,
+                ttl: int, seconds, stored market is refreshed when older,
+                markets: tuple, default client.markets,
+                retry_ttl: int, seconds, stored market is refreshed again after a failed refresh """
+
+        self.client = client
+        self.db = db
+        self.ttl = ttl
+        self.retry_ttl = retry_ttl
+        self.markets = markets or client.markets
+        self.instruments = []
+        self.by_ticker, self.by_figi, self.by_isin = {}, {}, {}
+        self.digests = {}
+        self.lock = threading.Lock()
+        self.loaded = 0
+
+
+    def _fetch(self, market: str, stored: dict):
+
+        """ Fetch market, the whole market is always downloaded,
+            its digest only lets load skip re-indexing an unchanged market,
+            a failed fetch serves the stored market for retry_ttl """
+
+        instruments = self.client.get_market(market)
+        if isinstance(instruments, str):
+            if stored:
+                return dict(stored, time=time.time() - self.ttl + min(self.retry_ttl, self.ttl))
+            raise Exception(MSG_CATALOG_ERR.format(instruments))
+
+        digest = hashlib.sha1(repr(instruments).encode()).hexdigest()
+        if stored and stored.get('digest') == digest:
+            return dict(stored, time=time.time())
+
+        return {'instruments': instruments, 'digest': digest, 'time': time.time()}
+
+
+    def load(self, force: bool = False):
+
+        """ Load markets from the db, fetch missing and expired ones,
+            no network requests when the db is fresh
+            Input:
+                force: bool, fetch all markets """
+
+        with self.lock:
+            with shelve.open(self.db) as db:
+                markets = {}
+                for market in self.markets:
+                    stored = db.get(market)
+                    if force or not stored or time.time() - stored['time'] > self.ttl:
+                        stored = self._fetch(market, stored)
+                        db[market] = stored
+                    markets[market] = stored
+
+            digests = {market: markets[market]['digest'] for market in markets}
+            if digests != self.digests:
+                self._index(markets)
+                self.digests = digests
+            self.loaded = min(markets[market]['time'] for market in markets)
+
+        return self
+
+
+    def _index(self, markets: dict):
+        self.instruments = [i for m in self.markets for i in markets[m]['instruments']]
+        self.by_ticker, self.by_figi, self.by_isin = {}, {}, {}
+        for instrument in self.instruments:
+            self.by_ticker.setdefault(instrument.get('ticker'), instrument)
+            self.by_figi.setdefault(instrument.get('figi'), instrument)
+            if instrument.get('isin'):
+                self.by_isin.setdefault(instrument.get('isin'), instrument)
+
+
+    def _fresh(self):
+        if not self.digests or time.time() - self.loaded > self.ttl:
+            self.load()
+
+
+    def get_by_ticker(self, ticker: str) -> dict:
+
+        """ Get copy of the instrument or None """
+
+        self._fresh()
+        return _copy(self.by_ticker.get(ticker))
+
+
+    def get_by_figi(self, figi: str) -> dict:
+
+        """ Get copy of the instrument or None """
+
+        self._fresh()
+        return _copy(self.by_figi.get(figi))
+
+
+    def get_by_isin(self, isin: str) -> dict:
+
+        """ Get copy of the instrument or None """
+
+        self._fresh()
+        return _copy(self.by_isin.get(isin))
+
+
+    def get_instruments_by_tickers(self, tickers: tuple) -> list:
+
+        """ Get my instruments, see Market.get_instruments_by_tickers,
+            unknown tickers are skipped, instruments are copies
+            Input:
+                tickers: tuple = ("T", "F", "AAL")
+            Output:
+                my_instruments: list """
+
+        self._fresh()
+        return [dict(self.by_ticker[t]) for t in tickers if t in self.by_ticker]
+
+
+def _copy(instrument: dict) -> dict:
+
+    """ Shallow copy, callers add keys such as 'candles' to instruments,
+        the index must not change """
+
+    return dict(instrument) if instrument is not None else None
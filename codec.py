@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import re
+import json
+import codecs
+
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+MSG_ERR = "Error! "
+MSG_CODEC = "Codec. {} is not installed: pip install {}"
+MSG_CODEC_ERR = MSG_ERR + MSG_CODEC
+MSG_STREAM = "Codec. Response ended before the end of '{}' list"
+MSG_STREAM_ERR = MSG_ERR + MSG_STREAM
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+class JsonCodec(object):
+
+    """ Standard library json """
+
+    name = "json"
+
+
+    def loads(self, data: bytes):
+
+        """ Decode response body, bytes without str copy """
+
+        return json.loads(data)
+
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj).encode()
+
+
+    def decode(self, data: bytes, model, key: str = None) -> list:
+
+        """ Decode payload list straight into structs
+            Input:
+                data: bytes, response body,
+                model: models.Instrument, Candle, Operation, Order or Position,
+                key: str, payload key of the list, e.g. 'candles', None if payload is the list
+            Output:
+                list of structs """
+
+        from models import convert
+
+        payload = self.loads(data).get('payload')
+        return convert(payload[key] if key else payload, model)
+
+
+class OrjsonCodec(JsonCodec):
+
+    """ orjson, pip install orjson """
+
+    name = "orjson"
+
+
+    def loads(self, data: bytes):
+        return orjson.loads(data)
+
+
+    def dumps(self, obj) -> bytes:
+        return orjson.dumps(obj)
+
+
+class MsgspecCodec(JsonCodec):
+
+    """ msgspec, pip install msgspec, decodes typed payloads without dicts """
+
+    name = "msgspec"
+
+
+    def __init__(self):
+        self.decoder = msgspec.json.Decoder()
+        self.encoder = msgspec.json.Encoder()
+        self.typed = {}
+
+
+    def loads(self, data: bytes):
+        return self.decoder.decode(data)
+
+
+    def dumps(self, obj) -> bytes:
+        return self.encoder.encode(obj)
+
+
+    def decode(self, data: bytes, model, key: str = None) -> list:
+        decoder = self.typed.get((model, key))
+        if decoder is None:
+            payload = list[model]
+            if key:
+                payload = msgspec.defstruct("Payload", [(key, payload)])
+            envelope = msgspec.defstruct("Envelope", [("payload", payload)])
+            decoder = self.typed[(model, key)] = msgspec.json.Decoder(envelope)
+
+        payload = decoder.decode(data).payload
+        return getattr(payload, key) if key else payload
+
+
+CODECS = {"msgspec": MsgspecCodec, "orjson": OrjsonCodec, "json": JsonCodec}
+INSTALLED = {"msgspec": msgspec is not None, "orjson": orjson is not None, "json": True}
+
+
+def get_codec(name: str = None) -> JsonCodec:
+
+    """ Get codec by name or the fastest installed one: orjson, msgspec, json
+        Input:
+            name: str, 'orjson', 'msgspec', 'json', optional """
+
+    if name:
+        if not INSTALLED.get(name):
+            raise Exception(MSG_CODEC_ERR.format(name, name))
+        return CODECS[name]()
+
+    for name in ("orjson", "msgspec", "json"):
+        if INSTALLED[name]:
+            return CODECS[name]()
+
+
+def iter_array(chunks, key: str):
+
+    """ Parse the list `key` of a JSON response incrementally,
+        only the unparsed tail of the body is kept in memory
+        Input:
+            chunks: iterable of bytes, e.g. Transport.iter_bytes(response),
+            key: str, name of the list, e.g. 'instruments', 'payload' for a payload list
+        Output:
+            generator of list items """
+
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    start = re.compile(r'"{}"\s*:\s*\['.format(re.escape(key)))
+    buffer, pos = "", None
+
+    for chunk in chunks:
+        buffer += text.decode(chunk)
+        if pos is None:
+            match = start.search(buffer)
+            if match is None:
+                continue
+            pos = match.end()
+
+        while True:
+            pos = SEPARATORS.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                break  # incomplete item, wait for the next chunk
+            if end == len(buffer) and not isinstance(item, (dict, list, str)):
+                break  # number or literal may continue in the next chunk
+            yield item
+            pos = end
+
+        buffer, pos = buffer[pos:], 0
+
+    raise ValueError(MSG_STREAM_ERR.format(key))
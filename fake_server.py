@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+fake_server.py
+Local stand-in for the Tinkoff OpenAPI with configurable latency,
+error injection and 429 rate limiting, used by bench.py
+Usage:
+    ./fake_server.py [port]
+"""
+
+
+import sys
+import json
+import math
+import time
+import random
+import threading
+import multiprocessing
+from collections import deque
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ratelimit import RATE_LIMITS, endpoint_group
+
+
+HOST = "127.0.0.1"
+PORT = 8088
+ACCOUNT_ID = "SB0000001"
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+STOCKS = [{
+    "figi": "BBG000HLJ7M4",
+    "ticker": "IDCC",
+    "isin": "US45867G1013",
+    "minPriceIncrement": 0.01,
+    "lot": 1,
+    "currency": "USD",
+    "name": "InterDigItal Inc",
+    "type": "Stock"}]
+ETFS = [{
+    "figi": "BBG00QPYJ5H0",
+    "ticker": "TGLD",
+    "isin": "RU000A101X50",
+    "minPriceIncrement": 0.01,
+    "lot": 100,
+    "currency": "USD",
+    "name": "Tinkoff Gold",
+    "type": "Etf"}]
+CURRENCIES = [{
+    "figi": "BBG0013HGFT4",
+    "ticker": "USD000UTSTOM",
+    "minPriceIncrement": 0.0025,
+    "lot": 1000,
+    "currency": "RUB",
+    "name": "USD",
+    "type": "Currency"}]
+INTERVALS = {
+    "1min": 60, "2min": 120, "3min": 180, "5min": 300, "10min": 600, "15min": 900,
+    "30min": 1800, "hour": 3600, "day": 86400, "week": 604800, "month": 2592000}
+
+
+def _ok(payload):
+    return 200, {"trackingId": "fake", "payload": payload, "status": "Ok"}
+
+
+def _error(code, message, error="Error"):
+    return code, {"trackingId": "fake", "status": "Error",
+        "payload": {"message": message, "code": error}}
+
+
+def _time(query, key):
+    return datetime.fromisoformat(query[key][0].replace("Z", "+00:00")).timestamp()
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime(TIME_FORMAT)
+
+
+def _price(figi, t):
+    seed = sum(map(ord, figi))
+    return round(50 + seed % 50 + 10 * math.sin(t / 86400 + seed), 2)
+
+
+def make_stocks(n: int) -> list:
+
+    """ Generate market of n stocks, the first one is STOCKS[0] """
+
+    stocks = STOCKS[:n]
+    for i in range(len(stocks), n):
+        stocks.append({
+            "figi": "FAKE{:08d}".format(i),
+            "ticker": "T{}".format(i),
+            "isin": "XX{:010d}".format(i),
+            "minPriceIncrement": 0.01,
+            "lot": (1, 10, 100)[i % 3],
+            "currency": ("USD", "RUB", "EUR")[i % 3],
+            "name": "Fake stock {}".format(i),
+            "type": "Stock"})
+    return stocks
+
+
+class FakeServer(ThreadingHTTPServer):
+
+    """ Stand-in server keeping orders, positions and operations in memory """
+
+    daemon_threads = True
+    # parallel clients open a pool of connections at once,
+    # the default backlog of 5 makes the rest wait for SYN retransmits
+    request_queue_size = 128
+
+
+    def __init__(self,
+        address: tuple = (HOST, PORT),
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        rate_limits: dict = None,
+        stocks: int = 1,
+        seed: int = 0):
+
+        """ Input:
+                address: tuple, (host, port), port 0 for any free port,
+                latency: float, seconds added to every response,
+                jitter: float, seconds, random extra latency up to jitter,
+                error_rate: float, 0..1, share of requests answered with 500,
+                rate_limits: dict, {group: requests per minute}, answered with 429 and Retry-After,
+                stocks: int, number of stocks in the market,
+                seed: int, random seed for jitter and errors """
+
+        super().__init__(address, Handler)
+        self.api_url = "http://{}:{}/openapi".format(*self.server_address)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limits = rate_limits
+        self.stocks = make_stocks(stocks)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.windows = {}
+        self.requests = {}
+        self.orders = {}
+        self.positions = {}
+        self.operations = []
+        self.balance = {"USD": 100000., "RUB": 1000000., "EUR": 100000.}
+        self.order_id = 0
+        self.routes = {
+            "/sandbox/register": lambda q, b: _ok(
+                {"brokerAccountType": "Tinkoff", "brokerAccountId": ACCOUNT_ID}),
+            "/user/accounts": lambda q, b: _ok({"accounts": [
+                {"brokerAccountType": "Tinkoff", "brokerAccountId": ACCOUNT_ID}]}),
+            "/market/stocks": lambda q, b: self._market(self.stocks),
+            "/market/etfs": lambda q, b: self._market(ETFS),
+            "/market/bonds": lambda q, b: self._market([]),
+            "/market/currencies": lambda q, b: self._market(CURRENCIES),
+            "/market/candles": self._candles,
+            "/market/orderbook": self._orderbook,
+            "/operations": self._operations,
+            "/portfolio": self._portfolio,
+            "/portfolio/currencies": self._currencies,
+            "/orders": self._orders,
+            "/orders/limit-order": self._limit_order,
+            "/orders/market-order": self._market_order,
+            "/orders/cancel": self._cancel,
+        }
+
+
+    def _instrument(self, figi):
+        for instrument in self.stocks + ETFS + CURRENCIES:
+            if instrument["figi"] == figi:
+                return instrument
+        return {"figi": figi, "ticker": figi, "currency": "USD", "lot": 1, "type": "Stock"}
+
+
+    def _limited(self, path):
+
+        """ Output: retry after seconds or None """
+
+        if not self.rate_limits:
+            return None
+        group = endpoint_group(path)
+        limit = self.rate_limits.get(group)
+        if not limit:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.setdefault(group, deque())
+            while window and now - window[0] >= 60:
+                window.popleft()
+            if len(window) >= limit:
+                return max(1, math.ceil(60 - (now - window[0])))
+            window.append(now)
+        return None
+
+
+    def respond(self, method: str, path: str, query: dict, body: dict):
+
+        """ Route request
+            Output: code, res: dict, headers: dict """
+
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            error = self.error_rate and self.random.random() < self.error_rate
+            delay = self.latency + (self.random.random() * self.jitter if self.jitter else 0)
+
+        retry_after = self._limited(path)
+        if retry_after:
+            code, res = _error(429, "Too many requests", "RateLimit")
+            return code, res, {"Retry-After": str(retry_after)}
+
+        if delay:
+            time.sleep(delay)
+
+        headers = {"x-edge-processing-time": str(int(delay * 1000))}
+        if error:
+            code, res = _error(500, "Injected error")
+            return code, res, headers
+
+        route = self.routes.get(path)
+        if not route:
+            code, res = _error(404, "Not found: " + path, "NotFound")
+            return code, res, headers
+
+        code, res = route(query, body)
+        return code, res, headers
+
+
+    def _market(self, instruments):
+        return _ok({"total": len(instruments), "instruments": instruments})
+
+
+    def _candles(self, query, body):
+        figi = query.get("figi", [""])[0]
+        interval = query.get("interval", ["day"])[0]
+        step = INTERVALS.get(interval)
+        if not step or "from" not in query or "to" not in query:
+            return _error(400, "Bad candles request", "ValidationError")
+        start = (int(_time(query, "from")) // step + 1) * step
+        candles = []
+        for t in range(start, int(_time(query, "to")) + 1, step):
+            o, c = _price(figi, t), _price(figi, t + step)
+            candles.append({
+                "o": o, "c": c, "h": max(o, c) + 0.1, "l": min(o, c) - 0.1,
+                "v": 1000 + t // step % 1000,
+                "time": datetime.fromtimestamp(t, timezone.utc).strftime(TIME_FORMAT),
+                "interval": interval, "figi": figi})
+        return _ok({"figi": figi, "interval": interval, "candles": candles})
+
+
+    def _orderbook(self, query, body):
+        figi = query.get("figi", [""])[0]
+        depth = int(query.get("depth", ["20"])[0])
+        if not 1 <= depth <= 20:
+            return _error(400, "Depth should be 1..20", "ValidationError")
+        price = _price(figi, time.time())
+        step = self._instrument(figi).get("minPriceIncrement", 0.01)
+
+        def quantity(level):
+            # most levels keep quantity between polls
+            return 1 + self.random.randrange(100) if self.random.random() < 0.3 else 10 + level
+
+        return _ok({"figi": figi, "depth": depth, "tradeStatus": "NormalTrading",
+            "minPriceIncrement": step, "lastPrice": price, "closePrice": price,
+            "bids": [{"price": round(price - step * (i + 1), 4), "quantity": quantity(i)}
+                for i in range(depth)],
+            "asks": [{"price": round(price + step * (i + 1), 4), "quantity": quantity(i)}
+                for i in range(depth)]})
+
+
+    def _operations(self, query, body):
+        figi = query.get("figi", [None])[0]
+        _from = query.get("from", [""])[0][:19]
+        to = query.get("to", ["9"])[0][:19]
+        with self.lock:
+            operations = [op for op in self.operations
+                if (not figi or op["figi"] == figi) and _from <= op["date"][:19] <= to]
+        return _ok({"operations": operations})
+
+
+    def _portfolio(self, query, body):
+        with self.lock:
+            return _ok({"positions": [dict(p) for p in self.positions.values() if p["lots"]]})
+
+
+    def _currencies(self, query, body):
+        with self.lock:
+            return _ok({"currencies": [
+                {"currency": c, "balance": round(b, 2)} for c, b in self.balance.items()]})
+
+
+    def _orders(self, query, body):
+        with self.lock:
+            return _ok([dict(o) for o in self.orders.values()])
+
+
+    def _place(self, query, body, order_type):
+        figi = query.get("figi", [""])[0]
+        op, lots = body.get("operation"), body.get("lots")
+        if op not in ("Buy", "Sell") or not isinstance(lots, int) or lots < 1:
+            return _error(500, "Invalid order", "OrderError")
+        instrument = self._instrument(figi)
+        with self.lock:
+            self.order_id += 1
+            order_id = "fake-{}".format(self.order_id)
+            order = {"orderId": order_id, "figi": figi, "operation": op, "status": "New",
+                "requestedLots": lots, "executedLots": 0, "type": order_type,
+                "price": body.get("price") or _price(figi, time.time())}
+            if order_type == "Market":
+                self._fill(instrument, order)
+            else:
+                self.orders[order_id] = order
+        return _ok({"orderId": order_id, "operation": op, "status": order["status"],
+            "requestedLots": lots, "executedLots": order["executedLots"]})
+
+
+    def _fill(self, instrument, order):
+        figi, lots = order["figi"], order["requestedLots"]
+        sign = 1 if order["operation"] == "Buy" else -1
+        quantity = lots * instrument.get("lot", 1)
+        payment = -sign * quantity * order["price"]
+        position = self.positions.setdefault(figi, {"figi": figi,
+            "ticker": instrument.get("ticker"), "instrumentType": instrument.get("type"),
+            "balance": 0, "lots": 0, "averagePositionPrice": {
+                "currency": instrument.get("currency"), "value": order["price"]}})
+        position["lots"] += sign * lots
+        position["balance"] += sign * quantity
+        currency = instrument.get("currency", "USD")
+        self.balance[currency] = self.balance.get(currency, 0) + payment
+        order.update({"status": "Fill", "executedLots": lots})
+        self.operations.append({"id": order["orderId"], "status": "Done",
+            "figi": figi, "operationType": order["operation"], "payment": payment,
+            "price": order["price"], "quantity": quantity, "currency": currency,
+            "instrumentType": instrument.get("type"), "date": _now(),
+            "isMarginCall": False})
+
+
+    def _limit_order(self, query, body):
+        return self._place(query, body, "Limit")
+
+
+    def _market_order(self, query, body):
+        return self._place(query, body, "Market")
+
+
+    def _cancel(self, query, body):
+        order_id = query.get("orderId", [""])[0]
+        with self.lock:
+            if self.orders.pop(order_id, None) is None:
+                return _error(500, "Order not found: " + order_id, "OrderCancelError")
+        return _ok({})
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    """ Keep-alive handler, routes requests to the FakeServer """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+
+    def _reply(self):
+        url = urlparse(self.path)
+        path = url.path.replace("/openapi", "", 1).replace("/sandbox", "", 1)
+        if path.startswith("/register"):
+            path = "/sandbox" + path
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+        code, res, headers = self.server.respond(self.command, path, parse_qs(url.query), body)
+
+        data = json.dumps(res).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = _reply
+    do_POST = _reply
+
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(host: str = HOST, port: int = PORT, **kwargs) -> FakeServer:
+
+    """ Start stand-in server in a background thread
+        Input:
+            host: str,
+            port: int, 0 for any free port,
+            kwargs: see FakeServer
+        Output:
+            server, server.api_url is the base url for the client """
+
+    server = FakeServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _serve_process(conn, host, port, kwargs):
+    server = FakeServer((host, port), **kwargs)
+    conn.send(server.api_url)
+    server.serve_forever()
+
+
+def serve_process(host: str = HOST, port: int = 0, **kwargs):
+
+    """ Start stand-in server in a child process,
+        so the server does not share the GIL with the measured client
+        Output:
+            process, api_url: str """
+
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=_serve_process, args=(child, host, port, kwargs), daemon=True)
+    process.start()
+    return process, parent.recv()
+
+
+if __name__=="__main__":
+    port = int(sys.argv[1]) if len(sys.argv) == 2 else PORT
+    server = FakeServer((HOST, port), rate_limits=RATE_LIMITS)
+    print("Serving on", server.api_url)
+    server.serve_forever()
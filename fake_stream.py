@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+fake_stream.py
+Local stand-in for the streaming market data WebSocket,
+replays recorded events for the subscribed instruments
+Usage:
+    ./fake_stream.py events.jsonl [port]
+"""
+
+
+import sys
+import json
+import asyncio
+from aiohttp import web
+
+
+HOST = "127.0.0.1"
+PORT = 8089
+EVENTS = [
+    {"event": "candle", "time": "2021-03-18T04:00:01Z", "payload": {
+        "o": 68.93, "c": 67.63, "h": 68.93, "l": 66.56, "v": 30932,
+        "time": "2021-03-18T04:00:00Z", "interval": "1min", "figi": "BBG000HLJ7M4"}},
+    {"event": "orderbook", "time": "2021-03-18T04:00:02Z", "payload": {
+        "figi": "BBG000HLJ7M4", "depth": 2,
+        "bids": [[67.6, 10], [67.5, 3]], "asks": [[67.7, 5], [67.8, 1]]}},
+    {"event": "instrument_info", "time": "2021-03-18T04:00:03Z", "payload": {
+        "figi": "BBG000HLJ7M4", "trade_status": "normal_trading",
+        "min_price_increment": 0.01, "lot": 1}},
+]
+
+
+def _matches(event: dict, subscription: dict) -> bool:
+    payload = event.get("payload", {})
+    if subscription.get("figi") != payload.get("figi"):
+        return False
+    if subscription["event"].split(":")[0] != event.get("event"):
+        return False
+    return subscription.get("interval") in (None, payload.get("interval"))
+
+
+class StreamServer(object):
+
+    """ WebSocket stand-in, on every subscribe replays the matching events
+        Input:
+            events: list, recorded events,
+            delay: float, seconds between events,
+            disconnect_after: int, drop connection after N events sent, for reconnect tests """
+
+    def __init__(self, events: list = None, delay: float = 0, disconnect_after: int = None):
+
+        self.events = events if events is not None else EVENTS
+        self.delay = delay
+        self.disconnect_after = disconnect_after
+        self.connections = 0
+        self.received = []
+        self.runner = None
+        self.url = None
+
+
+    async def _handler(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        sent = 0
+
+        async for message in ws:
+            subscription = json.loads(message.data)
+            self.received.append(subscription)
+            if not subscription.get("event", "").endswith(":subscribe"):
+                continue
+            for event in self.events:
+                if not _matches(event, subscription):
+                    continue
+                await ws.send_str(json.dumps(event))
+                sent += 1
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                if self.disconnect_after and sent >= self.disconnect_after:
+                    self.disconnect_after = None
+                    await ws.close()
+                    return ws
+
+        return ws
+
+
+    async def start(self, host: str = HOST, port: int = 0):
+
+        """ Start server in the running loop
+            Output: url: str, ws url for MarketStream """
+
+        app = web.Application()
+        app.router.add_get("/ws", self._handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = "ws://{}:{}/ws".format(host, port)
+        return self.url
+
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def _main(events, port):
+    server = StreamServer(events)
+    print("Serving on", await server.start(port=port))
+    await asyncio.Event().wait()
+
+
+if __name__=="__main__":
+    events = [json.loads(line) for line in open(sys.argv[1])] if len(sys.argv) > 1 else None
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT
+    asyncio.run(_main(events, port))
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import numpy as np
+from candles import CandleSeries
+
+
+DAY = 86400
+
+
+def matrix(series: list) -> dict:
+
+    """ Align candles of many instruments on one time axis
+        Input:
+            series: list of CandleSeries or instruments with 'candles', see Market.get_candles
+        Output:
+            dict = {
+                'figi': list of str, rows,
+                'time': ndarray (time,), epoch seconds, union of all candle times,
+                'o', 'h', 'l', 'c': ndarray (instrument, time) of float,
+                'v': ndarray (instrument, time) of float,
+                'errors': dict of figi: str, instruments whose candles are an error}
+            a missing candle repeats the previous close with zero volume,
+            before the first candle of an instrument values are NaN,
+            instruments with errors have no row """
+
+    errors, rows = {}, []
+    for s in series:
+        if isinstance(s, CandleSeries):
+            rows.append(s)
+        elif isinstance(s.get('candles'), str):
+            errors[s.get('figi')] = s['candles']
+        else:
+            rows.append(CandleSeries.from_candles(s.get('candles') or [], s.get('figi')))
+    series = rows
+    columns = [s.to_numpy() for s in series]
+    time = np.unique(np.concatenate([c['time'] for c in columns] or [np.empty(0, 'i8')]))
+
+    shape = (len(series), len(time))
+    result = {'figi': [s.figi for s in series], 'time': time, 'errors': errors}
+    for column in ('o', 'h', 'l', 'c', 'v'):
+        result[column] = np.full(shape, np.nan)
+
+    for row, c in enumerate(columns):
+        index = np.searchsorted(time, c['time'])
+        for column in ('o', 'h', 'l', 'c', 'v'):
+            result[column][row, index] = c[column]
+
+    # forward fill missing candles with the previous close
+    missing = np.isnan(result['c'])
+    last = np.where(missing, 0, np.arange(shape[1]))
+    np.maximum.accumulate(last, axis=1, out=last)
+    close = np.take_along_axis(result['c'], last, axis=1)
+    for column in ('o', 'h', 'l', 'c'):
+        result[column] = np.where(missing, close, result[column])
+    result['v'] = np.where(missing & ~np.isnan(close), 0., result['v'])
+
+    return result
+
+
+def sma(x: np.ndarray, n: int) -> np.ndarray:
+
+    """ Simple moving average along time
+        Input:
+            x: ndarray (instrument, time),
+            n: int, window
+        Output:
+            ndarray (instrument, time), NaN until n values """
+
+    valid = ~np.isnan(x)
+    total = np.cumsum(np.where(valid, x, 0.), axis=1)
+    count = np.cumsum(valid, axis=1)
+    total[:, n:] = total[:, n:] - total[:, :-n]
+    count[:, n:] = count[:, n:] - count[:, :-n]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count == n, total / n, np.nan)
+
+
+def _smooth(x: np.ndarray, alpha: float) -> np.ndarray:
+
+    """ Exponential smoothing along time, starts at the first value,
+        one vectorized step per time over all instruments """
+
+    # time major copy, each step reads and writes one contiguous row
+    columns = np.ascontiguousarray(x.T)
+    result = np.empty_like(columns)
+    value = np.full(x.shape[0], np.nan)
+    for t, current in enumerate(columns):
+        value = np.where(np.isnan(value), current,
+            np.where(np.isnan(current), value, value + alpha * (current - value)))
+        result[t] = value
+
+    return result.T
+
+
+def ema(x: np.ndarray, n: int) -> np.ndarray:
+
+    """ Exponential moving average, alpha = 2 / (n + 1), starts at the first value
+        Input: x: ndarray (instrument, time), n: int
+        Output: ndarray (instrument, time) """
+
+    return _smooth(x, 2. / (n + 1))
+
+
+def _diff(x: np.ndarray) -> np.ndarray:
+    result = np.full_like(x, np.nan)
+    result[:, 1:] = x[:, 1:] - x[:, :-1]
+    return result
+
+
+def rsi(close: np.ndarray, n: int = 14) -> np.ndarray:
+
+    """ Relative strength index with Wilder smoothing, alpha = 1 / n
+        Input: close: ndarray (instrument, time), n: int
+        Output: ndarray (instrument, time), 0..100 """
+
+    change = _diff(close)
+    gain = _smooth(np.where(change > 0, change, np.where(np.isnan(change), np.nan, 0.)), 1. / n)
+    loss = _smooth(np.where(change < 0, -change, np.where(np.isnan(change), np.nan, 0.)), 1. / n)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(loss == 0, np.where(gain > 0, 100., 50.), 100. - 100. / (1. + gain / loss))
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    previous = np.full_like(close, np.nan)
+    previous[:, 1:] = close[:, :-1]
+    previous = np.where(np.isnan(previous), close, previous)
+
+    return np.maximum(high - low, np.maximum(np.abs(high - previous), np.abs(low - previous)))
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int = 14) -> np.ndarray:
+
+    """ Average true range with Wilder smoothing, alpha = 1 / n
+        Input: high, low, close: ndarray (instrument, time), n: int
+        Output: ndarray (instrument, time) """
+
+    return _smooth(true_range(high, low, close), 1. / n)
+
+
+def vwap(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray,
+    time: np.ndarray = None) -> np.ndarray:
+
+    """ Volume weighted average of the typical price (h + l + c) / 3
+        Input:
+            high, low, close, volume: ndarray (instrument, time),
+            time: ndarray (time,), epoch seconds, optional, restart every utc day
+        Output: ndarray (instrument, time) """
+
+    price = (high + low + close) / 3
+    traded = np.cumsum(np.nan_to_num(price * volume), axis=1)
+    total = np.cumsum(np.nan_to_num(volume), axis=1)
+
+    if time is not None and len(time):
+        day = time // DAY
+        start = np.flatnonzero(np.concatenate(([True], day[1:] != day[:-1])))
+        first = np.repeat(start, np.diff(np.append(start, len(time))))
+        before = first - 1
+        has_before = before >= 0
+        traded[:, has_before] -= traded[:, before[has_before]]
+        total[:, has_before] -= total[:, before[has_before]]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, traded / total, price)
+
+
+class SMA(object):
+
+    """ Incremental simple moving average of many instruments,
+        O(1) per new candle, same values as sma() """
+
+    def __init__(self, n: int, size: int):
+
+        """ Input: n: int, window, size: int, number of instruments """
+
+        self.n = n
+        self.window = np.full((size, n), np.nan)
+        self.total = np.zeros(size)
+        self.count = np.zeros(size, dtype=int)
+        self.position = 0
+
+
+    def update(self, x: np.ndarray) -> np.ndarray:
+
+        """ Input: x: ndarray (instrument,), the new values
+            Output: ndarray (instrument,), the current averages """
+
+        old = self.window[:, self.position]
+        valid, old_valid = ~np.isnan(x), ~np.isnan(old)
+        self.total += np.where(valid, x, 0.) - np.where(old_valid, old, 0.)
+        self.count += valid.astype(int) - old_valid.astype(int)
+        self.window[:, self.position] = x
+        self.position = (self.position + 1) % self.n
+
+        return np.where(self.count == self.n, self.total / self.n, np.nan)
+
+
+class EMA(object):
+
+    """ Incremental exponential moving average of many instruments, same values as ema() """
+
+    def __init__(self, n: int, size: int, alpha: float = None):
+
+        """ Input: n: int, size: int, number of instruments, alpha: float, optional """
+
+        self.alpha = alpha or 2. / (n + 1)
+        self.value = np.full(size, np.nan)
+
+
+    def update(self, x: np.ndarray) -> np.ndarray:
+        self.value = np.where(np.isnan(self.value), x,
+            np.where(np.isnan(x), self.value, self.value + self.alpha * (x - self.value)))
+        return self.value
+
+
+class RSI(object):
+
+    """ Incremental relative strength index, same values as rsi() """
+
+    def __init__(self, n: int, size: int):
+        self.gain = EMA(n, size, 1. / n)
+        self.loss = EMA(n, size, 1. / n)
+        self.previous = np.full(size, np.nan)
+
+
+    def update(self, close: np.ndarray) -> np.ndarray:
+        change = close - self.previous
+        self.previous = close
+        gain = self.gain.update(
+            np.where(change > 0, change, np.where(np.isnan(change), np.nan, 0.)))
+        loss = self.loss.update(
+            np.where(change < 0, -change, np.where(np.isnan(change), np.nan, 0.)))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(loss == 0, np.where(gain > 0, 100., 50.), 100. - 100. / (1. + gain / loss))
+
+
+class ATR(object):
+
+    """ Incremental average true range, same values as atr() """
+
+    def __init__(self, n: int, size: int):
+        self.range = EMA(n, size, 1. / n)
+        self.previous = np.full(size, np.nan)
+
+
+    def update(self, high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+        previous = np.where(np.isnan(self.previous), close, self.previous)
+        self.previous = close
+
+        return self.range.update(np.maximum(
+            high - low, np.maximum(np.abs(high - previous), np.abs(low - previous))))
+
+
+class VWAP(object):
+
+    """ Incremental volume weighted average price, same values as vwap() """
+
+    def __init__(self, size: int):
+        self.traded = np.zeros(size)
+        self.total = np.zeros(size)
+        self.day = None
+
+
+    def update(self, high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray,
+        time: int = None) -> np.ndarray:
+
+        """ Input: time: int, epoch seconds, optional, restart every utc day """
+
+        if time is not None:
+            if self.day is not None and time // DAY != self.day:
+                self.traded[:] = 0.
+                self.total[:] = 0.
+            self.day = time // DAY
+
+        price = (high + low + close) / 3
+        self.traded += np.nan_to_num(price * volume)
+        self.total += np.nan_to_num(volume)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.total > 0, self.traded / self.total, price)
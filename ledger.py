@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import shelve
+import threading
+from datetime import datetime, timedelta
+from store import to_epoch
+from orders import group_by_figi
+
+
+DEPTH = 365
+# operations may change status after they appear, e.g. Progress -> Done
+OVERLAP = timedelta(days=1)
+
+
+class OperationsLedger(object):
+
+    """ Local copy of the account operations in the db,
+        synced incrementally from the last sync
+    Usage:
+        ledger = OperationsLedger(client)
+        ledger.sync()
+        ledger.get_operations(figi="BBG000HLJ7M4") """
+
+    def __init__(self, client, db: str = "ledger.db", account_id: str = None,
+        depth: int = DEPTH, overlap: timedelta = OVERLAP):
+
+        """ Input:
+                client: Operations,
+                db: str, file name for database,
+                account_id: str, optional, default account of the client,
+                depth: int, days, history of the first sync,
+                overlap: timedelta, re-read before the last sync """
+
+        self.client = client
+        self.db = db
+        self.account_id = account_id
+        self.key = account_id or "default"
+        self.depth = depth
+        self.overlap = overlap
+        self.lock = threading.Lock()
+
+
+    def _load(self):
+        with shelve.open(self.db) as db:
+            return db.get(self.key) or {'operations': {}, 'last': None, 'synced': None}
+
+
+    def sync(self):
+
+        """ Fetch operations since the last sync minus overlap,
+            new and changed operations replace the stored ones by id
+            Output:
+                number of fetched operations or error message string """
+
+        with self.lock:
+            ledger = self._load()
+            to = datetime.utcnow()
+            # ledgers stored before 'synced' resume from the last seen operation
+            synced = ledger.get('synced') or ledger['last']
+            if synced:
+                _from = datetime.utcfromtimestamp(synced) - self.overlap
+            else:
+                _from = to - timedelta(days=self.depth)
+
+            operations = self.client.get_operations(
+                account_id=self.account_id, _from=_from, to=to)
+            if isinstance(operations, str):
+                return operations
+
+            for operation in operations:
+                ledger['operations'][operation['id']] = operation
+                date = to_epoch(operation['date'])
+                if not ledger['last'] or date > ledger['last']:
+                    ledger['last'] = date
+            ledger['synced'] = to_epoch(to)
+
+            with shelve.open(self.db) as db:
+                db[self.key] = ledger
+
+            return len(operations)
+
+
+    def get_operations(self, figi: str = None, _from: datetime = None, to: datetime = None) -> list:
+
+        """ Get stored operations sorted by date, no requests
+            Input:
+                figi: str, optional,
+                _from: datetime, utc, optional,
+                to: datetime, utc, optional
+            Output:
+                list """
+
+        start = to_epoch(_from) if _from else None
+        end = to_epoch(to) if to else None
+        operations = []
+
+        for operation in self._load()['operations'].values():
+            if figi and operation.get('figi') != figi:
+                continue
+            date = to_epoch(operation['date'])
+            if (start and date < start) or (end and date > end):
+                continue
+            operations.append((date, operation))
+
+        return [operation for date, operation in sorted(operations, key=lambda x: x[0])]
+
+
+    def group_by_figi(self, _from: datetime = None, to: datetime = None) -> dict:
+
+        """ Output: dict = {figi: [operations]} """
+
+        return group_by_figi(self.get_operations(_from=_from, to=to))
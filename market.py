@@ -21,10 +21,22 @@
 # SOFTWARE.
 
 
-import json
+import time
 import shelve
-import requests
+import threading
+from transport import Transport
+from ratelimit import RateLimiter, endpoint_group
+from store import CandleStore
+from candles import CandleSeries
+from resample import resample, can_resample, MSG_RESAMPLE_ERR
+from orderbook import OrderBook
 from datetime import datetime, timedelta
+from retry import RetryPolicy, CircuitBreaker
+from metrics import Metrics
+from cache import ResponseCache
+from codec import JsonCodec, get_codec, iter_array
+from models import Instrument, Candle
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 
 
 MSG_ERR = "Error! "
@@ -43,23 +55,104 @@ MSG_POST = 'Send POST: {}'
 STOCKS = 'stocks'
 ETFS = 'etfs'
 BONDS = 'bonds'
+API_URL = "https://api-invest.tinkoff.ru/openapi"
+REGISTER = "/sandbox/register"
+# sandbox account is gone, e.g. sandbox was cleared, register again
+INVALID_ACCOUNT_CODES = ("BrokerAccountNotFound", "AccountNotFound")
+WORKERS = 8
+# credentials read from the db files, {db: {key: value}}
+_credentials = {}
+_credentials_lock = threading.Lock()
+# max history of one candles request for the interval
+CANDLE_WINDOWS = {
+    '1min': timedelta(days=1),
+    '2min': timedelta(days=1),
+    '3min': timedelta(days=1),
+    '5min': timedelta(days=1),
+    '10min': timedelta(days=1),
+    '15min': timedelta(days=1),
+    '30min': timedelta(days=1),
+    'hour': timedelta(days=7),
+    'day': timedelta(days=365),
+    'week': timedelta(days=728),
+    'month': timedelta(days=3650),
+}
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat() + '+00:00'
+
+
+def candle_windows(_from: datetime, to: datetime, interval: str) -> list:
+
+    """ Split utc time range into the maximal windows allowed for the interval
+        Input:
+            _from: datetime, utc,
+            to: datetime, utc,
+            interval: str, see Market.get_candles
+        Output:
+            windows: list = [(from, to)], iso strings """
+
+    step = CANDLE_WINDOWS.get(interval)
+    if not step:
+        return [(_iso(_from), _iso(to))]
+
+    windows = []
+    while _from < to:
+        windows.append((_iso(_from), _iso(min(_from + step, to))))
+        _from += step
+
+    return windows or [(_iso(_from), _iso(to))]
+
+
+def merge_candles(chunks: list) -> list:
+
+    """ Merge candles of consecutive windows into one series,
+        de-duplicate by time and sort
+        Input:
+            chunks: list of candles lists
+        Output:
+            candles: list """
+
+    candles = {}
+    for chunk in chunks:
+        for candle in chunk:
+            candles[candle['time']] = candle
+
+    return [candles[time] for time in sorted(candles)]
 
 
 class Base(object):
 
-    """ https://tinkoffcreditsystems.github.io/invest-openapi/ """
+    """ https://tinkoffcreditsystems.github.io/invest-openapi/
+        Thread safety: one client can be shared by any number of threads,
+        e.g. a ThreadPoolExecutor of 32 workers. Requests keep their state in
+        the call, the connection pool, rate limiter, sandbox registration
+        and credentials are locked, last_response is per thread. """
 
     def __init__(self,
-        db: str = "test.db", token: str = None, account_id: str = None, sandbox: bool = True):
+        db: str = "test.db", token: str = None, account_id: str = None, sandbox: bool = True,
+        api_url: str = None, transport: Transport = None, limiter: RateLimiter = None,
+        retry: RetryPolicy = None, breaker: CircuitBreaker = None, metrics: Metrics = None,
+        cache: ResponseCache = None, codec: JsonCodec = None):
 
-        """ Create new client
+        """ Create new client, no network requests until the first call,
+        sandbox client is registered then, unless its account is cached in the db
         https://tinkoffcreditsystems.github.io/invest-openapi/auth/
         Input:
             token: str, stored in db,
             account_id: str, stored in db,
             db: str, file name for database,
-            sandbox: bool
-        Output: POST response:
+            sandbox: bool,
+            api_url: str, optional, e.g. local stand-in server,
+            transport: Transport, optional, shared connection pool,
+            limiter: RateLimiter, optional, per endpoint group request limits,
+            retry: RetryPolicy, optional, RetryPolicy(retries=0) disables retries,
+            breaker: CircuitBreaker, optional, per endpoint group,
+            metrics: Metrics, optional, per endpoint request metrics,
+            cache: ResponseCache, optional, short TTL cache of GET responses,
+            codec: JsonCodec, optional, default is the fastest installed: orjson, msgspec, json
+        Register POST response:
             res.status:200,
             res.headers: {'Server': 'nginx', 'Date': 'Sat, 20 Mar 2021 19:44:56 GMT',
                 'Content-Type': 'application/json', 'Transfer-Encoding': 'chunked',
@@ -72,52 +165,151 @@ class Base(object):
                 "payload":{"brokerAccountType":"Tinkoff","brokerAccountId":"SB2954177"},
                 "status":"Ok"} """
 
-        # token and account id stored in db
+        # token and account id stored in db, read once per process
         self.db = db
-        self.token = self._add_to_db("token", token)
-        self.account_id = self._add_to_db("account_id", account_id)
+        credentials = self._load_credentials(token, account_id)
+        self.token = credentials.get("token")
+        self.account_id = credentials.get("account_id")
 
         if not self.token:
             raise Exception(MSG_CLIENT_ERR.format(MSG_TOKEN, self.token))
 
-        self.last_response = None
-        self.api_url = "https://api-invest.tinkoff.ru/openapi"
+        self.local = threading.local()
+        self.api_url = api_url or API_URL
+        self.transport = transport or Transport()
+        self._own_transport = transport is None
+        self.limiter = limiter or RateLimiter()
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics
+        self.cache = cache
+        self.codec = codec or get_codec()
+        # hedged GETs: primaries and hedges on their own pools, sized like the
+        # connection pool, so hedging neither caps the callers nor queues hedges
+        hedged = self.retry.hedge_delay and self.transport.pool_maxsize
+        self.primary_pool = ThreadPoolExecutor(max_workers=hedged) if hedged else None
+        self.hedge_pool = ThreadPoolExecutor(max_workers=hedged) if hedged else None
         self.headers = {'content-type': 'application/json'}
         self.headers.update({"Authorization": "Bearer " + self.token})
 
+        # sandbox client is registered lazily, before the first request,
+        # the sandbox account of the token is cached in the db
+        self.sandbox = sandbox
+        self.registered = not sandbox
+        self.cached_account = False
+        self.register_lock = threading.Lock()
         if sandbox:
             self.api_url = self.api_url + "/sandbox"
-            url = self.api_url + "/sandbox/register"
+            cached = credentials.get("sandbox") or {}
+            if cached.get("token") == self.token and cached.get("api_url") == self.api_url:
+                self.account_id = cached.get("account_id")
+                self.registered = self.cached_account = True
+
+
+    def close(self):
+
+        """ Stop the hedge pools and close own connection pool,
+            shared transport is left open """
+
+        for pool in (self.primary_pool, self.hedge_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self.primary_pool = self.hedge_pool = None
+        if self._own_transport:
+            self.transport.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def _load_credentials(self, token: str = None, account_id: str = None) -> dict:
+
+        """ Read token, account id and cached sandbox account in one db open,
+            new values are written in the same open
+        Output: credentials: dict = {'token', 'account_id', 'sandbox'} """
+
+        with _credentials_lock:
+            credentials = _credentials.get(self.db)
+            if credentials is None or (token and token != credentials.get("token")) \
+                or (account_id and account_id != credentials.get("account_id")):
+                with shelve.open(self.db) as db:
+                    if token:
+                        db["token"] = token
+                    if account_id:
+                        db["account_id"] = account_id
+                    credentials = {key: db.get(key) for key in ("token", "account_id", "sandbox")}
+                _credentials[self.db] = credentials
+
+            return dict(credentials)
+
+
+    def _save_sandbox(self, account_id: str = None):
+
+        """ Cache sandbox account of the token, None forgets it """
+
+        sandbox = {"token": self.token, "api_url": self.api_url, "account_id": account_id}
+        with _credentials_lock:
+            with shelve.open(self.db) as db:
+                if account_id:
+                    db["sandbox"] = sandbox
+                else:
+                    db.pop("sandbox", None)
+            _credentials.pop(self.db, None)
+
+
+    def register(self):
+
+        """ Register sandbox client, called before the first request
+            if there is no cached sandbox account
+            Output: None or error message string """
+
+        with self.register_lock:
+            if self.registered:
+                return None
+
+            url = self.api_url + REGISTER
             payload = { "brokerAccountType": "Tinkoff" }
 
             # new clients
             res = self._send_request(url, params=None, payload=payload)
 
-            if isinstance(res, dict):
-                self.account_id = res.get('payload').get('brokerAccountId')
-            else:
-                raise Exception(MSG_CLIENT_ERR.format(MSG_ACCOUNT_ID, self.account_id))
+            if not isinstance(res, dict):
+                return MSG_CLIENT_ERR.format(MSG_ACCOUNT_ID.format(res))
 
+            self.account_id = res.get('payload').get('brokerAccountId')
+            self._save_sandbox(self.account_id)
+            self.registered = True
             print(MSG_CLIENT.format(MSG_SANDBOX))
-
-        print(MSG_CLIENT.format(MSG_ACCOUNT_ID.format(self.account_id)))
+            print(MSG_CLIENT.format(MSG_ACCOUNT_ID.format(self.account_id)))
 
 
     def _send_request(self,
         url: str,
         params: dict = None,
         payload: dict = None,
-        timeout: int = 11):
+        timeout: int = None,
+        model = None,
+        key: str = None):
 
-        """ Send POST request
+        """ Send GET request or POST request with payload,
+            failed requests are retried by the retry policy,
+            open circuit of the endpoint group fails fast
             Input:
                 url: str,
                 params: dict,
                 payload: dict,
-                timeout: int, seconds, optional,
+                timeout: int, read timeout seconds, optional,
+                model: models.Instrument, Operation, Order or Position, optional,
+                    the payload list is decoded straight into structs, see JsonCodec.decode,
+                key: str, payload key of the list, None if payload is the list
             Output:
-                status: int,
-                res: list/dict/str, expected type dict, str with an error message
+                res: list/dict/str, expected type dict, list of model with model,
+                    str with an error message
             dir request response:
                 ['apparent_encoding', 'close', 'connection', 'content', 'cookies',
                 'elapsed', 'encoding', 'headers', 'history', 'is_permanent_redirect',
@@ -125,24 +317,254 @@ class Base(object):
                 'next', 'ok', 'raise_for_status', 'raw', 'reason', 'request',
                 'status_code', 'text', 'url'] """
 
-        code, res, msg = None, None, None
+        if not self.registered and not url.endswith(REGISTER):
+            error = self.register()
+            if error:
+                return error
+
+        if self.cache is not None:
+            endpoint = self._endpoint(url)
+            if not payload:
+                return self.cache.fetch(
+                    endpoint, params, lambda: self._send(url, params, payload, timeout, model, key),
+                    model)
+            res = self._send(url, params, payload, timeout)
+            self.cache.changed(endpoint)
+            return res
+
+        return self._send(url, params, payload, timeout, model, key)
+
+
+    def _send(self, url: str, params: dict, payload: dict, timeout: int, model=None, key: str = None):
+
+        """ Send request with retries, see _send_request """
+
+        method = "POST" if payload else "GET"
+        data = self.codec.dumps(payload) if payload else None  # to json bytes
+
+        if method == "GET" and self.hedge_pool is not None:
+            attempt = lambda: self._hedged_request(url, params, timeout, model, key)
+        else:
+            attempt = lambda: self._request(
+                self.transport.request, method, url, params, data, timeout, model, key)
+
+        result = self._attempts(url, method, attempt)
+        if result is None:
+            return self._send(url, params, payload, timeout, model, key)
+
+        return result if isinstance(result, str) else result[1]
+
+
+    def _attempts(self, url: str, method: str, attempt):
+
+        """ Call attempt until it succeeds or the retry policy gives up,
+            open circuit of the endpoint group fails fast,
+            a cached account unknown to the server is registered again
+            Input:
+                url: str,
+                method: str, "GET" or "POST",
+                attempt: callable, one attempt, returns (code, res, response, error)
+            Output:
+                tuple of the successful attempt, str with an error message,
+                None if the account is registered again and the request must be resent """
+
+        group = endpoint_group(url)
+        attempt_number = 0
+
+        # outcome of the last request of the thread, see Orders.place_order
+        self.local.outcome = (None, None)
+
+        while True:
+            error = self.breaker.check(group)
+            if error:
+                return MSG_REQUEST_ERR.format(None, error)
+
+            code, res, response, error = result = attempt()
+            if response is not None:
+                self.local.last_response = response
+            self.local.outcome = (code, error)
+
+            if code == 200:
+                self.breaker.success(group)
+                return result
+            if error is not None or code >= 500:
+                self.breaker.failure(group)
+
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            if not self.retry.should_retry(attempt_number, method, code, error, retry_after):
+                break
+            time.sleep(self.retry.wait(attempt_number, retry_after))
+            attempt_number += 1
+            if self.metrics is not None:
+                self.metrics.retry(self._endpoint(url))
+
+        if error is not None:
+            return MSG_REQUEST_ERR.format(code, error)
+
+        res = res.get('payload') or {}
+        if self.cached_account and res.get('code') in INVALID_ACCOUNT_CODES:
+            # register here, not through _send_request:
+            # a cached GET is sent inside ResponseCache.fetch of its own key
+            self.cached_account = self.registered = False
+            self._save_sandbox(None)
+            return self.register() or None
+
+        return MSG_REQUEST_ERR.format(code, res.get('message'))
+
+
+    def _request(self,
+        send, method: str, url: str, params: dict, data: bytes, timeout: int,
+        model=None, key: str = None) -> tuple:
+
+        """ One attempt
+            Input:
+                send: callable, transport.request or transport.stream,
+                the streamed body is read only on errors, see _iter_request,
+                model, key: the successful body is decoded into structs, see _send_request
+            Output: code: int, res: dict or list of model, response, error: Exception """
+
+        code, res, response, error = None, None, None, None
+        wait, start = 0., time.perf_counter()
+        streamed = send == self.transport.stream
 
         try:
-            if payload:
-                data = json.dumps(payload)  # to json
-                self.last_response = requests.post(url, data=data, headers=self.headers, params=params, timeout=timeout)
+            wait = self.limiter.acquire(url)
+            start = time.perf_counter()
+            response = send(
+                method, url, headers=self.headers, params=params, data=data,
+                timeout=self.retry.timeout(timeout))
+            code = response.status_code
+            if not streamed or code != 200:
+                if streamed:
+                    self.transport.read(response)
+                if model is not None and code == 200:
+                    res = self.codec.decode(response.content, model, key)
+                else:
+                    res = self.codec.loads(response.content)  # from bytes, no str copy
+        except Exception as e:
+            error = e
+        finally:
+            # only a streamed 200 keeps its connection until the body is read
+            if response is not None and not (streamed and code == 200):
+                response.close()
+
+        if self.metrics is not None:
+            if streamed and code == 200:
+                # observed when the body is read
+                self.local.started = (start, wait)
             else:
-                self.last_response = requests.get(url, headers=self.headers, params=params, timeout=timeout)
+                self._observe(method, url, data, code, response, start, wait)
 
-            code, res = self.last_response.status_code, json.loads(self.last_response.text)
-        except Exception as e:
-            return MSG_REQUEST_ERR.format(code, e)
+        return code, res, response, error
+
+
+    def _observe(self,
+        method: str, url: str, data: bytes, code: int, response, start, wait, bytes_in=None):
+        latency = time.perf_counter() - start
+        server = response.headers.get('x-edge-processing-time') if response is not None else None
+        if bytes_in is None:
+            bytes_in = len(response.content) if response is not None else 0
+        self.metrics.observe(
+            self._endpoint(url), method, code, latency,
+            server_latency=int(server) / 1000 if server and server.isdigit() else None,
+            bytes_out=len(data) if data else 0,
+            bytes_in=bytes_in,
+            wait=wait)
+
+
+    def _endpoint(self, url: str) -> str:
+        return url[len(self.api_url):] if url.startswith(self.api_url) else url
+
+
+    def _hedged_request(self, url: str, params: dict, timeout: int, model=None, key: str = None) -> tuple:
+
+        """ Send GET again if there is no response after hedge_delay,
+            the first successful response wins """
 
-        if code != 200:
-            msg = res.get('payload').get('message')
-            return MSG_REQUEST_ERR.format(code, msg)
+        request = self.transport.request
+        first = self.primary_pool.submit(
+            self._request, request, "GET", url, params, None, timeout, model, key)
+        done, _ = wait([first], timeout=self.retry.hedge_delay)
+        if done:
+            return first.result()
 
-        return res
+        second = self.hedge_pool.submit(
+            self._request, request, "GET", url, params, None, timeout, model, key)
+        for future in as_completed([first, second]):
+            result = future.result()
+            if result[0] == 200:
+                return result
+
+        return result
+
+
+    def _iter_request(self, url: str, key: str, params: dict = None, timeout: int = None):
+
+        """ Send GET request and yield items of the payload list as they are parsed,
+            memory does not grow with the response size, the cache is bypassed
+            Input:
+                url: str,
+                key: str, name of the payload list, e.g. 'instruments',
+                params: dict,
+                timeout: int, read timeout seconds, optional
+            Output:
+                generator of dict, raises Exception with the error message """
+
+        response = self._open_stream(url, params, timeout)
+        if isinstance(response, str):
+            raise Exception(response)
+
+        chunks = self.transport.iter_bytes(response)
+        if self.metrics is not None:
+            chunks = self._count_bytes(chunks, url, response)
+
+        try:
+            yield from iter_array(chunks, key)
+        finally:
+            response.close()
+
+
+    def _count_bytes(self, chunks, url: str, response):
+
+        """ Pass chunks of the streamed body through, observe the request
+            with the body size when the body is read or closed """
+
+        start, wait = self.local.started
+        size = 0
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._observe("GET", url, None, 200, response, start, wait, bytes_in=size)
+
+
+    def _open_stream(self, url: str, params: dict, timeout: int):
+
+        """ Send GET request with retries, the body is read only on errors,
+            see _send, a response is never retried after its body is streamed
+            Output:
+                response with status 200 or error message string """
+
+        if not self.registered:
+            error = self.register()
+            if error:
+                return error
+
+        result = self._attempts(url, "GET", lambda: self._request(
+            self.transport.stream, "GET", url, params, None, timeout))
+        if result is None:
+            return self._open_stream(url, params, timeout)
+
+        return result if isinstance(result, str) else result[2]
+
+
+    @property
+    def last_response(self):
+
+        """ Last response of the current thread """
+
+        return getattr(self.local, 'last_response', None)
 
 
     def get_user_accounts(self):
@@ -168,10 +590,12 @@ class Base(object):
             val:new value
         Output: new value or None """
 
-        with shelve.open(self.db) as db:
-            if val:
-                db[key] = val
-            val = db.get(key)
+        with _credentials_lock:
+            with shelve.open(self.db) as db:
+                if val:
+                    db[key] = val
+                val = db.get(key)
+            _credentials.pop(self.db, None)
 
         return val if val else None
 
@@ -188,20 +612,27 @@ class Market(Base):
 
 
     def __init__(self,
-        db: str = "test.db", token: str = None, account_id: str = None, sandbox: bool = True):
+        db: str = "test.db", token: str = None, account_id: str = None, sandbox: bool = True,
+        store: CandleStore = None, **kwargs):
+
+        """ Input:
+                store: CandleStore, optional, candles are fetched only
+                    for the time ranges missing in the store """
 
-        super().__init__(db, token, account_id, sandbox)
+        super().__init__(db, token, account_id, sandbox, **kwargs)
         self.markets = ("stocks", "etfs", "bonds", "currencies")
+        self.store = store
 
 
-    def get_market(self, market: str = None) -> list:
+    def get_market(self, market: str = None, typed: bool = False) -> list:
 
         """ Get all stocks
             Input:
                 market: str,
                     'stocks': Output: list of stocks for all currencies,
                     'etfs': Output: list of etfs for all currencies,
-                    'bonds': Output: list of bonds for all currencies
+                    'bonds': Output: list of bonds for all currencies,
+                typed: bool, list of models.Instrument instead of dicts
             Output:
                 res: list = [{}] """
 
@@ -214,14 +645,36 @@ class Market(Base):
             return MSG_MARKET_ERR.format(
                 MSG_MARKET_LIST.format(market, self.markets))
 
+        if typed:
+            return self._send_request(url, model=Instrument, key='instruments')
+
         res = self._send_request(url)
 
         return res.get('payload').get('instruments') if isinstance(res, dict) else res
 
 
+    def iter_market(self, market: str = None, typed: bool = False):
+
+        """ Yield instruments of the market one at a time while the response is parsed,
+            see get_market
+            Input:
+                market: str, 'stocks', 'etfs', 'bonds' or 'currencies',
+                typed: bool, models.Instrument instead of dicts
+            Output:
+                generator of dict, raises Exception with the error message """
+
+        market = market or self.markets[0]
+        if market not in self.markets:
+            raise Exception(MSG_MARKET_ERR.format(MSG_MARKET_LIST.format(market, self.markets)))
+
+        for instrument in self._iter_request(self.api_url + "/market/" + market, "instruments"):
+            yield Instrument.from_dict(instrument) if typed else instrument
+
+
     def get_instruments_by_tickers(self, tickers: tuple, all_instruments: list) -> list:
 
-        """ Get my instruments from all market instruments, create my_instruments.
+        """ Get my instruments from all market instruments, create my_instruments,
+            see InstrumentCatalog for cached lookups without get_market()
         Input:
             tickers: tuple = ("T", "F", "AAL"),
             all_instruments: list = self.get_market()
@@ -235,25 +688,25 @@ class Market(Base):
                 'ticker': 'IDCC',
                 'type': 'Stock'}] """
 
-        my_instruments = []
+        by_ticker = {}
+        for instrument in all_instruments:
+            by_ticker.setdefault(instrument.get('ticker'), []).append(instrument)
 
-        for ticker in tickers:
-            for instrument in all_instruments:
-                if ticker == instrument.get('ticker'):
-                    my_instruments.append(instrument)
-
-        return my_instruments
+        return [instrument for ticker in tickers for instrument in by_ticker.get(ticker, ())]
 
 
     def get_candles(self,
-        instruments: list, depth: int = 30, interval: str = 'month'):
+        instruments: list, depth: int = 30, interval: str = 'month', workers: int = None):
 
         """ Add candles to list of instruments
             time = 2019-08-19T18:38:33.131642+03:00
         Input:
             instrument: list of my instruments,
             depth: int, days = 1, e.g if interval = weeks then days should be = 7, 30 for month,
-            interval: str, candles interval = 2min, 3min, 5min, 10min, 15min, 30min, hour, day, week, month
+                longer ranges are split into several requests, see CANDLE_WINDOWS,
+            interval: str, candles interval = 1min, 2min, 3min, 5min, 10min, 15min, 30min, hour, day, week, month,
+            workers: int, optional, fetch instruments in parallel, see iter_candles,
+                failed instrument gets instrument['error'] and empty candles list
         Output: instruments: list = [{
                 "figi": "BBG000HLJ7M4",
                 "ticker": "IDCC",
@@ -273,28 +726,231 @@ class Market(Base):
                     'time': datetime.datetime(2021, 3, 18, 4, 0, tzinfo=tzutc()),
                     'v': 30932}"] """
 
-        url = self.api_url + "/market/candles"
-        _from = (datetime.utcnow() - timedelta(days=depth)).isoformat() + '+00:00'
-        to = datetime.utcnow().isoformat() + '+00:00'
-        params = {"from": _from, "to": to, "interval": interval}
+        if workers:
+            for instrument, candles, error in self.iter_candles(
+                instruments, depth, interval, workers):
+                instrument['candles'] = candles or []
+                if error:
+                    instrument['error'] = error
+            return instruments
+
+        to = datetime.utcnow()
+        _from = to - timedelta(days=depth)
 
         for instrument in instruments:
-            params.update({"figi": instrument['figi']})
-            #params.update({"from": _from, "to": to, "interval": interval})
+            instrument['candles'] = self._get_candles(instrument['figi'], _from, to, interval)
+
+        return instruments
+
+
+    def iter_candles(self,
+        instruments: list, depth: int = 30, interval: str = 'month', workers: int = WORKERS):
+
+        """ Get candles for instruments in parallel,
+            yield each instrument as soon as its request completes,
+            requests are limited by the 'market' token bucket
+        Input:
+            instruments: list of my instruments, not modified,
+            depth: int, days,
+            interval: str, see get_candles,
+            workers: int, number of parallel requests
+        Output: generator of (instrument, candles, error):
+            instrument: dict,
+            candles: list or None,
+            error: str with an error message or None """
+
+        to = datetime.utcnow()
+        _from = to - timedelta(days=depth)
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                pool.submit(self._get_candles, instrument['figi'], _from, to, interval):
+                    instrument for instrument in instruments}
+
+            for future in as_completed(futures):
+                res = future.result()
+                if isinstance(res, list):
+                    yield futures[future], res, None
+                else:
+                    yield futures[future], None, res
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+    def iter_instrument_candles(self,
+        figi: str,
+        depth: int = 30,
+        interval: str = 'month',
+        _from: datetime = None,
+        to: datetime = None,
+        typed: bool = False):
+
+        """ Yield candles of one instrument in time order, the range is split
+            into windows like get_candles, windows are requested one by one and
+            each response is parsed incrementally, memory does not grow with the range
+            Input:
+                figi: str,
+                depth: int, days,
+                interval: str, see get_candles,
+                _from: datetime, utc, optional, instead of depth,
+                to: datetime, utc, optional, default now,
+                typed: bool, models.Candle instead of dicts
+            Output:
+                generator of dict, raises Exception with the error message """
+
+        url = self.api_url + "/market/candles"
+        to = to or datetime.utcnow()
+        _from = _from or to - timedelta(days=depth)
+        last = None
+
+        for start, end in candle_windows(_from, to, interval):
+            params = {"from": start, "to": end, "interval": interval, "figi": figi}
+            for candle in self._iter_request(url, "candles", params=params):
+                # windows share their bounds
+                if last is not None and candle['time'] <= last:
+                    continue
+                last = candle['time']
+                yield Candle.from_dict(candle) if typed else candle
+
+
+    def _get_candles(self, figi: str, _from: datetime, to: datetime, interval: str):
+
+        """ Get candles of one instrument for any time range,
+            with the store only missing ranges are requested and appended
+        Input:
+            figi: str,
+            _from: datetime, utc,
+            to: datetime, utc,
+            interval: str
+        Output:
+            candles: list or error message string """
+
+        if self.store is None:
+            return self._fetch_candles(figi, _from, to, interval)
+
+        error = self._sync_store(figi, _from, to, interval)
+
+        return error or self.store.candles(figi, interval, _from, to)
+
+
+    def _sync_store(self, figi: str, _from: datetime, to: datetime, interval: str):
+
+        """ Fetch time ranges missing in the store
+            Output: None or error message string """
+
+        for start, end in self.store.missing(figi, interval, _from, to):
+            candles = self._fetch_candles(figi, start, end, interval)
+            if isinstance(candles, str):
+                return candles
+            self.store.append(figi, interval, candles, start, end)
+
+
+    def get_series(self,
+        figi: str, depth: int = 30, interval: str = 'month',
+        source: str = None, session: tuple = None):
+
+        """ Get candles of one instrument as a compact CandleSeries,
+            with the store the columns are zero-copy slices of the store files
+        Input:
+            figi: str,
+            depth: int, days,
+            interval: str, see get_candles,
+            source: str, optional, finer interval to fetch, e.g. '1min',
+                candles of the interval are resampled locally, see resample,
+                one stored source series serves every coarser interval,
+            session: tuple = ('07:00', '15:40'), utc, optional, with source only
+        Output:
+            CandleSeries or error message string """
+
+        if source and source != interval:
+            if not can_resample(source, interval):
+                return MSG_RESAMPLE_ERR.format(interval, source)
+            fine = self.get_series(figi, depth, source)
+            return fine if isinstance(fine, str) else resample(fine, interval, session)
+
+        to = datetime.utcnow()
+        _from = to - timedelta(days=depth)
+
+        if self.store is None:
+            candles = self._fetch_candles(figi, _from, to, interval)
+            if isinstance(candles, str):
+                return candles
+            return CandleSeries.from_candles(candles, figi, interval)
+
+        error = self._sync_store(figi, _from, to, interval)
+
+        return error or CandleSeries.from_columns(
+            figi, interval, self.store.read(figi, interval, _from, to))
+
+
+    def _fetch_candles(self, figi: str, _from: datetime, to: datetime, interval: str):
+
+        """ Request candles of one instrument for any time range,
+            the range is split into the maximal windows allowed for the interval,
+            windows are fetched in parallel and merged into one series
+        Input:
+            figi: str,
+            _from: datetime, utc,
+            to: datetime, utc,
+            interval: str
+        Output:
+            candles: list or error message string """
+
+        url = self.api_url + "/market/candles"
+
+        def fetch(window):
+            params = {"from": window[0], "to": window[1], "interval": interval, "figi": figi}
             res = self._send_request(url, params=params)
 
-            instrument['candles'] = (
-                res.get('payload').get('candles') if isinstance(res, dict)  else res)
+            return res.get('payload').get('candles') if isinstance(res, dict) else res
 
-        return instruments
+        windows = candle_windows(_from, to, interval)
+        if len(windows) == 1:
+            return fetch(windows[0])
+
+        with ThreadPoolExecutor(max_workers=min(WORKERS, len(windows))) as pool:
+            chunks = list(pool.map(fetch, windows))
 
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                return chunk
 
+        return merge_candles(chunks)
 
 
+    def get_orderbook(self, figi: str, depth: int = 20):
 
+        """ Get order book
+        Input:
+            figi: str,
+            depth: int, 1..20
+        Output: dict = {
+                'figi', 'depth', 'tradeStatus', 'minPriceIncrement', 'lastPrice', 'closePrice',
+                'bids': [{'price', 'quantity'}], 'asks': [{'price', 'quantity'}]}
+            or error message string """
 
+        url = self.api_url + "/market/orderbook"
+        params = {"figi": figi, "depth": depth}
 
+        res = self._send_request(url, params=params)
 
+        return res.get('payload') if isinstance(res, dict) else res
 
 
+    def get_orderbooks(self, figis: list, depth: int = 20, workers: int = WORKERS) -> dict:
 
+        """ Get order books of many instruments in parallel as compact snapshots
+        Input:
+            figis: list of str,
+            depth: int, 1..20,
+            workers: int, number of parallel requests
+        Output: dict = {figi: OrderBook or error message string},
+            new_book.diff(old_book) gives the changed levels """
+
+        def orderbook(figi):
+            res = self.get_orderbook(figi, depth)
+            return OrderBook.from_payload(res) if isinstance(res, dict) else res
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(figis)))) as pool:
+            return dict(zip(figis, pool.map(orderbook, figis)))
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# latency histogram buckets, seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PREFIX = "tinkoff_client"
+
+
+class Histogram(object):
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(object):
+
+    """ Per endpoint request metrics of the client,
+        the client records nothing when metrics is None
+    Usage:
+        metrics = Metrics(hook=print)
+        client = Orders(metrics=metrics)
+        print(metrics.prometheus()) """
+
+    def __init__(self, buckets: tuple = BUCKETS, hook=None):
+
+        """ Input:
+                buckets: tuple, latency histogram buckets, seconds,
+                hook: function, optional, hook(event: dict) for every request """
+
+        self.buckets = buckets
+        self.hook = hook
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.errors = {}
+        self.latency = {}
+        self.server_latency = {}
+        self.bytes_out = {}
+        self.bytes_in = {}
+        self.retries = {}
+        self.waits = {}
+        self.wait_seconds = {}
+
+
+    def observe(self,
+        endpoint: str,
+        method: str,
+        status: int,
+        latency: float,
+        server_latency: float = None,
+        bytes_out: int = 0,
+        bytes_in: int = 0,
+        wait: float = 0):
+
+        """ Record one request
+            Input:
+                endpoint: str, e.g. '/market/candles',
+                method: str,
+                status: int, None for connection errors,
+                latency: float, seconds, client side,
+                server_latency: float, seconds, x-edge-processing-time,
+                bytes_out: int,
+                bytes_in: int,
+                wait: float, seconds spent in the rate limiter """
+
+        key = (endpoint, method)
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if status != 200:
+                error = key + (str(status),)
+                self.errors[error] = self.errors.get(error, 0) + 1
+            self.latency.setdefault(endpoint, Histogram(self.buckets)).observe(latency)
+            if server_latency is not None:
+                self.server_latency.setdefault(
+                    endpoint, Histogram(self.buckets)).observe(server_latency)
+            self.bytes_out[endpoint] = self.bytes_out.get(endpoint, 0) + bytes_out
+            self.bytes_in[endpoint] = self.bytes_in.get(endpoint, 0) + bytes_in
+            if wait:
+                self.waits[endpoint] = self.waits.get(endpoint, 0) + 1
+                self.wait_seconds[endpoint] = self.wait_seconds.get(endpoint, 0) + wait
+
+        if self.hook:
+            self.hook({"event": "request", "endpoint": endpoint, "method": method,
+                "status": status, "latency": latency, "server_latency": server_latency,
+                "bytes_out": bytes_out, "bytes_in": bytes_in, "wait": wait})
+
+
+    def retry(self, endpoint: str):
+
+        """ Record retry of a request """
+
+        with self.lock:
+            self.retries[endpoint] = self.retries.get(endpoint, 0) + 1
+
+        if self.hook:
+            self.hook({"event": "retry", "endpoint": endpoint})
+
+
+    def snapshot(self) -> dict:
+
+        """ Output: dict = {endpoint: {requests, errors, latency_avg, server_latency_avg,
+                bytes_out, bytes_in, retries, rate_limit_waits, rate_limit_wait_seconds}} """
+
+        result = {}
+        with self.lock:
+            for (endpoint, method), count in self.requests.items():
+                item = result.setdefault(endpoint, {"requests": 0, "errors": {}})
+                item["requests"] += count
+            for (endpoint, method, status), count in self.errors.items():
+                errors = result[endpoint]["errors"]
+                errors[status] = errors.get(status, 0) + count
+            for endpoint, item in result.items():
+                latency = self.latency.get(endpoint)
+                server = self.server_latency.get(endpoint)
+                item.update({
+                    "latency_avg": latency.sum / latency.count if latency else None,
+                    "server_latency_avg": server.sum / server.count if server else None,
+                    "bytes_out": self.bytes_out.get(endpoint, 0),
+                    "bytes_in": self.bytes_in.get(endpoint, 0),
+                    "retries": self.retries.get(endpoint, 0),
+                    "rate_limit_waits": self.waits.get(endpoint, 0),
+                    "rate_limit_wait_seconds": self.wait_seconds.get(endpoint, 0)})
+        return result
+
+
+    def prometheus(self, prefix: str = PREFIX) -> str:
+
+        """ Prometheus text exposition format """
+
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append("# HELP {}_{} {}".format(prefix, name, help))
+            lines.append("# TYPE {}_{} {}".format(prefix, name, kind))
+            for labels, value in samples:
+                labels = ",".join('{}="{}"'.format(k, v) for k, v in labels)
+                lines.append("{}_{}{{{}}} {}".format(prefix, name, labels, value))
+
+        def histogram(name, help, histograms):
+            lines.append("# HELP {}_{} {}".format(prefix, name, help))
+            lines.append("# TYPE {}_{} histogram".format(prefix, name))
+            for endpoint, h in sorted(histograms.items()):
+                total = 0
+                for bound, count in zip(h.buckets + ("+Inf",), h.counts):
+                    total += count
+                    lines.append('{}_{}_bucket{{endpoint="{}",le="{}"}} {}'.format(
+                        prefix, name, endpoint, bound, total))
+                lines.append('{}_{}_sum{{endpoint="{}"}} {}'.format(prefix, name, endpoint, h.sum))
+                lines.append('{}_{}_count{{endpoint="{}"}} {}'.format(
+                    prefix, name, endpoint, h.count))
+
+        with self.lock:
+            metric("requests_total", "counter", "Requests sent",
+                [((("endpoint", e), ("method", m)), v) for (e, m), v in sorted(self.requests.items())])
+            metric("errors_total", "counter", "Failed requests by status",
+                [((("endpoint", e), ("method", m), ("status", s)), v)
+                    for (e, m, s), v in sorted(self.errors.items())])
+            histogram("request_seconds", "Client side request latency", self.latency)
+            histogram("server_seconds", "Server processing time, x-edge-processing-time",
+                self.server_latency)
+            for name, help, values in (
+                ("bytes_out_total", "Request body bytes", self.bytes_out),
+                ("bytes_in_total", "Response body bytes", self.bytes_in),
+                ("retries_total", "Retried requests", self.retries),
+                ("rate_limit_waits_total", "Requests delayed by the rate limiter", self.waits),
+                ("rate_limit_wait_seconds_total", "Time spent in the rate limiter",
+                    self.wait_seconds)):
+                metric(name, "counter", help,
+                    [((("endpoint", e),), v) for e, v in sorted(values.items())])
+
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics: Metrics, host: str = "127.0.0.1", port: int = 9108):
+
+    """ Serve metrics.prometheus() on http://host:port/metrics in a background thread
+        Output: server """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            body = metrics.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+from typing import Optional
+
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _camel(name: str) -> str:
+    head, *tail = name.split('_')
+    return head + ''.join(word.title() for word in tail)
+
+
+def _struct(name: str, fields: list):
+
+    """ Typed slotted struct, msgspec.Struct when msgspec is installed,
+        attributes are snake_case, API keys are camelCase
+        Input:
+            name: str,
+            fields: list = [(name, type) or (name, type, default)] """
+
+    if msgspec is not None:
+        cls = msgspec.defstruct(name, fields, kw_only=True, rename="camel")
+        cls.from_dict = classmethod(lambda cls, data: msgspec.convert(data, cls))
+        return cls
+
+    names = tuple(field[0] for field in fields)
+    defaults = {field[0]: field[2] for field in fields if len(field) == 3}
+    # (attribute, API key, default), missing required key raises KeyError
+    keys = tuple((field, _camel(field), defaults.get(field, KeyError)) for field in names)
+
+    def __init__(self, **kwargs):
+        for field in names:
+            setattr(self, field, kwargs[field] if field in kwargs else defaults[field])
+
+    def __repr__(self):
+        return "{}({})".format(name, ", ".join(
+            "{}={!r}".format(field, getattr(self, field)) for field in names))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, field) == getattr(other, field) for field in names)
+
+    def from_dict(cls, data: dict):
+        struct = cls.__new__(cls)
+        for field, key, default in keys:
+            value = data.get(key, default)
+            if value is KeyError:
+                raise KeyError(key)
+            setattr(struct, field, value)
+        return struct
+
+    return type(name, (object,), {
+        '__slots__': names, '__struct_fields__': names, '__init__': __init__,
+        '__repr__': __repr__, '__eq__': __eq__, 'from_dict': classmethod(from_dict)})
+
+
+def to_dict(struct) -> dict:
+
+    """ Convert struct back to the API dict, camelCase keys """
+
+    return {_camel(field): getattr(struct, field) for field in struct.__struct_fields__}
+
+
+Instrument = _struct("Instrument", [
+    ("figi", str), ("ticker", str), ("name", str), ("type", str),
+    ("lot", int, 1), ("currency", Optional[str], None), ("isin", Optional[str], None),
+    ("min_price_increment", Optional[float], None)])
+
+Candle = _struct("Candle", [
+    ("figi", str), ("interval", str), ("time", str),
+    ("o", float), ("c", float), ("h", float), ("l", float), ("v", int)])
+
+Operation = _struct("Operation", [
+    ("id", str), ("status", str), ("operation_type", str), ("date", str),
+    ("currency", str), ("payment", float), ("figi", Optional[str], None),
+    ("price", Optional[float], None), ("quantity", Optional[int], None),
+    ("quantity_executed", Optional[int], None), ("instrument_type", Optional[str], None),
+    ("is_margin_call", bool, False), ("commission", Optional[dict], None),
+    ("trades", Optional[list], None)])
+
+Order = _struct("Order", [
+    ("order_id", str), ("figi", str), ("operation", str), ("status", str),
+    ("requested_lots", int), ("executed_lots", int), ("type", str),
+    ("price", Optional[float], None)])
+
+Position = _struct("Position", [
+    ("figi", str), ("instrument_type", str), ("balance", float), ("lots", int),
+    ("ticker", Optional[str], None), ("isin", Optional[str], None),
+    ("name", Optional[str], None), ("blocked", Optional[float], None),
+    ("average_position_price", Optional[dict], None),
+    ("average_position_price_no_nkd", Optional[dict], None),
+    ("expected_yield", Optional[dict], None)])
+
+
+def convert(items: list, model) -> list:
+
+    """ Convert API dicts to structs
+        Input:
+            items: list of dict,
+            model: Instrument, Candle, Operation, Order or Position """
+
+    if msgspec is not None:
+        return msgspec.convert(items, list[model])
+
+    from_dict = model.from_dict
+    return [from_dict(item) for item in items]
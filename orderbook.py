@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import time
+from array import array
+
+
+class OrderBook(object):
+
+    """ Order book snapshot as price and quantity arrays,
+        bids from the best (highest) price, asks from the best (lowest) price """
+
+    __slots__ = ('figi', 'time', 'bid_prices', 'bid_quantities', 'ask_prices', 'ask_quantities')
+
+
+    def __init__(self, figi: str, bid_prices: array, bid_quantities: array,
+        ask_prices: array, ask_quantities: array, time: float = None):
+
+        self.figi = figi
+        self.time = time
+        self.bid_prices = bid_prices
+        self.bid_quantities = bid_quantities
+        self.ask_prices = ask_prices
+        self.ask_quantities = ask_quantities
+
+
+    @classmethod
+    def from_payload(cls, payload: dict, time_: float = None):
+
+        """ Create snapshot from /market/orderbook payload or streaming orderbook event
+            payload: {'figi', 'bids': [{'price', 'quantity'}] or [[price, quantity]], 'asks'} """
+
+        def side(levels):
+            if levels and isinstance(levels[0], dict):
+                return (array('d', [level['price'] for level in levels]),
+                    array('q', [level['quantity'] for level in levels]))
+            return (array('d', [level[0] for level in levels]),
+                array('q', [level[1] for level in levels]))
+
+        bids, asks = side(payload.get('bids') or []), side(payload.get('asks') or [])
+
+        return cls(payload.get('figi'), bids[0], bids[1], asks[0], asks[1],
+            time.time() if time_ is None else time_)
+
+
+    @property
+    def best_bid(self):
+        return self.bid_prices[0] if self.bid_prices else None
+
+
+    @property
+    def best_ask(self):
+        return self.ask_prices[0] if self.ask_prices else None
+
+
+    @property
+    def spread(self):
+        if self.bid_prices and self.ask_prices:
+            return self.ask_prices[0] - self.bid_prices[0]
+        return None
+
+
+    def diff(self, previous) -> dict:
+
+        """ Changed levels since the previous snapshot of the instrument,
+            removed level has quantity 0
+        Input:
+            previous: OrderBook or None, None returns all levels
+        Output: dict = {'figi', 'bids': [(price, quantity)], 'asks': [(price, quantity)]} """
+
+        if previous is None:
+            return {'figi': self.figi,
+                'bids': list(zip(self.bid_prices, self.bid_quantities)),
+                'asks': list(zip(self.ask_prices, self.ask_quantities))}
+
+        return {'figi': self.figi,
+            'bids': _diff(previous.bid_prices, previous.bid_quantities,
+                self.bid_prices, self.bid_quantities, -1),
+            'asks': _diff(previous.ask_prices, previous.ask_quantities,
+                self.ask_prices, self.ask_quantities, 1)}
+
+
+    def to_payload(self) -> dict:
+
+        """ Convert to the API payload """
+
+        return {'figi': self.figi, 'depth': max(len(self.bid_prices), len(self.ask_prices)),
+            'bids': [{'price': p, 'quantity': q} for p, q in zip(self.bid_prices, self.bid_quantities)],
+            'asks': [{'price': p, 'quantity': q} for p, q in zip(self.ask_prices, self.ask_quantities)]}
+
+
+def _diff(old_prices, old_quantities, new_prices, new_quantities, order: int) -> list:
+
+    """ Merge two sorted sides in one pass
+        Input: order: int, 1 ascending (asks), -1 descending (bids) """
+
+    changes, i, j = [], 0, 0
+    while i < len(old_prices) or j < len(new_prices):
+        if j == len(new_prices) or (
+            i < len(old_prices) and (old_prices[i] - new_prices[j]) * order < 0):
+            changes.append((old_prices[i], 0))
+            i += 1
+        elif i == len(old_prices) or old_prices[i] != new_prices[j]:
+            changes.append((new_prices[j], new_quantities[j]))
+            j += 1
+        else:
+            if old_quantities[i] != new_quantities[j]:
+                changes.append((new_prices[j], new_quantities[j]))
+            i += 1
+            j += 1
+
+    return changes
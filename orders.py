@@ -21,7 +21,13 @@
 # SOFTWARE.
 
 
-from market import Market
+import time
+import threading
+from market import Market, WORKERS
+from models import Operation, Order, Position
+from retry import not_sent
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from itertools import zip_longest as zip
 
@@ -32,65 +38,140 @@ MSG_OPERATIONS_ERR = MSG_ERR + MSG_OPERATIONS
 MSG_ORDERS = 'Operations. Response: {}'
 MSG_ORDERS_ERR = MSG_ERR + MSG_OPERATIONS
 MSG_PLACE_ORDER = "Operation should be {} instead of {}"
+PLACED_MAXSIZE = 10000
+
+
+def group_by_figi(operations: list) -> dict:
+
+    """ Group operations in one pass
+        Output: dict = {figi: [operations]} """
+
+    groups = {}
+    for operation in operations:
+        groups.setdefault(operation.get('figi'), []).append(operation)
+
+    return groups
+
 
 class Operations(Market):
 
     def __init__(self,
-        db: str = "test.db", token: str = None, account_id: str = None, sandbox: bool = True):
+        db: str = "test.db", token: str = None, account_id: str = None, sandbox: bool = True,
+        **kwargs):
 
-        super().__init__(db, token, account_id, sandbox)
+        super().__init__(db, token, account_id, sandbox, **kwargs)
 
 
     def get_operations(self,
         depth: int = 365,
         instruments: list = None,
         figi:str = None,
-        account_id: str = None):
+        account_id: str = None,
+        per_instrument: bool = False,
+        _from: datetime = None,
+        to: datetime = None,
+        typed: bool = False):
 
         """ Add operations to the list instruments or get all operations in one request
             Input:
-                instruments: list of instruments,
+                instruments: list of instruments, operations of all instruments
+                    are fetched in one request and grouped by figi,
                 depth: days from today,
-                figi: str, not implemented yet! The definition of this argument has is irrelevant,
-                account_id: str, optional
+                figi: str, optional, operations of one instrument,
+                account_id: str, optional,
+                per_instrument: bool, one request per instrument instead,
+                _from: datetime, utc, optional, instead of depth,
+                to: datetime, utc, optional, default now,
+                typed: bool, list of models.Operation instead of dicts, without instruments
             Output:
                 list or error message string """
 
         url = self.api_url + "/operations"
-        _from = (datetime.utcnow() - timedelta(days=depth)).isoformat() + '+03:00'
-        to = datetime.utcnow().isoformat() + '+03:00'
-        params = {"from": _from, "to": to}
+        to = to or datetime.utcnow()
+        _from = _from or to - timedelta(days=depth)
+        params = {"from": _from.isoformat() + '+00:00', "to": to.isoformat() + '+00:00'}
         if account_id:
             params.update({"brokerAccountId": account_id})
+        if figi:
+            params.update({"figi": figi})
 
         if not instruments:
+            if typed:
+                return self._send_request(url, params=params, model=Operation, key='operations')
+
             res = self._send_request(url, params=params)
 
             return res.get('payload').get('operations') if isinstance(res, dict) else res
 
-        # TODO
-        if figi:
-            pass
+        if per_instrument:
+            for instrument in instruments:
+                res = self._send_request(url, params=dict(params, figi=instrument['figi']))
 
-        for instrument in instruments:
-            params.update({"figi": instrument['figi']})
-            res = self._send_request(url, params=params)
+                instrument['operations'] = (
+                    res.get('payload').get('operations') if isinstance(res, dict) else res)
 
-            instrument['operations'] = (
-                res.get('payload').get('operations') if isinstance(res, dict) else res)
+            return instruments
+
+        res = self._send_request(url, params=params)
+        if isinstance(res, str):
+            for instrument in instruments:
+                instrument['operations'] = res
+            return instruments
+
+        by_figi = group_by_figi(res.get('payload').get('operations'))
+        for instrument in instruments:
+            instrument['operations'] = by_figi.get(instrument['figi'], [])
 
         return instruments
 
 
-    def get_portfolio(self, account_id: str = None):
+    def iter_operations(self,
+        depth: int = 365,
+        figi: str = None,
+        account_id: str = None,
+        _from: datetime = None,
+        to: datetime = None,
+        typed: bool = False):
+
+        """ Yield operations one at a time while the response is parsed,
+            see get_operations
+            Input:
+                depth: days from today,
+                figi: str, optional, operations of one instrument,
+                account_id: str, optional,
+                _from: datetime, utc, optional, instead of depth,
+                to: datetime, utc, optional, default now,
+                typed: bool, models.Operation instead of dicts
+            Output:
+                generator of dict, raises Exception with the error message """
+
+        to = to or datetime.utcnow()
+        _from = _from or to - timedelta(days=depth)
+        params = {"from": _from.isoformat() + '+00:00', "to": to.isoformat() + '+00:00'}
+        if account_id:
+            params.update({"brokerAccountId": account_id})
+        if figi:
+            params.update({"figi": figi})
+
+        for operation in self._iter_request(self.api_url + "/operations", "operations", params):
+            yield Operation.from_dict(operation) if typed else operation
+
+
+    def get_portfolio(self, account_id: str = None, typed: bool = False):
 
         """ Get client's portfolio,
+        Input:
+            account_id: str, optional,
+            typed: bool, list of models.Position instead of dicts
         Output: list of dict of the opened positions
             or error message string """
 
         url = self.api_url + "/portfolio"
         params = {"brokerAccountId": account_id} if account_id else None
 
+        if typed:
+            return self._send_request(url, params=params, model=Position, key='positions')
+
         res = self._send_request(url, params=params)
 
         return res.get('payload').get('positions') if isinstance(res, dict) else res
@@ -113,17 +194,23 @@ class Operations(Market):
 class Orders(Operations):
 
     def __init__(self,
-        db: str = "test.db", token: str = None, account_id: str = None, sandbox: bool = True):
+        db: str = "test.db", token: str = None, account_id: str = None, sandbox: bool = True,
+        **kwargs):
 
-        super().__init__(db, token, account_id, sandbox)
+        super().__init__(db, token, account_id, sandbox, **kwargs)
+        # results of the orders placed with client_order_id, oldest are evicted
+        self.placed = OrderedDict()
+        self.placing = set()
+        self.placed_lock = threading.Condition()
 
 
-    def get_orders(self, instruments: list = None, account_id: str = None):
+    def get_orders(self, instruments: list = None, account_id: str = None, typed: bool = False):
 
         """ Add active orders to list of instruments
         Input:
             instruments: list, optional,
-            account_id: str, optional
+            account_id: str, optional,
+            typed: bool, models.Order instead of dicts
         Output:
             expected result: list,
                 instruments['orders'] list or list of dict of the opened positions
@@ -132,18 +219,20 @@ class Orders(Operations):
         url = self.api_url + "/orders"
         params = {"brokerAccountId": account_id} if account_id else None
 
-        res = self._send_request(url)
-
-        if isinstance(res, str):
-            return res
+        if typed:
+            orders_list = self._send_request(url, params=params, model=Order)
+        else:
+            res = self._send_request(url, params=params)
+            orders_list = res.get('payload') if isinstance(res, dict) else res
 
-        orders_list = res.get('payload')
+        if isinstance(orders_list, str):
+            return orders_list
 
         if instruments:
             for instrument in instruments:
                 instrument['orders'] = []
                 for order in orders_list:
-                    if instrument.get('figi') == order.get('figi'):
+                    if instrument.get('figi') == (order.figi if typed else order.get('figi')):
                         instrument['orders'].append(order)
 
             return instruments
@@ -155,18 +244,45 @@ class Orders(Operations):
         lots: int,
         op: str,
         price: float,
-        account_id: str = None):
+        account_id: str = None,
+        client_order_id: str = None):
 
-        """ Place limit order
+        """ Place limit order,
+            order POST is retried only if it has not reached the server
         Input:
             "figi:, str,
             "lots": int,
             "op": str, "Buy" or "Sell",
             "price": float, for limit orders, optional
-            account_id: str, optional
+            account_id: str, optional,
+            client_order_id: str, optional, idempotency key, the order with the same key
+                is sent once, next calls return the first result; the order is sent
+                again only if the first call surely did not place it: validation error,
+                open circuit, connection refused or an error response
         Output:
             expected type dict, str with an error message """
 
+        if client_order_id:
+            with self.placed_lock:
+                while client_order_id in self.placing:
+                    self.placed_lock.wait()
+                if client_order_id in self.placed:
+                    return self.placed[client_order_id]
+                self.placing.add(client_order_id)
+            res = None
+            try:
+                self.local.outcome = (None, None)
+                res = self.place_order(figi, lots, op, price, account_id)
+            finally:
+                with self.placed_lock:
+                    self.placing.discard(client_order_id)
+                    if isinstance(res, dict) or self._maybe_placed():
+                        self.placed[client_order_id] = res
+                        while len(self.placed) > PLACED_MAXSIZE:
+                            self.placed.popitem(last=False)
+                    self.placed_lock.notify_all()
+            return res
+
         ops = ("Buy", "Sell")
         if op not in ops:
             msg = MSG_PLACE_ORDER.format(ops, op)
@@ -205,16 +321,92 @@ class Orders(Operations):
         return res.get('payload') if isinstance(res, dict) else res
 
 
+    def _maybe_placed(self) -> bool:
 
+        """ The last request of the thread failed after it was sent,
+            e.g. read timeout, the order may have been placed """
 
+        code, error = getattr(self.local, 'outcome', (None, None))
+        return code is None and error is not None and not not_sent(error)
 
 
+    def place_orders(self, orders: list, workers: int = WORKERS) -> dict:
 
+        """ Place many orders in parallel, requests wait for the orders rate limit
+        Input:
+            orders: list = [{
+                'figi': str, 'lots': int, 'op': 'Buy' or 'Sell',
+                'price': float, optional, market order without price,
+                'account_id': str, optional, 'client_order_id': str, optional}],
+            workers: int, max orders in flight
+        Output: batch: dict, see _batch """
 
+        def place(order):
+            return self.place_order(order['figi'], order['lots'], order['op'],
+                order.get('price'), order.get('account_id'), order.get('client_order_id'))
 
+        return self._batch(place, orders, workers)
 
 
+    def cancel_orders(self, order_ids: list, account_id: str = None, workers: int = WORKERS) -> dict:
 
+        """ Cancel many orders in parallel
+        Input:
+            order_ids: list of str,
+            account_id: str, optional,
+            workers: int, max requests in flight
+        Output: batch: dict, see _batch """
 
+        return self._batch(lambda order_id: self.cancel_order(order_id, account_id), order_ids, workers)
 
 
+    def cancel_all(self, figi: str = None, account_id: str = None, workers: int = WORKERS) -> dict:
+
+        """ Cancel all active orders or orders of the instrument
+        Input:
+            figi: str, optional,
+            account_id: str, optional,
+            workers: int, max requests in flight
+        Output: batch: dict, see _batch, or error message string """
+
+        orders = self.get_orders(account_id=account_id)
+        if isinstance(orders, str):
+            return orders
+
+        order_ids = [order['orderId'] for order in orders if not figi or order.get('figi') == figi]
+
+        return self.cancel_orders(order_ids, account_id, workers)
+
+
+    def _batch(self, func, items: list, workers: int) -> dict:
+
+        """ Run func for items on a worker pool
+        Output: batch: dict = {
+            'results': [{'request': item, 'result': dict or None,
+                'error': str or None, 'seconds': float}], in items order,
+            'report': {'total': int, 'ok': int, 'failed': int, 'seconds': float,
+                'p50': float, 'max': float, 'per_sec': float}} """
+
+        def run(item):
+            start = time.perf_counter()
+            res = func(item)
+            seconds = time.perf_counter() - start
+            if isinstance(res, dict):
+                return {'request': item, 'result': res, 'error': None, 'seconds': seconds}
+            return {'request': item, 'result': None, 'error': res, 'seconds': seconds}
+
+        start = time.perf_counter()
+        if items:
+            with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+                results = list(pool.map(run, items))
+        else:
+            results = []
+        seconds = time.perf_counter() - start
+
+        timings = sorted(result['seconds'] for result in results) or [0.]
+        ok = sum(1 for result in results if result['error'] is None)
+
+        return {'results': results, 'report': {
+            'total': len(results), 'ok': ok, 'failed': len(results) - ok,
+            'seconds': seconds, 'p50': timings[len(timings) // 2], 'max': timings[-1],
+            'per_sec': len(results) / seconds if seconds else 0.}}
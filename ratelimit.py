@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import os
+import time
+import fcntl
+import struct
+import hashlib
+import tempfile
+import threading
+
+
+# requests per minute for the endpoint groups
+# https://tinkoffcreditsystems.github.io/invest-openapi/rate_limits/
+RATE_LIMITS = {
+    "market": 240,
+    "orders": 100,
+    "limit-order": 100,
+    "market-order": 100,
+    "cancel": 50,
+    "operations": 120,
+    "portfolio": 120,
+    "user": 120,
+    "sandbox": 120,
+}
+DEFAULT_GROUP = "user"
+# endpoints limited apart from their group
+ENDPOINT_GROUPS = {
+    "orders/limit-order": "limit-order",
+    "orders/market-order": "market-order",
+    "orders/cancel": "cancel",
+}
+# shared bucket file: tokens, last refill time
+BUCKET_STATE = struct.Struct("dd")
+
+
+def endpoint_group(url: str) -> str:
+
+    """ Get endpoint group from url
+        Input:
+            url: str, e.g. https://api-invest.tinkoff.ru/openapi/sandbox/market/candles
+        Output:
+            group: str, e.g. 'market' """
+
+    path = url.split("/openapi", 1)[-1].strip("/").split("?")[0].split("/")
+    if path[0] == "sandbox" and len(path) > 1 and path[1] != "register":
+        path = path[1:]
+    group = ENDPOINT_GROUPS.get("/".join(path[:2]))
+    if group:
+        return group
+    return path[0] if path[0] in RATE_LIMITS else DEFAULT_GROUP
+
+
+class TokenBucket(object):
+
+    """ Thread-safe token bucket, `rate` tokens per `period` seconds,
+        bursts up to `capacity` """
+
+    def __init__(self, rate: int, period: float = 60, capacity: int = None):
+
+        self.rate = rate / period
+        self.capacity = capacity or rate
+        self.tokens = float(self.capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+
+    def acquire(self, tokens: int = 1) -> float:
+
+        """ Take tokens, block until available
+            Output:
+                wait: float, seconds spent waiting """
+
+        waited = 0.
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RateLimiter(object):
+
+    """ One token bucket per endpoint group """
+
+    def __init__(self, limits: dict = None):
+
+        """ Input:
+                limits: dict, {group: requests per minute}, default RATE_LIMITS """
+
+        limits = limits or RATE_LIMITS
+        self.buckets = {group: TokenBucket(rate) for group, rate in limits.items()}
+
+
+    def acquire(self, url: str) -> float:
+
+        """ Wait for a token of the url's endpoint group
+            Output:
+                wait: float, seconds """
+
+        bucket = self.buckets.get(endpoint_group(url))
+        return bucket.acquire() if bucket else 0.
+
+
+class SharedTokenBucket(object):
+
+    """ Token bucket in a file shared by all processes of the host.
+        A request reserves the next token under the file lock and sleeps
+        until it is due: tokens go below zero while requests wait, so
+        requests are served in arrival order and a dead process holds nothing """
+
+    def __init__(self, path: str, rate: int, period: float = 60, capacity: int = None):
+
+        self.path = path
+        self.rate = rate / period
+        self.capacity = capacity or rate
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+
+    def acquire(self, tokens: int = 1) -> float:
+
+        """ Reserve tokens, sleep until they are refilled
+            Output:
+                wait: float, seconds """
+
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                data = os.pread(self.fd, BUCKET_STATE.size, 0)
+                if len(data) == BUCKET_STATE.size:
+                    available, last = BUCKET_STATE.unpack(data)
+                    available = min(self.capacity, available + max(0, now - last) * self.rate)
+                else:
+                    available = float(self.capacity)
+                available -= tokens
+                os.pwrite(self.fd, BUCKET_STATE.pack(available, now), 0)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+        wait = -available / self.rate if available < 0 else 0.
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class SharedRateLimiter(RateLimiter):
+
+    """ Rate limiter shared by all processes using the same token on the host,
+        one shared bucket per endpoint group, so bulk market requests
+        never take the tokens of the order endpoints
+    Usage:
+        client = Orders(limiter=SharedRateLimiter(TOKEN)) """
+
+    def __init__(self, token: str, path: str = None, limits: dict = None):
+
+        """ Input:
+                token: str, API token, buckets are per token,
+                path: str, directory for the bucket files, default system temp,
+                limits: dict, {group: requests per minute}, default RATE_LIMITS """
+
+        path = path or os.path.join(tempfile.gettempdir(), "tinkoff_client")
+        os.makedirs(path, exist_ok=True)
+        key = hashlib.sha1(token.encode()).hexdigest()[:16]
+        limits = limits or RATE_LIMITS
+        self.buckets = {
+            group: SharedTokenBucket(os.path.join(path, "{}.{}".format(key, group)), rate)
+            for group, rate in limits.items()}
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+from array import array
+from datetime import datetime, timezone
+from candles import CandleSeries
+from store import COLUMNS, INTERVAL_SECONDS
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MSG_ERR = "Error! "
+MSG_RESAMPLE = "Resample. {} candles can not be built from {} candles"
+MSG_RESAMPLE_ERR = MSG_ERR + MSG_RESAMPLE
+INTERVALS = (
+    '1min', '2min', '3min', '5min', '10min', '15min', '30min', 'hour', 'day', 'week', 'month')
+DAY = 86400
+MONDAY = 4 * DAY  # 1970-01-05, the first monday after the epoch
+
+
+def session_seconds(session: tuple) -> tuple:
+
+    """ Exchange session to seconds of the utc day
+        Input:
+            session: tuple = ('07:00', '15:40'), utc open and close, optional
+        Output:
+            (open, close): tuple of int or None """
+
+    if not session:
+        return None
+
+    return tuple(int(t[:2]) * 3600 + int(t[3:5]) * 60 for t in session)
+
+
+def can_resample(source: str, interval: str) -> bool:
+
+    """ Every candle of the source interval lies in one candle of the interval """
+
+    if source not in INTERVALS or interval not in INTERVALS:
+        return False
+    if INTERVALS.index(interval) <= INTERVALS.index(source):
+        return source == interval
+    if interval in ('week', 'month'):
+        return DAY % INTERVAL_SECONDS[source] == 0
+
+    return INTERVAL_SECONDS[interval] % INTERVAL_SECONDS[source] == 0
+
+
+def bucket(time: int, interval: str, offset: int = 0) -> int:
+
+    """ Start of the candle of the interval containing time
+        Input:
+            time: int, epoch seconds,
+            interval: str,
+            offset: int, seconds, day, week and month start at the session open
+        Output:
+            epoch seconds """
+
+    if interval == 'month':
+        day = datetime.fromtimestamp(time - offset, timezone.utc)
+        return int(datetime(day.year, day.month, 1, tzinfo=timezone.utc).timestamp()) + offset
+
+    step = INTERVAL_SECONDS[interval]
+    origin = offset + (MONDAY if interval == 'week' else 0)
+
+    return (time - origin) // step * step + origin
+
+
+def resample(series: CandleSeries, interval: str, session: tuple = None):
+
+    """ Aggregate candles into a coarser interval:
+            time: candle start, o: first open, h: max high, l: min low,
+            c: last close, v: sum of volumes
+        Input:
+            series: CandleSeries, sorted by time, e.g. Market.get_series,
+            interval: str, 2min ... month, see Market.get_candles,
+            session: tuple = ('07:00', '15:40'), utc, optional, candles outside
+                the session are dropped, intraday candles are counted from the open,
+                day, week and month start at the open
+        Output:
+            CandleSeries or error message string """
+
+    if not can_resample(series.interval, interval):
+        return MSG_RESAMPLE_ERR.format(interval, series.interval)
+
+    seconds = session_seconds(session)
+    if numpy is not None:
+        return _resample_numpy(series, interval, seconds)
+
+    return _resample(series, interval, seconds)
+
+
+def _in_session(time: int, seconds: tuple) -> bool:
+    begin, end = seconds
+    day_time = time % DAY
+    if begin < end:
+        return begin <= day_time < end
+    return day_time >= begin or day_time < end
+
+
+def _resample(series: CandleSeries, interval: str, seconds: tuple) -> CandleSeries:
+    result = CandleSeries(series.figi, interval)
+    offset = seconds[0] if seconds else 0
+    last = None
+
+    for time, o, h, l, c, v in zip(*(getattr(series, col) for col, _ in COLUMNS)):
+        if seconds and not _in_session(time, seconds):
+            continue
+        start = bucket(time, interval, offset)
+        if start != last:
+            last = start
+            result.time.append(start)
+            result.o.append(o)
+            result.h.append(h)
+            result.l.append(l)
+            result.c.append(c)
+            result.v.append(v)
+            continue
+        if h > result.h[-1]:
+            result.h[-1] = h
+        if l < result.l[-1]:
+            result.l[-1] = l
+        result.c[-1] = c
+        result.v[-1] += v
+
+    return result
+
+
+def _buckets(time, interval: str, offset: int):
+    if interval == 'month':
+        months = (time - offset).astype('datetime64[s]').astype('datetime64[M]')
+        return months.astype('datetime64[s]').astype('i8') + offset
+
+    step = INTERVAL_SECONDS[interval]
+    origin = offset + (MONDAY if interval == 'week' else 0)
+
+    return (time - origin) // step * step + origin
+
+
+def _resample_numpy(series: CandleSeries, interval: str, seconds: tuple) -> CandleSeries:
+    columns = series.to_numpy()
+    if seconds:
+        begin, end = seconds
+        day_time = columns['time'] % DAY
+        if begin < end:
+            mask = (day_time >= begin) & (day_time < end)
+        else:
+            mask = (day_time >= begin) | (day_time < end)
+        columns = {column: values[mask] for column, values in columns.items()}
+
+    if not len(columns['time']):
+        return CandleSeries(series.figi, interval)
+
+    buckets = _buckets(columns['time'], interval, seconds[0] if seconds else 0)
+    starts = numpy.flatnonzero(numpy.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = numpy.append(starts[1:], len(buckets)) - 1
+
+    return CandleSeries(series.figi, interval, *(_array(typecode, values) for typecode, values in (
+        ('q', buckets[starts]),
+        ('d', columns['o'][starts]),
+        ('d', numpy.maximum.reduceat(columns['h'], starts)),
+        ('d', numpy.minimum.reduceat(columns['l'], starts)),
+        ('d', columns['c'][ends]),
+        ('q', numpy.add.reduceat(columns['v'], starts)))))
+
+
+def _array(typecode: str, values) -> array:
+    result = array(typecode)
+    result.frombytes(values.astype(typecode).tobytes())
+    return result
+
+
+class Resampler(object):
+
+    """ Coarse candles kept up to date from new fine candles,
+        only the candles of the last, still open, coarse candle are kept
+    Usage:
+        hourly = Resampler('hour')
+        hourly.update(client.get_series(figi, 1, '1min'))
+        hourly.update(newer_minutes)
+        hourly.series """
+
+    def __init__(self, interval: str, session: tuple = None):
+
+        """ Input:
+                interval: str, 2min ... month,
+                session: tuple = ('07:00', '15:40'), utc, optional, see resample """
+
+        self.interval = interval
+        self.session = session
+        self.offset = session_seconds(session)[0] if session else 0
+        self.series = None
+        self.fine = None
+
+
+    def update(self, fine: CandleSeries):
+
+        """ Add new fine candles, the last fine candle may be replaced,
+            candles older than the last fine candle are ignored
+            Input:
+                fine: CandleSeries, sorted by time
+            Output:
+                None or error message string """
+
+        if not len(fine):
+            return None
+        if self.fine is None:
+            self.fine = CandleSeries(fine.figi, fine.interval)
+        elif len(self.fine) and fine.time[0] < self.fine.time[-1]:
+            fine = fine.between(self.fine.time[-1])
+        self.fine.extend(fine)
+
+        bars = resample(self.fine, self.interval, self.session)
+        if isinstance(bars, str):
+            self.fine = None
+            return bars
+
+        if self.series is None:
+            self.series = bars
+        else:
+            self.series.extend(bars)
+
+        # keep fine candles of the last coarse candle only
+        if len(self.series):
+            self.fine = self.fine.between(self.series.time[-1])
+
+        return None
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import time
+import random
+import threading
+import requests
+from urllib3.exceptions import NewConnectionError
+
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRY_AFTER = 120
+MSG_CIRCUIT = "Circuit is open for '{}' endpoints, retry in {:.1f} sec"
+
+
+class RetryPolicy(object):
+
+    """ When and how long to wait before the next attempt,
+        GET is idempotent and retried on errors and RETRY_STATUSES,
+        POST (orders) only when the request has not reached the server:
+        connection not established or 429 """
+
+    def __init__(self,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        jitter: bool = True,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 11,
+        statuses: tuple = RETRY_STATUSES,
+        hedge_delay: float = None,
+        max_retry_after: float = MAX_RETRY_AFTER):
+
+        """ Input:
+                retries: int, attempts after the first one, 0 disables retries,
+                backoff: float, seconds, doubled on every attempt,
+                max_backoff: float, seconds,
+                jitter: bool, random wait in 0..backoff ("full jitter"),
+                connect_timeout: float, seconds,
+                read_timeout: float, seconds,
+                statuses: tuple, retried response statuses,
+                hedge_delay: float, seconds, optional, GET is sent again in parallel
+                    if no response after the delay, the first response wins,
+                max_retry_after: float, seconds, Retry-After is waited in full,
+                    a longer one is not retried """
+
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.statuses = statuses
+        self.hedge_delay = hedge_delay
+        self.max_retry_after = max_retry_after
+
+
+    def timeout(self, read_timeout: float = None) -> tuple:
+
+        """ Output: (connect, read) seconds """
+
+        return (self.connect_timeout, read_timeout or self.read_timeout)
+
+
+    def should_retry(self,
+        attempt: int, method: str, code: int = None, error: Exception = None,
+        retry_after: str = None) -> bool:
+
+        """ Input:
+                attempt: int, 0 for the first attempt,
+                method: str, 'GET' or 'POST',
+                code: int, response status or None,
+                error: Exception or None,
+                retry_after: str, Retry-After header or None """
+
+        if attempt >= self.retries:
+            return False
+        if _seconds(retry_after) > self.max_retry_after:
+            return False
+        if error is not None:
+            return method == "GET" or not_sent(error)
+        if code == 429:
+            return True
+        return method == "GET" and code in self.statuses
+
+
+    def wait(self, attempt: int, retry_after: str = None) -> float:
+
+        """ Output: seconds before the next attempt, Retry-After wins in full """
+
+        seconds = _seconds(retry_after)
+        if seconds:
+            return seconds
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+def _seconds(retry_after: str) -> float:
+
+    """ Retry-After seconds, 0 if missing or a date """
+
+    try:
+        return max(0., float(retry_after)) if retry_after else 0.
+    except ValueError:
+        return 0.
+
+
+def not_sent(error: Exception) -> bool:
+
+    """ True if the request never reached the server and can be sent again """
+
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], 'reason', error.args[0]), NewConnectionError)
+    return False
+
+
+class CircuitBreaker(object):
+
+    """ Stop sending requests to an endpoint group after `threshold`
+        failures in a row, let one request through after `reset` seconds """
+
+    def __init__(self, threshold: int = 5, reset: float = 30):
+
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = {}
+        self.opened = {}
+        self.lock = threading.Lock()
+
+
+    def check(self, group: str):
+
+        """ Output: None if the request can be sent or error message string """
+
+        with self.lock:
+            opened = self.opened.get(group)
+            if opened is None:
+                return None
+            left = opened + self.reset - time.monotonic()
+            if left > 0:
+                return MSG_CIRCUIT.format(group, left)
+            # half-open, one trial request
+            self.opened[group] = time.monotonic()
+            return None
+
+
+    def success(self, group: str):
+        with self.lock:
+            self.failures[group] = 0
+            self.opened.pop(group, None)
+
+
+    def failure(self, group: str):
+        with self.lock:
+            self.failures[group] = self.failures.get(group, 0) + 1
+            if self.failures[group] >= self.threshold:
+                self.opened[group] = time.monotonic()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import shelve
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from market import MSG_ERR, WORKERS
+
+
+MSG_SCANNER = "Scanner. Response: {}"
+MSG_SCANNER_ERR = MSG_ERR + MSG_SCANNER
+CHECKPOINT_EVERY = 50
+
+
+def static_filter(instrument: dict, filters: dict) -> bool:
+
+    """ Check instrument fields without requests
+        Input:
+            instrument: dict,
+            filters: dict = {'currency': 'USD', 'type': ('Stock', 'Etf'),
+                'lot': lambda lot: lot <= 10}, value, tuple of values or function
+        Output:
+            bool """
+
+    for key, expected in filters.items():
+        value = instrument.get(key)
+        if callable(expected):
+            if not expected(value):
+                return False
+        elif isinstance(expected, (tuple, list, set, frozenset)):
+            if value not in expected:
+                return False
+        elif value != expected:
+            return False
+
+    return True
+
+
+class Scanner(object):
+
+    """ Scan the market: static filters first, then candles of the survivors
+        are fetched in parallel within the rate limit and checked by predicates,
+        matching instruments are yielded as soon as they qualify.
+        The checkpoint keeps scanned instruments, an interrupted scan resumes
+    Usage:
+        scanner = Scanner(client, catalog=InstrumentCatalog(client), checkpoint="scan.db")
+        for instrument, series in scanner.scan(
+            [lambda instrument, series: series.c[-1] > series.c[0]],
+            filters={'currency': 'USD'}, depth=30, interval='day'):
+            print(instrument['ticker']) """
+
+    def __init__(self,
+        client,
+        catalog=None,
+        markets: tuple = ("stocks",),
+        checkpoint: str = None,
+        workers: int = WORKERS):
+
+        """ Input:
+                client: Market,
+                catalog: InstrumentCatalog, optional, universe from the stored catalog,
+                markets: tuple, markets of the universe without catalog,
+                checkpoint: str, optional, file name for the checkpoint database,
+                workers: int, candle requests in flight """
+
+        self.client = client
+        self.catalog = catalog
+        self.markets = markets
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.errors = {}
+        self.lock = threading.Lock()
+
+
+    def universe(self) -> list:
+
+        """ All instruments of the catalog or the markets, catalog instruments are copies
+            Output: list or error message string """
+
+        if self.catalog is not None:
+            return [dict(instrument) for instrument in self.catalog.load().instruments]
+
+        instruments = []
+        for market in self.markets:
+            res = self.client.get_market(market)
+            if isinstance(res, str):
+                return res
+            instruments.extend(res)
+
+        return instruments
+
+
+    def scan(self,
+        predicates: list,
+        filters: dict = None,
+        depth: int = 30,
+        interval: str = 'day',
+        name: str = "scan",
+        resume: bool = True):
+
+        """ Yield instruments matching all predicates
+            Input:
+                predicates: list of function(instrument, series) -> bool,
+                    series is CandleSeries, see Market.get_series,
+                filters: dict, optional, see static_filter,
+                depth: int, days,
+                interval: str, see Market.get_candles,
+                name: str, checkpoint of the scan, one per set of predicates,
+                resume: bool, skip instruments scanned by the interrupted scan,
+                    a finished scan starts over
+            Output:
+                generator of (instrument, series), raises Exception with the error message,
+                failed instruments are kept in self.errors and scanned again on resume """
+
+        instruments = self.universe()
+        if isinstance(instruments, str):
+            raise Exception(MSG_SCANNER_ERR.format(instruments))
+
+        state = self._load(name) if resume else None
+        if not state or state['complete']:
+            state = {'done': set(), 'matched': [], 'complete': False}
+        instruments = [i for i in instruments
+            if i['figi'] not in state['done'] and static_filter(i, filters or {})]
+
+        self.errors = {}
+        pending, position, scanned = {}, 0, 0
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while pending or position < len(instruments):
+                # at most two requests per worker are queued
+                while position < len(instruments) and len(pending) < self.workers * 2:
+                    instrument = instruments[position]
+                    future = pool.submit(self.client.get_series, instrument['figi'], depth, interval)
+                    pending[future] = instrument
+                    position += 1
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    instrument, series = pending.pop(future), future.result()
+                    if isinstance(series, str):
+                        self.errors[instrument['figi']] = series
+                        continue
+                    state['done'].add(instrument['figi'])
+                    if all(predicate(instrument, series) for predicate in predicates):
+                        state['matched'].append(instrument['figi'])
+                        yield instrument, series
+
+                scanned += len(done)
+                if scanned >= CHECKPOINT_EVERY:
+                    self._save(name, state)
+                    scanned = 0
+
+            state['complete'] = not self.errors
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._save(name, state)
+
+
+    def matched(self, name: str = "scan") -> list:
+
+        """ Figis matched by the scan, including the runs before the resume """
+
+        state = self._load(name)
+        return list(state['matched']) if state else []
+
+
+    def _load(self, name: str) -> dict:
+        if not self.checkpoint:
+            return None
+        with self.lock:
+            with shelve.open(self.checkpoint) as db:
+                return db.get(name)
+
+
+    def _save(self, name: str, state: dict):
+        if not self.checkpoint:
+            return
+        with self.lock:
+            with shelve.open(self.checkpoint) as db:
+                db[name] = state
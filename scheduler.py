@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import math
+import time
+import threading
+from datetime import datetime, timedelta
+from market import candle_windows
+
+
+BUDGET = 120  # requests per minute
+MIN_INTERVAL = 1.
+MAX_INTERVAL = 300.
+VOLATILITY_WINDOW = 20
+ORDERS_BOOST = 2.
+
+
+class FakeClock(object):
+
+    """ Clock moved by sleep only, the scheduler is deterministic with it
+    Usage:
+        clock = FakeClock()
+        scheduler = PollScheduler(client, clock=clock, sleep=clock.sleep) """
+
+    def __init__(self, now: float = 0.):
+        self.now = now
+
+
+    def __call__(self) -> float:
+        return self.now
+
+
+    def sleep(self, seconds: float):
+        self.now += max(0., seconds)
+
+
+def volatility(candles: list, window: int = VOLATILITY_WINDOW) -> float:
+
+    """ Standard deviation of the log returns of the last closes
+        Input:
+            candles: list, API candles,
+            window: int, number of returns
+        Output:
+            float, 0 for less than two candles """
+
+    closes = [candle['c'] for candle in candles[-window - 1:] if candle['c'] > 0]
+    returns = [math.log(b / a) for a, b in zip(closes, closes[1:])]
+    if not returns:
+        return 0.
+    mean = sum(returns) / len(returns)
+
+    return math.sqrt(sum((r - mean) ** 2 for r in returns) / len(returns))
+
+
+class Task(object):
+
+    """ One polled client method, a poll costs `cost` requests of the budget """
+
+    __slots__ = ('name', 'poll', 'weight', 'figi', 'cost', 'interval', 'due', 'last', 'data', 'priority')
+
+
+    def __init__(self, name: str, poll, weight: float = 1., figi: str = None, cost: int = 1):
+        self.name = name
+        self.poll = poll
+        self.weight = weight
+        self.figi = figi
+        self.cost = cost
+        self.interval = MIN_INTERVAL
+        self.due = 0.
+        self.last = None
+        self.data = None
+        self.priority = weight
+
+
+class PollScheduler(object):
+
+    """ Poll candles, orders and portfolio within one requests per minute budget.
+        Every task gets a share of the budget by priority:
+            candles: weight * (1 + volatility / mean volatility), doubled with open orders,
+            orders: weight * (1 + open orders),
+            portfolio: weight,
+        poll interval = sum of priorities * requests per poll / (priority * budget per second),
+        an overdue task is boosted by its staleness. Changed data is published
+        to subscribers.
+    Usage:
+        scheduler = PollScheduler(client, budget=120)
+        scheduler.watch_candles(figi, '1min')
+        scheduler.watch_orders()
+        scheduler.subscribe(lambda name, data, error: print(name))
+        scheduler.run() """
+
+    def __init__(self,
+        client,
+        budget: int = BUDGET,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        min_interval: float = MIN_INTERVAL,
+        max_interval: float = MAX_INTERVAL):
+
+        """ Input:
+                client: Orders,
+                budget: int, requests per minute for all tasks,
+                clock: function, seconds, e.g. FakeClock(),
+                sleep: function(seconds), e.g. FakeClock().sleep,
+                min_interval: float, seconds, shortest poll interval of a task,
+                max_interval: float, seconds, longest poll interval of a task """
+
+        self.client = client
+        self.budget = budget
+        self.clock = clock
+        self.sleep = sleep
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tasks = {}
+        self.subscribers = []
+        self.volatility = {}  # figi: volatility of the last candles
+        self.open_orders = {}  # figi: number of open orders
+        self.next_slot = clock()
+        self.stopped = threading.Event()
+        self.lock = threading.RLock()
+
+
+    def _add(self, task: Task) -> str:
+        with self.lock:
+            task.due = self.clock()
+            self.tasks[task.name] = task
+            self._plan()
+        return task.name
+
+
+    def watch_candles(self, figi: str, interval: str = '1min', depth: int = 1, weight: float = 1.) -> str:
+
+        """ Poll candles of the instrument, see Market.get_candles
+            Output: task name: str, 'candles:figi:interval' """
+
+        def poll():
+            res = self.client.get_candles([{'figi': figi}], depth, interval)
+            return res if isinstance(res, str) else res[0]['candles']
+
+        # longer depth is fetched in several requests, see candle_windows
+        to = datetime.utcnow()
+        cost = len(candle_windows(to - timedelta(days=depth), to, interval))
+
+        return self._add(Task("candles:{}:{}".format(figi, interval), poll, weight, figi, cost))
+
+
+    def watch_orders(self, account_id: str = None, weight: float = 1.) -> str:
+
+        """ Poll active orders of all instruments, see Orders.get_orders
+            Output: task name: str, 'orders' """
+
+        return self._add(Task("orders", lambda: self.client.get_orders(account_id=account_id), weight))
+
+
+    def watch_portfolio(self, account_id: str = None, weight: float = 1.) -> str:
+
+        """ Poll positions, see Orders.get_portfolio
+            Output: task name: str, 'portfolio' """
+
+        return self._add(Task("portfolio", lambda: self.client.get_portfolio(account_id), weight))
+
+
+    def unwatch(self, name: str):
+        with self.lock:
+            self.tasks.pop(name, None)
+            self._plan()
+
+
+    def subscribe(self, callback, name: str = None):
+
+        """ Call callback(name, data, error) when a task gets changed data or an error
+            Input:
+                callback: function,
+                name: str, optional, task name, all tasks by default """
+
+        self.subscribers.append((name, callback))
+
+
+    def _priority(self, task: Task, mean_volatility: float) -> float:
+        if task.name.startswith("candles:"):
+            priority = task.weight
+            if mean_volatility:
+                priority *= 1 + self.volatility.get(task.figi, 0.) / mean_volatility
+            if self.open_orders.get(task.figi):
+                priority *= ORDERS_BOOST
+            return priority
+        if task.name == "orders":
+            return task.weight * (1 + sum(self.open_orders.values()))
+        return task.weight
+
+
+    def _plan(self):
+
+        """ Share the budget between the tasks by priority """
+
+        if not self.tasks:
+            return
+        values = [self.volatility[t.figi] for t in self.tasks.values() if t.figi in self.volatility]
+        mean_volatility = sum(values) / len(values) if values else 0.
+        for task in self.tasks.values():
+            task.priority = self._priority(task, mean_volatility)
+
+        total = sum(task.priority for task in self.tasks.values())
+        per_second = self.budget / 60.
+        for task in self.tasks.values():
+            interval = total * task.cost / (task.priority * per_second)
+            task.interval = min(self.max_interval, max(self.min_interval, interval))
+            if task.last is not None:
+                task.due = task.last + task.interval
+
+
+    def _update(self, task: Task, data):
+        if task.figi and isinstance(data, list):
+            self.volatility[task.figi] = volatility(data)
+        elif task.name == "orders" and isinstance(data, list):
+            self.open_orders = {}
+            for order in data:
+                self.open_orders[order['figi']] = self.open_orders.get(order['figi'], 0) + 1
+
+
+    def _publish(self, task: Task, data, error):
+        for name, callback in self.subscribers:
+            if name is None or name == task.name:
+                callback(task.name, data, error)
+
+
+    def step(self):
+
+        """ Poll the most urgent due task if the budget allows
+            Output: task name: str or None when nothing is due """
+
+        with self.lock:
+            now = self.clock()
+            if now < self.next_slot:
+                return None
+            due = [task for task in self.tasks.values() if task.due <= now]
+            if not due:
+                return None
+
+            # staleness: overdue tasks gain priority by the number of missed intervals
+            task = max(due, key=lambda t: t.priority * (1 + (now - t.due) / t.interval))
+            self.next_slot = max(self.next_slot, now) + 60. * task.cost / self.budget
+            task.last = now
+            task.due = now + task.interval
+
+        res = task.poll()
+        error = res if isinstance(res, str) else None
+
+        with self.lock:
+            if error is None:
+                changed = res != task.data
+                task.data = res
+                self._update(task, res)
+                self._plan()
+            else:
+                changed = True
+
+        if changed:
+            self._publish(task, None if error else res, error)
+
+        return task.name
+
+
+    def wake(self) -> float:
+
+        """ Time of the next possible poll, clock seconds """
+
+        with self.lock:
+            due = min((task.due for task in self.tasks.values()), default=self.clock() + 1.)
+            return max(self.next_slot, due)
+
+
+    def run(self, duration: float = None, steps: int = None):
+
+        """ Poll tasks until stop(), the duration or the number of polls
+            Input:
+                duration: float, seconds of the clock, optional,
+                steps: int, number of polls, optional """
+
+        self.stopped.clear()
+        end = self.clock() + duration if duration is not None else None
+        polls = 0
+
+        while not self.stopped.is_set():
+            if steps is not None and polls >= steps:
+                break
+            if end is not None and self.clock() >= end:
+                break
+            if self.step() is not None:
+                polls += 1
+                continue
+            wake = self.wake()
+            if end is not None:
+                wake = min(wake, end)
+            self.sleep(max(0., wake - self.clock()))
+
+
+    def stop(self):
+        self.stopped.set()
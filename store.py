@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import os
+import json
+import mmap
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+
+# column name, array typecode; time is epoch seconds
+COLUMNS = (('time', 'q'), ('o', 'd'), ('h', 'd'), ('l', 'd'), ('c', 'd'), ('v', 'q'))
+INTERVAL_SECONDS = {
+    '1min': 60, '2min': 120, '3min': 180, '5min': 300, '10min': 600, '15min': 900,
+    '30min': 1800, 'hour': 3600, 'day': 86400, 'week': 604800, 'month': 2592000}
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+RANGES = "ranges.json"
+
+
+def to_epoch(time) -> int:
+
+    """ Candle time to epoch seconds
+        Input:
+            time: str '2021-03-18T04:00:00Z' or datetime, naive is utc """
+
+    if isinstance(time, str):
+        time = datetime.fromisoformat(time.replace('Z', '+00:00'))
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return int(time.timestamp())
+
+
+def from_epoch(time: int) -> str:
+
+    """ Epoch seconds to candle time string '2021-03-18T04:00:00Z' """
+
+    return datetime.fromtimestamp(time, timezone.utc).strftime(TIME_FORMAT)
+
+
+class CandleStore(object):
+
+    """ Persistent candles, one append-only column file per field
+        for every (figi, interval) series:
+            path/figi/interval/{time,o,h,l,c,v}.col, ranges.json
+        ranges.json keeps the time ranges already fetched,
+        so only the tail and gaps are requested again """
+
+    def __init__(self, path: str = "candles", min_gap: int = None):
+
+        """ Input:
+                path: str, store directory,
+                min_gap: int, seconds, shorter gaps inside the fetched ranges are
+                    served from the store, the tail is always fetched,
+                    default is one candle interval """
+
+        self.path = path
+        self.min_gap = min_gap
+        self.lock = threading.RLock()
+
+
+    def _dir(self, figi: str, interval: str) -> str:
+        return os.path.join(self.path, figi, interval)
+
+
+    def _file(self, figi: str, interval: str, column: str) -> str:
+        return os.path.join(self._dir(figi, interval), column + ".col")
+
+
+    def ranges(self, figi: str, interval: str) -> list:
+
+        """ Get fetched time ranges
+            Output: list = [[start, end]], epoch seconds """
+
+        try:
+            with open(os.path.join(self._dir(figi, interval), RANGES)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+
+    def _save_ranges(self, figi: str, interval: str, ranges: list):
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        path = os.path.join(self._dir(figi, interval), RANGES)
+        with open(path + ".tmp", "w") as f:
+            json.dump(merged, f)
+        os.replace(path + ".tmp", path)
+
+
+    def missing(self, figi: str, interval: str, _from: datetime, to: datetime) -> list:
+
+        """ Get time ranges not in the store yet, the tail starts
+            at the last stored candle, it may be still forming,
+            interior gaps shorter than min_gap are skipped
+        Input:
+            figi: str,
+            interval: str,
+            _from: datetime, utc,
+            to: datetime, utc
+        Output:
+            list = [(from, to)], naive utc datetimes """
+
+        start, end = to_epoch(_from), to_epoch(to)
+        min_gap = self.min_gap if self.min_gap is not None else INTERVAL_SECONDS.get(interval, 0)
+        ranges = self.ranges(figi, interval)
+        times = self.read(figi, interval)['time']
+        last = times[-1] if len(times) else None
+
+        gaps, cursor = [], start
+        for r_start, r_end in ranges:
+            if r_end <= cursor:
+                continue
+            if r_start > cursor:
+                gap = [cursor, min(r_start, end)]
+                if gap[1] - gap[0] >= min_gap:
+                    gaps.append(gap)
+            cursor = max(cursor, r_end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            # the tail is always fetched, its last candle may have changed
+            tail = [cursor, end]
+            if ranges and last is not None and cursor == ranges[-1][1]:
+                tail[0] = max(start, min(cursor, last))
+            gaps.append(tail)
+
+        return [(datetime.utcfromtimestamp(s), datetime.utcfromtimestamp(e))
+            for s, e in gaps if e - s > 0]
+
+
+    def append(self, figi: str, interval: str, candles: list, _from: datetime, to: datetime):
+
+        """ Add fetched candles and mark time range as fetched,
+            newer candles are appended, a candle with the last stored time replaces it,
+            older candles (gaps) rewrite the series in time order
+        Input:
+            figi: str,
+            interval: str,
+            candles: list, candles from the API,
+            _from: datetime, utc,
+            to: datetime, utc """
+
+        with self.lock:
+            self._append(figi, interval, candles, _from, to)
+
+
+    def _append(self, figi: str, interval: str, candles: list, _from: datetime, to: datetime):
+        os.makedirs(self._dir(figi, interval), exist_ok=True)
+        rows = sorted((to_epoch(c['time']), c['o'], c['h'], c['l'], c['c'], c['v'])
+            for c in candles)
+        times = self.read(figi, interval)['time']
+        last = times[-1] if len(times) else None
+
+        if rows and last is not None and rows[0][0] < last:
+            self._rewrite(figi, interval, rows)
+        elif rows:
+            if rows[0][0] == last:
+                self._write(figi, interval, rows[:1], offset=len(times) - 1)
+                rows = rows[1:]
+            self._write(figi, interval, rows)
+
+        self._save_ranges(
+            figi, interval, self.ranges(figi, interval) + [[to_epoch(_from), to_epoch(to)]])
+
+
+    def _write(self, figi: str, interval: str, rows: list, offset: int = None):
+        for i, (column, typecode) in enumerate(COLUMNS):
+            data = array(typecode, (row[i] for row in rows))
+            path = self._file(figi, interval, column)
+            if offset is None:
+                with open(path, "ab") as f:
+                    f.write(data.tobytes())
+            else:
+                with open(path, "r+b") as f:
+                    f.seek(offset * data.itemsize)
+                    f.write(data.tobytes())
+
+
+    def _rewrite(self, figi: str, interval: str, rows: list):
+        columns = self.read(figi, interval)
+        merged = {row[0]: row for row in zip(*(columns[c] for c, _ in COLUMNS))}
+        merged.update((row[0], row) for row in rows)
+        for column, _ in COLUMNS:
+            path = self._file(figi, interval, column)
+            if os.path.exists(path):
+                os.replace(path, path + ".old")
+        self._write(figi, interval, [merged[t] for t in sorted(merged)])
+        for column, _ in COLUMNS:
+            path = self._file(figi, interval, column)
+            if os.path.exists(path + ".old"):
+                os.remove(path + ".old")
+
+
+    def read(self, figi: str, interval: str, _from: datetime = None, to: datetime = None) -> dict:
+
+        """ Get series columns, zero-copy slices of the memory-mapped files
+        Input:
+            figi: str,
+            interval: str,
+            _from: datetime, utc, optional,
+            to: datetime, utc, optional
+        Output:
+            columns: dict = {'time': memoryview, 'o': memoryview, ...} """
+
+        columns = {}
+        for column, typecode in COLUMNS:
+            try:
+                with open(self._file(figi, interval, column), "rb") as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                columns[column] = memoryview(data).cast(typecode)
+            except (FileNotFoundError, ValueError):
+                columns[column] = memoryview(array(typecode))
+
+        times = columns['time']
+        size = min(len(col) for col in columns.values())
+        start = bisect_left(times, to_epoch(_from), 0, size) if _from else 0
+        end = bisect_right(times, to_epoch(to), 0, size) if to else size
+
+        return {column: columns[column][start:end] for column in columns}
+
+
+    def candles(self, figi: str, interval: str, _from: datetime = None, to: datetime = None) -> list:
+
+        """ Get series in the API format
+            Output: candles: list = [{'o','c','h','l','v','time','interval','figi'}] """
+
+        columns = self.read(figi, interval, _from, to)
+
+        return [{'o': o, 'c': c, 'h': h, 'l': l, 'v': v, 'time': from_epoch(time),
+                'interval': interval, 'figi': figi}
+            for time, o, h, l, c, v in zip(*(columns[c] for c, _ in COLUMNS))]
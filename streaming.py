@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import json
+import asyncio
+import aiohttp
+from market import MSG_ERR
+
+
+MSG_STREAM = "Stream. {}"
+MSG_STREAM_ERR = MSG_ERR + MSG_STREAM
+MSG_RECONNECT = "Reconnect in {} sec: {}"
+MSG_CONNECT = "Can not connect to {}: {}"
+MSG_CONNECT_TIMEOUT = "no connection in {} sec"
+MSG_NO_QUEUE = "queue_size=0 disables the queue, events go to callbacks only"
+STREAM_URL = "wss://api-invest.tinkoff.ru/openapi/md/v1/md-openapi/ws"
+QUEUE_SIZE = 1000
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+CONNECT_TIMEOUT = 10
+
+
+class MarketStream(object):
+
+    """ Streaming market data over one WebSocket connection
+        https://tinkoffcreditsystems.github.io/invest-openapi/marketdata/
+        Events are delivered to callbacks and, once iteration has started,
+        to the async iterator, a full queue stops reading from the socket (backpressure).
+        The first connection error is raised by connect(), a connection
+        lost later is reconnected in background
+    Usage:
+        async with MarketStream(client.token) as stream:
+            await stream.subscribe_candles("BBG000HLJ7M4", "1min")
+            async for event in stream:
+                print(event['event'], event['payload']) """
+
+    def __init__(self,
+        token: str,
+        url: str = STREAM_URL,
+        queue_size: int = QUEUE_SIZE,
+        reconnect_delay: float = RECONNECT_DELAY,
+        max_reconnect_delay: float = MAX_RECONNECT_DELAY,
+        connect_timeout: float = CONNECT_TIMEOUT):
+
+        """ Input:
+                token: str, API token,
+                url: str, optional, e.g. local stand-in,
+                queue_size: int, events buffered for the iterator, 0 disables the queue,
+                reconnect_delay: float, seconds, doubled on every failed attempt,
+                max_reconnect_delay: float, seconds,
+                connect_timeout: float, seconds connect() waits for the first connection """
+
+        self.url = url
+        self.headers = {"Authorization": "Bearer " + token}
+        self.queue = asyncio.Queue(queue_size) if queue_size else None
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connect_timeout = connect_timeout
+        self.iterating = False
+        self.ready = None
+        self.subscriptions = {}
+        self.callbacks = {}
+        self.session = None
+        self.ws = None
+        self.task = None
+        self.connected = asyncio.Event()
+        self.closed = False
+
+
+    def on(self, event: str, callback):
+
+        """ Add callback for the event type
+            Input:
+                event: str, 'candle', 'orderbook', 'instrument_info', 'error' or '*',
+                callback: function or coroutine function, callback(event: dict) """
+
+        self.callbacks.setdefault(event, []).append(callback)
+
+
+    async def connect(self):
+
+        """ Start connection loop in background task,
+            wait for the first connection, raise Exception if it fails or times out """
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        if self.task is None:
+            self.ready = asyncio.get_running_loop().create_future()
+            self.task = asyncio.ensure_future(self._run())
+        try:
+            await asyncio.wait_for(asyncio.shield(self.ready), self.connect_timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise Exception(MSG_STREAM_ERR.format(
+                MSG_CONNECT.format(self.url, MSG_CONNECT_TIMEOUT.format(self.connect_timeout))))
+        except Exception as e:
+            await self.close()
+            raise Exception(MSG_STREAM_ERR.format(MSG_CONNECT.format(self.url, e)))
+        return self
+
+
+    async def close(self):
+
+        """ Stop connection loop and close the socket """
+
+        self.closed = True
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.ws is not None:
+            await self.ws.close()
+        if self.session is not None:
+            await self.session.close()
+        # wake the iterator, a full queue is drained first, see __anext__
+        if self.queue is not None and not self.queue.full():
+            self.queue.put_nowait(None)
+
+
+    async def __aenter__(self):
+        return await self.connect()
+
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+    def __aiter__(self):
+        if self.queue is None:
+            raise Exception(MSG_STREAM_ERR.format(MSG_NO_QUEUE))
+        self.iterating = True
+        return self
+
+
+    async def __anext__(self):
+        if self.closed and self.queue.empty():
+            raise StopAsyncIteration
+        event = await self.queue.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+    async def _run(self):
+
+        """ Read events, reconnect with backoff and resubscribe """
+
+        delay = self.reconnect_delay
+        while not self.closed:
+            try:
+                async with self.session.ws_connect(self.url, headers=self.headers, heartbeat=30) as ws:
+                    self.ws = ws
+                    for message in list(self.subscriptions.values()):
+                        await ws.send_str(json.dumps(message))
+                    self.connected.set()
+                    if not self.ready.done():
+                        self.ready.set_result(True)
+                    delay = self.reconnect_delay
+                    async for message in ws:
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            await self._dispatch(json.loads(message.data))
+                        elif message.type == aiohttp.WSMsgType.ERROR:
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not self.ready.done():
+                    self.ready.set_exception(e)
+                    return
+                await self._dispatch({"event": "error", "payload": {
+                    "error": MSG_STREAM_ERR.format(MSG_RECONNECT.format(delay, e))}})
+            finally:
+                self.ws = None
+                self.connected.clear()
+
+            if not self.closed:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+
+    async def _dispatch(self, event: dict):
+        for callback in self.callbacks.get(event.get("event"), []) + self.callbacks.get("*", []):
+            res = callback(event)
+            if asyncio.iscoroutine(res):
+                await res
+        if self.queue is not None and self.iterating:
+            await self.queue.put(event)
+
+
+    async def _send(self, key: tuple, message: dict, subscribe: bool = True):
+        if subscribe:
+            self.subscriptions[key] = message
+        else:
+            self.subscriptions.pop(key, None)
+        if self.ws is not None and not self.ws.closed:
+            await self.ws.send_str(json.dumps(message))
+
+
+    async def subscribe_candles(self, figi: str, interval: str):
+
+        """ Input:
+                figi: str,
+                interval: str, see Market.get_candles """
+
+        message = {"event": "candle:subscribe", "figi": figi, "interval": interval}
+        await self._send(("candle", figi, interval), message)
+
+
+    async def unsubscribe_candles(self, figi: str, interval: str):
+        message = {"event": "candle:unsubscribe", "figi": figi, "interval": interval}
+        await self._send(("candle", figi, interval), message, subscribe=False)
+
+
+    async def subscribe_orderbook(self, figi: str, depth: int = 20):
+
+        """ Input:
+                figi: str,
+                depth: int, 1..20 """
+
+        message = {"event": "orderbook:subscribe", "figi": figi, "depth": depth}
+        await self._send(("orderbook", figi, depth), message)
+
+
+    async def unsubscribe_orderbook(self, figi: str, depth: int = 20):
+        message = {"event": "orderbook:unsubscribe", "figi": figi, "depth": depth}
+        await self._send(("orderbook", figi, depth), message, subscribe=False)
+
+
+    async def subscribe_instrument_info(self, figi: str):
+        message = {"event": "instrument_info:subscribe", "figi": figi}
+        await self._send(("instrument_info", figi), message)
+
+
+    async def unsubscribe_instrument_info(self, figi: str):
+        message = {"event": "instrument_info:unsubscribe", "figi": figi}
+        await self._send(("instrument_info", figi), message, subscribe=False)
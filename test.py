@@ -52,8 +52,8 @@ def handle_error(func):
     return wrapper
 
 @handle_error
-def exec_function(func):
-    return func
+def exec_function(func, *args):
+    return func(*args)
 
 
 def main(token=TOKEN):
@@ -65,13 +65,13 @@ def main(token=TOKEN):
     else:
         client = Orders()
     print(Style.BOLD + Style.GREEN + 'done' + Style.RESET)
-    print('* debug:', client.last_response.url, '\n')
+    print('* debug:', client.api_url, '\n')
 
     print("get token:", client._get_from_db("token"))
     print("get account_id:", client._get_from_db("account_id"))
 
     print('Get list of user accounts... ', end='', flush=True)
-    accounts = exec_function(client.get_user_accounts())
+    accounts = exec_function(client.get_user_accounts)
     print('result:', accounts)
     if isinstance(accounts, list):
         for acc in accounts:
@@ -79,7 +79,7 @@ def main(token=TOKEN):
     print('* debug:', client.last_response.url, '\n')
 
     print('Get list of currency assets... ', end='', flush=True)
-    currencies = exec_function(client.get_currencies())
+    currencies = exec_function(client.get_currencies)
     print('done:', currencies)
     if isinstance(currencies, list):
         for curr in currencies:
@@ -87,7 +87,7 @@ def main(token=TOKEN):
     print('* debug:', client.last_response.url, '\n')
 
     print('Get stocks... ', end='', flush=True)
-    stocks = exec_function(client.get_market('stocks'))
+    stocks = exec_function(client.get_market, 'stocks')
     if isinstance(stocks, list):
         print(stocks[0])
     else:
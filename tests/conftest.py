@@ -0,0 +1,49 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_server import serve
+from orders import Orders
+from retry import RetryPolicy
+
+
+TOKEN = "test"
+
+
+@pytest.fixture
+def server():
+    server = serve(port=0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_client(server, tmp_path):
+
+    """ Sandbox client of the stand-in server, clients of one test share the db """
+
+    def make(**kwargs):
+        kwargs.setdefault("retry", RetryPolicy(backoff=0.01))
+        return Orders(db=str(tmp_path / "test.db"), token=TOKEN, api_url=server.api_url, **kwargs)
+
+    return make
+
+
+def once(route, code, message, error="Error"):
+
+    """ Route answering with an error the first time """
+
+    from fake_server import _error
+
+    calls = []
+
+    def respond(query, body):
+        calls.append(1)
+        if len(calls) == 1:
+            return _error(code, message, error)
+        return route(query, body)
+
+    return respond
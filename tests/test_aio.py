@@ -0,0 +1,56 @@
+import asyncio
+from aio import AsyncOrders
+from conftest import once
+
+
+FIGI = "BBG000HLJ7M4"
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+def test_operations_in_one_request(make_client, server, tmp_path):
+    client = make_client()
+    payload = {"lots": 1, "operation": "Buy"}
+    assert isinstance(client._send_request(
+        client.api_url + "/orders/market-order", {"figi": FIGI}, payload), dict)
+
+    async def operations():
+        async with AsyncOrders(
+                db=str(tmp_path / "test.db"), token="test", api_url=server.api_url) as aclient:
+            return await aclient.get_operations(
+                depth=1, instruments=[{"figi": FIGI}, {"figi": "BBG000000000"}])
+
+    instruments = run(operations())
+    assert server.requests["/operations"] == 1
+    assert instruments[0]["operations"] and all(
+        op["figi"] == FIGI for op in instruments[0]["operations"])
+    assert instruments[1]["operations"] == []
+
+
+def test_reregister_invalid_cached_account(make_client, server, tmp_path):
+    make_client().register()
+    server.routes["/portfolio"] = once(
+        server.routes["/portfolio"], 400, "Account not found", "BrokerAccountNotFound")
+
+    async def portfolio():
+        async with AsyncOrders(
+                db=str(tmp_path / "test.db"), token="test", api_url=server.api_url) as aclient:
+            return await aclient.get_portfolio()
+
+    assert run(portfolio()) == []
+    assert server.requests["/sandbox/register"] == 2
+
+
+def test_error_without_payload(make_client, server, tmp_path):
+    make_client().register()
+    server.routes["/portfolio"] = lambda query, body: (502, {"message": "Bad gateway"})
+
+    async def portfolio():
+        async with AsyncOrders(
+                db=str(tmp_path / "test.db"), token="test", api_url=server.api_url) as aclient:
+            return await aclient.get_portfolio()
+
+    error = run(portfolio())
+    assert "502" in error and "Bad gateway" in error
@@ -0,0 +1,94 @@
+from array import array
+import pytest
+from backtest import Backtest
+from candles import CandleSeries
+
+
+USD, RUB = "BBG000HLJ7M4", "BBG004730N88"
+T0 = 1616061600  # 2021-03-18T10:00:00Z
+
+
+def series(figi, candles):
+    """ candles: list of (o, h, l, c) """
+    return CandleSeries(figi, "1min", array('q', [T0 + 60 * i for i in range(len(candles))]),
+        *(array('d', [candle[k] for candle in candles]) for k in range(4)),
+        array('q', [100] * len(candles)))
+
+
+def broker(*args, **kwargs):
+    kwargs.setdefault("instruments", [
+        {"figi": USD, "currency": "USD", "lot": 1}, {"figi": RUB, "currency": "RUB", "lot": 10}])
+    return Backtest(list(args), **kwargs)
+
+
+def test_market_order_fills_at_next_open_with_slippage():
+    b = broker(series(USD, [(10, 10, 10, 10), (11, 12, 10, 12)]), commission=0.001, slippage=0.01)
+    replay = b.replay()
+    next(replay)
+    assert b.place_order(USD, 2, "Buy", None)["status"] == "New"
+    assert b.get_portfolio() == []
+    next(replay)
+    price = 11 * 1.01
+    assert b.get_operations()[0]["price"] == pytest.approx(price)
+    assert b.cash["USD"] == pytest.approx(100000 - 2 * price * 1.001)
+    assert b.get_portfolio()[0]["expectedYield"]["value"] == pytest.approx((12 - price) * 2)
+
+
+def test_limit_order_fills_at_limit_or_better_open():
+    b = broker(series(USD, [(10, 10, 10, 10), (10, 10.5, 9, 9.5), (8, 8.5, 7.5, 8), (9, 9, 9, 9)]),
+        commission=0)
+    replay = b.replay()
+    next(replay)
+    b.place_order(USD, 1, "Buy", 9.2)  # the low reaches the limit
+    b.place_order(USD, 1, "Buy", 8.5)  # not reached, the next candle opens below
+    b.place_order(USD, 1, "Sell", 20)  # never reached
+    next(replay)
+    assert [op["price"] for op in b.get_operations()] == [9.2]
+    next(replay)
+    assert [op["price"] for op in b.get_operations()] == [9.2, 8]
+    assert [order["price"] for order in b.get_orders()] == [20]
+    list(replay)
+    assert b.get_portfolio()[0]["lots"] == 2
+
+
+def test_cancel_and_client_order_id():
+    b = broker(series(USD, [(10, 10, 10, 10), (10, 10, 10, 10)]))
+    replay = b.replay()
+    next(replay)
+    first = b.place_order(USD, 1, "Buy", 5, client_order_id="a")
+    assert b.place_order(USD, 1, "Buy", 5, client_order_id="a") == first
+    assert b.cancel_order(first["orderId"]) == {}
+    assert "not found" in b.cancel_order(first["orderId"])
+    assert "no candles" in b.place_order("UNKNOWN", 1, "Buy", None)
+    list(replay)
+    assert b.get_orders() == [] and b.get_operations() == []
+
+
+def test_report_per_currency():
+    def strategy(b):
+        if b.now == T0:
+            b.place_order(USD, 1, "Buy", None)
+            b.place_order(RUB, 1, "Buy", None)
+
+    b = broker(series(USD, [(100, 100, 100, 100), (100, 100, 50, 50), (100, 200, 100, 200)]),
+        series(RUB, [(10, 10, 10, 10), (10, 10, 10, 10), (10, 10, 10, 10)]),
+        commission=0, slippage=0, cash=1000)
+    report = b.run(strategy)
+
+    usd, rub = report["currencies"]["USD"], report["currencies"]["RUB"]
+    assert usd["equity"] == pytest.approx(1100) and usd["return"] == pytest.approx(0.1)
+    assert usd["max_drawdown"] == pytest.approx(0.05)
+    assert rub["equity"] == pytest.approx(1000) and rub["return"] == pytest.approx(0)
+    assert (report["fills"], report["candles"]) == (2, 3)
+
+
+def test_single_instrument_report_matches_replay_of_many():
+    candles = [(10, 11, 9, 10), (10, 12, 9, 11), (11, 11, 8, 9), (9, 10, 9, 10)]
+
+    def strategy(b):
+        if b.now == T0:
+            b.place_order(USD, 3, "Buy", None)
+
+    one = broker(series(USD, candles)).run(strategy)
+    many = broker(series(USD, candles), series(RUB, [(10, 10, 10, 10)])).run(strategy)
+    assert one["currencies"]["USD"] == many["currencies"]["USD"]
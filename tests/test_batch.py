@@ -0,0 +1,33 @@
+from ratelimit import RATE_LIMITS, RateLimiter
+
+
+FIGI, ETF = "BBG000HLJ7M4", "BBG00QPYJ5H0"
+
+
+def test_place_orders_keeps_order_and_counts_failures(make_client, server):
+    client = make_client(limiter=RateLimiter({group: 10**9 for group in RATE_LIMITS}))
+    orders = [{"figi": FIGI, "lots": 1, "op": "Buy", "price": 10 + i} for i in range(8)]
+    orders.insert(3, {"figi": FIGI, "lots": 0, "op": "Buy", "price": 10})
+    batch = client.place_orders(orders, workers=4)
+
+    assert [result["request"] for result in batch["results"]] == orders
+    assert batch["results"][3]["result"] is None and "Invalid order" in batch["results"][3]["error"]
+    assert all(result["result"]["status"] == "New"
+        for i, result in enumerate(batch["results"]) if i != 3)
+    report = batch["report"]
+    assert (report["total"], report["ok"], report["failed"]) == (9, 8, 1)
+    assert len(server.orders) == 8
+
+
+def test_cancel_all_of_one_instrument(make_client, server):
+    client = make_client()
+    client.place_orders([
+        {"figi": FIGI, "lots": 1, "op": "Buy", "price": 10},
+        {"figi": FIGI, "lots": 1, "op": "Sell", "price": 90},
+        {"figi": ETF, "lots": 1, "op": "Buy", "price": 10}])
+
+    assert client.cancel_all(figi=FIGI)["report"]["ok"] == 2
+    assert [order["figi"] for order in server.orders.values()] == [ETF]
+    assert client.cancel_all()["report"]["ok"] == 1
+    assert client.cancel_all()["report"]["total"] == 0
+    assert server.orders == {}
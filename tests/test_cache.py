@@ -0,0 +1,54 @@
+import threading
+from cache import ResponseCache
+from conftest import once
+
+
+def call(func, timeout=10):
+
+    """ Run func in a thread, None if it does not return in time """
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return result[0] if result else None
+
+
+def test_cached_get(make_client, server):
+    client = make_client(cache=ResponseCache())
+    assert client.get_portfolio() == client.get_portfolio() == []
+    assert server.requests["/portfolio"] == 1
+
+
+def test_post_invalidates(make_client, server):
+    client = make_client(cache=ResponseCache())
+    assert client.get_orders() == []
+    client.place_order("BBG000HLJ7M4", 1, "Buy", 10)
+    assert len(client.get_orders()) == 1
+    assert server.requests["/orders"] == 2
+
+
+def test_coalesced_gets(make_client, server):
+    server.latency = 0.2
+    client = make_client(cache=ResponseCache(ttls={}))
+    client.register()
+    threads = [threading.Thread(target=client.get_portfolio) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert server.requests["/portfolio"] == 1
+    assert client.cache.coalesced == 7
+
+
+def test_reregister_inside_cache(make_client, server):
+    # cached sandbox account is gone on the server: register again and resend
+    make_client().register()
+    client = make_client(cache=ResponseCache())
+    assert client.cached_account
+    server.routes["/portfolio"] = once(
+        server.routes["/portfolio"], 400, "Account not found", "BrokerAccountNotFound")
+
+    assert call(client.get_portfolio) == []
+    assert client.registered and not client.cached_account
+    assert server.requests["/sandbox/register"] == 2
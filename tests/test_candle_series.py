@@ -0,0 +1,48 @@
+from datetime import datetime
+from candles import CandleSeries, parse_times
+from store import CandleStore, to_epoch
+
+
+FIGI = "BBG000HLJ7M4"
+
+
+def candles(start, end, close=1.):
+    return [{"o": close, "c": close, "h": close + 1, "l": close - 1, "v": m,
+        "time": "2021-03-18T10:{:02d}:00Z".format(m), "interval": "1min", "figi": FIGI}
+        for m in range(start, end)]
+
+
+def test_parse_times():
+    times = ["2021-03-18T04:00:00Z", "2021-03-18T23:59:59Z", "2021-03-19T04:00:00+03:00"]
+    assert list(parse_times(times)) == [to_epoch(time) for time in times]
+
+
+def test_round_trip():
+    series = CandleSeries.from_candles(candles(0, 5))
+    assert (series.figi, series.interval, len(series)) == (FIGI, "1min", 5)
+    assert series.to_candles() == candles(0, 5)
+    assert series[2] == candles(0, 5)[2]
+    assert series[1:3].to_candles() == candles(1, 3)
+
+
+def test_between_is_inclusive():
+    series = CandleSeries.from_candles(candles(0, 10))
+    part = series.between("2021-03-18T10:02:00Z", datetime(2021, 3, 18, 10, 4))
+    assert [candle["v"] for candle in part.to_candles()] == [2, 3, 4]
+    assert len(series.between(to=to_epoch("2021-03-18T09:00:00Z"))) == 0
+
+
+def test_extend_replaces_last_candle():
+    series = CandleSeries.from_candles(candles(0, 3))
+    series.extend(CandleSeries.from_candles(candles(2, 5, close=2.)))
+    assert [candle["c"] for candle in series.to_candles()] == [1., 1., 2., 2., 2.]
+    assert series.extend(CandleSeries(FIGI, "1min")) is series
+
+
+def test_extend_store_series_copies(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.append(FIGI, "1min", candles(0, 3), datetime(2021, 3, 18, 10), datetime(2021, 3, 18, 10, 3))
+    series = CandleSeries.from_columns(FIGI, "1min", store.read(FIGI, "1min"))
+    series.extend(CandleSeries.from_candles(candles(3, 4)))
+    assert len(series) == 4
+    assert len(store.read(FIGI, "1min")["time"]) == 3
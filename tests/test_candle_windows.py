@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from market import candle_windows, merge_candles
+
+
+FIGI = "BBG000HLJ7M4"
+T0 = datetime(2021, 3, 18, 10, 0)
+
+
+def test_windows_split_at_depth_limit():
+    windows = candle_windows(T0, T0 + timedelta(days=2, hours=12), "1min")
+    assert windows == [
+        ("2021-03-18T10:00:00+00:00", "2021-03-19T10:00:00+00:00"),
+        ("2021-03-19T10:00:00+00:00", "2021-03-20T10:00:00+00:00"),
+        ("2021-03-20T10:00:00+00:00", "2021-03-20T22:00:00+00:00")]
+
+
+def test_window_at_exact_limit_is_one_request():
+    assert len(candle_windows(T0, T0 + timedelta(days=7), "hour")) == 1
+    assert len(candle_windows(T0, T0 + timedelta(days=7, seconds=1), "hour")) == 2
+    assert candle_windows(T0, T0, "day") == [("2021-03-18T10:00:00+00:00",) * 2]
+
+
+def test_merge_deduplicates_across_boundary():
+    first = [{"time": "2021-03-18T10:00:00Z", "c": 1}, {"time": "2021-03-18T10:01:00Z", "c": 1}]
+    second = [{"time": "2021-03-18T10:01:00Z", "c": 2}, {"time": "2021-03-18T10:02:00Z", "c": 2}]
+    merged = merge_candles([second, first])
+    assert [c["time"][11:16] for c in merged] == ["10:00", "10:01", "10:02"]
+    # the candle of the last chunk wins
+    assert merged[1]["c"] == 1
+
+
+def test_long_range_is_fetched_in_windows(make_client, server):
+    client = make_client()
+    instruments = client.get_candles([{"figi": FIGI}], depth=2.5, interval="1min", workers=0)
+    times = [candle["time"] for candle in instruments[0]["candles"]]
+    assert server.requests["/market/candles"] == 3
+    assert times == sorted(set(times))
+    assert len(times) >= 2.5 * 24 * 60 - 1
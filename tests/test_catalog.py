@@ -0,0 +1,33 @@
+import time
+from catalog import InstrumentCatalog
+
+
+def test_instruments_are_copies(make_client, server, tmp_path):
+    catalog = InstrumentCatalog(make_client(), db=str(tmp_path / "catalog"))
+    ticker = server.stocks[0]["ticker"]
+
+    instrument = catalog.get_instruments_by_tickers((ticker, "UNKNOWN"))[0]
+    instrument["candles"] = "Error"
+    catalog.get_by_ticker(ticker)["orders"] = []
+
+    assert "candles" not in catalog.get_by_ticker(ticker)
+    assert "orders" not in catalog.get_by_figi(instrument["figi"])
+    assert catalog.get_by_ticker("UNKNOWN") is None
+
+
+def test_unchanged_market_is_not_indexed_again(make_client, tmp_path):
+    catalog = InstrumentCatalog(make_client(), db=str(tmp_path / "catalog")).load()
+    by_ticker = catalog.by_ticker
+    assert catalog.load(force=True).by_ticker is by_ticker
+
+
+def test_outage_is_not_hammered(make_client, server, tmp_path):
+    catalog = InstrumentCatalog(
+        make_client(), db=str(tmp_path / "catalog"), markets=("stocks",), ttl=0.2, retry_ttl=60)
+    ticker = catalog.load().instruments[0]["ticker"]
+    time.sleep(0.3)
+
+    server.routes["/market/stocks"] = lambda query, body: (500, {"payload": {"message": "Down"}})
+    for _ in range(5):
+        assert catalog.get_by_ticker(ticker)["ticker"] == ticker
+    assert server.requests["/market/stocks"] == 2 + catalog.client.retry.retries
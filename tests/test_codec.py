@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from aio import AsyncOrders
+from cache import ResponseCache
+from codec import CODECS, INSTALLED
+from models import Instrument, Order
+
+
+FIGI = "BBG000HLJ7M4"
+
+
+def counting(name):
+    # decode must be called on the response bytes, not convert on dicts
+    class Codec(CODECS[name]):
+        decoded = 0
+
+        def decode(self, data, model, key=None):
+            assert isinstance(data, bytes)
+            Codec.decoded += 1
+            return super().decode(data, model, key)
+
+    return Codec()
+
+
+@pytest.mark.parametrize("name", [name for name in CODECS if INSTALLED[name]])
+def test_typed_getters_decode_bytes(make_client, server, name):
+    codec = counting(name)
+    client = make_client(codec=codec)
+    client.place_order(FIGI, 1, "Buy", 10)
+
+    instruments = client.get_market("stocks", typed=True)
+    assert isinstance(instruments[0], Instrument)
+    assert instruments[0].figi == server.stocks[0]["figi"]
+    assert all(isinstance(order, Order) for order in client.get_orders(typed=True))
+    assert client.get_orders(typed=True)[0].requested_lots == 1
+    assert client.get_portfolio(typed=True) == []
+    assert isinstance(client.get_operations(depth=1, typed=True), list)
+    assert codec.decoded == 5
+
+
+def test_typed_and_dict_responses_are_cached_apart(make_client, server):
+    client = make_client(cache=ResponseCache())
+    assert isinstance(client.get_market("stocks")[0], dict)
+    assert isinstance(client.get_market("stocks", typed=True)[0], Instrument)
+    assert isinstance(client.get_market("stocks", typed=True)[0], Instrument)
+    assert isinstance(client.get_market("stocks")[0], dict)
+    assert server.requests["/market/stocks"] == 2
+
+
+def test_async_typed_getters(make_client, server, tmp_path):
+    client = make_client()
+    client.place_order(FIGI, 1, "Buy", 10)
+
+    async def typed():
+        async with AsyncOrders(
+                db=str(tmp_path / "test.db"), token="test", api_url=server.api_url) as aclient:
+            return (await aclient.get_market("stocks", typed=True),
+                await aclient.get_orders(typed=True),
+                await aclient.get_portfolio(typed=True),
+                await aclient.get_operations(depth=1, typed=True))
+
+    instruments, orders, positions, operations = asyncio.run(asyncio.wait_for(typed(), 10))
+    assert isinstance(instruments[0], Instrument)
+    assert isinstance(orders[0], Order) and orders[0].figi == FIGI
+    assert positions == [] and operations == []
@@ -0,0 +1,26 @@
+import numpy as np
+import indicators
+
+
+def candle(time, close, volume=1):
+    return {"time": time, "o": close, "h": close, "l": close, "c": close, "v": volume}
+
+
+def test_matrix_aligns_and_fills():
+    m = indicators.matrix([
+        {"figi": "A", "candles": [candle("2020-01-01T00:00:00Z", 1), candle("2020-01-03T00:00:00Z", 3)]},
+        {"figi": "B", "candles": [candle("2020-01-02T00:00:00Z", 2)]}])
+    assert m["figi"] == ["A", "B"]
+    assert m["c"][0].tolist() == [1, 1, 3]
+    assert m["v"][0].tolist() == [1, 0, 1]
+    assert np.isnan(m["c"][1, 0]) and m["c"][1, 1:].tolist() == [2, 2]
+    assert m["errors"] == {}
+
+
+def test_matrix_skips_errors():
+    m = indicators.matrix([
+        {"figi": "A", "candles": [candle("2020-01-01T00:00:00Z", 1)]},
+        {"figi": "B", "candles": "Error 500. Response: Injected"}])
+    assert m["figi"] == ["A"]
+    assert m["c"].shape == (1, 1)
+    assert m["errors"] == {"B": "Error 500. Response: Injected"}
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+from ledger import OperationsLedger
+
+
+class Client(object):
+
+    """ Offline client, records the requested windows """
+
+    def __init__(self, operations):
+        self.operations = operations
+        self.windows = []
+
+
+    def get_operations(self, account_id=None, _from=None, to=None):
+        self.windows.append((_from, to))
+        return [op for op in self.operations
+            if _from.isoformat() <= op['date'][:19] <= to.isoformat()]
+
+
+def test_sync_resumes_from_last_sync(tmp_path):
+    old = (datetime.utcnow() - timedelta(days=90)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    client = Client([{"id": "1", "figi": "BBG000HLJ7M4", "date": old}])
+    ledger = OperationsLedger(client, db=str(tmp_path / "ledger"), overlap=timedelta(hours=1))
+
+    assert ledger.sync() == 1
+    assert ledger.sync() == 0
+    assert ledger.sync() == 0
+    (_, first_to), (second_from, second_to), (third_from, _) = client.windows
+    assert second_from == first_to.replace(microsecond=0) - timedelta(hours=1)
+    assert third_from == second_to.replace(microsecond=0) - timedelta(hours=1)
+    assert [op["id"] for op in ledger.get_operations()] == ["1"]
+
+
+def test_empty_account_syncs_only_overlap(tmp_path):
+    client = Client([])
+    ledger = OperationsLedger(client, db=str(tmp_path / "ledger"), overlap=timedelta(hours=1))
+    ledger.sync()
+    ledger.sync()
+    _from, to = client.windows[1]
+    assert to - _from < timedelta(hours=1, seconds=1)
@@ -0,0 +1,58 @@
+import random
+from orderbook import OrderBook
+
+
+FIGI = "BBG000HLJ7M4"
+
+
+def book(bids, asks):
+    return OrderBook.from_payload({"figi": FIGI, "bids": bids, "asks": asks}, 0.)
+
+
+def apply(levels, changes, reverse):
+    levels = dict(levels)
+    for price, quantity in changes:
+        if quantity:
+            levels[price] = quantity
+        else:
+            del levels[price]
+    return sorted(levels.items(), reverse=reverse)
+
+
+def test_snapshot():
+    snapshot = OrderBook.from_payload({"figi": FIGI,
+        "bids": [{"price": 99.9, "quantity": 3}], "asks": [[100.1, 5], [100.2, 1]]})
+    assert (snapshot.best_bid, snapshot.best_ask) == (99.9, 100.1)
+    assert round(snapshot.spread, 6) == 0.2
+    assert snapshot.to_payload()["asks"] == [
+        {"price": 100.1, "quantity": 5}, {"price": 100.2, "quantity": 1}]
+    assert book([], []).spread is None
+
+
+def test_diff_added_removed_and_changed_levels():
+    old = book([[10, 1], [9, 2], [8, 3]], [[11, 1], [12, 2]])
+    new = book([[10, 1], [9, 5], [7, 1]], [[10.5, 4], [12, 2]])
+    assert new.diff(old) == {"figi": FIGI,
+        "bids": [(9, 5), (8, 0), (7, 1)],
+        "asks": [(10.5, 4), (11, 0)]}
+    assert new.diff(None)["bids"] == [(10, 1), (9, 5), (7, 1)]
+    assert new.diff(new) == {"figi": FIGI, "bids": [], "asks": []}
+
+
+def test_diff_applied_to_previous_gives_snapshot():
+    rng = random.Random(1)
+    for _ in range(200):
+        def side(reverse):
+            prices = rng.sample(range(90, 110), rng.randrange(6))
+            return sorted(((p, rng.randrange(1, 4)) for p in prices), reverse=reverse)
+        old_bids, old_asks, new_bids, new_asks = side(True), side(False), side(True), side(False)
+        changes = book(new_bids, new_asks).diff(book(old_bids, old_asks))
+        assert apply(old_bids, changes["bids"], True) == new_bids
+        assert apply(old_asks, changes["asks"], False) == new_asks
+
+
+def test_get_orderbooks(make_client, server):
+    client = make_client()
+    books = client.get_orderbooks([FIGI, "BBG00QPYJ5H0"], depth=5)
+    assert all(len(b.bid_prices) == 5 and b.best_bid < b.best_ask for b in books.values())
+    assert "Depth" in client.get_orderbooks([FIGI], depth=50)[FIGI]
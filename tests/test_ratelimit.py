@@ -0,0 +1,49 @@
+import time
+import multiprocessing
+from ratelimit import RATE_LIMITS, SharedRateLimiter, SharedTokenBucket, endpoint_group
+
+
+API = "https://api-invest.tinkoff.ru/openapi"
+
+
+def test_endpoint_groups():
+    assert endpoint_group(API + "/sandbox/market/candles?figi=X") == "market"
+    assert endpoint_group(API + "/orders/limit-order") == "limit-order"
+    assert endpoint_group(API + "/sandbox/orders") == "orders"
+    assert endpoint_group(API + "/sandbox/register") == "sandbox"
+    assert endpoint_group(API + "/user/accounts") == "user"
+    assert endpoint_group(API + "/unknown") == "user"
+
+
+def acquire(path, n):
+    bucket = SharedTokenBucket(path, rate=60, period=1, capacity=5)
+    for _ in range(n):
+        bucket.acquire()
+
+
+def test_bucket_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "bucket")
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=acquire, args=(path, 10)) for _ in range(3)]
+    start = time.monotonic()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    # 30 tokens, 5 of them from the burst, the rest at 60 per second
+    assert time.monotonic() - start >= 25 / 60 - 0.02
+    assert all(process.exitcode == 0 for process in processes)
+
+
+def test_groups_and_tokens_have_own_buckets(tmp_path):
+    limits = dict.fromkeys(RATE_LIMITS, 2)
+    limiter = SharedRateLimiter("token", path=str(tmp_path), limits=limits)
+    assert limiter.acquire(API + "/market/stocks") == 0
+    assert limiter.acquire(API + "/market/stocks") == 0
+    assert limiter.acquire(API + "/orders/limit-order") == 0
+    other = SharedRateLimiter("other", path=str(tmp_path), limits=limits)
+    assert other.acquire(API + "/market/stocks") == 0
+
+    # a second limiter of the same token sees the spent market tokens
+    same = SharedRateLimiter("token", path=str(tmp_path), limits=dict(limits, market=600))
+    assert same.acquire(API + "/market/stocks") > 0
@@ -0,0 +1,70 @@
+import random
+from candles import CandleSeries
+from store import to_epoch, from_epoch
+import resample
+from resample import Resampler, bucket, can_resample
+
+
+FIGI = "BBG000HLJ7M4"
+
+
+def minutes(start, n, seed=1):
+    rng = random.Random(seed)
+    series = CandleSeries(FIGI, "1min")
+    for i in range(n):
+        o = 100 + rng.random()
+        c = 100 + rng.random()
+        series.time.append(start + 60 * i)
+        series.o.append(o)
+        series.h.append(max(o, c) + rng.random())
+        series.l.append(min(o, c) - rng.random())
+        series.c.append(c)
+        series.v.append(rng.randrange(1, 100))
+    return series
+
+
+def test_can_resample():
+    assert can_resample("1min", "hour") and can_resample("5min", "week")
+    assert not can_resample("2min", "5min") and not can_resample("hour", "1min")
+    assert can_resample("day", "day") and not can_resample("day", "tick")
+
+
+def test_week_and_month_buckets():
+    assert from_epoch(bucket(to_epoch("2021-03-18T10:00:00Z"), "week")) == "2021-03-15T00:00:00Z"
+    assert from_epoch(bucket(to_epoch("2021-03-18T10:00:00Z"), "month")) == "2021-03-01T00:00:00Z"
+    assert from_epoch(bucket(to_epoch("2021-03-18T05:00:00Z"), "day", 7 * 3600)) == "2021-03-17T07:00:00Z"
+
+
+def test_hour_candles():
+    fine = minutes(to_epoch("2021-03-18T10:30:00Z"), 90)
+    hours = resample.resample(fine, "hour")
+    assert [from_epoch(t) for t in hours.time] == ["2021-03-18T10:00:00Z", "2021-03-18T11:00:00Z"]
+    assert hours.o[0] == fine.o[0] and hours.c[1] == fine.c[-1]
+    assert hours.h[0] == max(fine.h[:30]) and hours.l[1] == min(fine.l[30:])
+    assert sum(hours.v) == sum(fine.v)
+    assert "can not be built" in resample.resample(fine, "tick")
+
+
+def test_numpy_and_pure_python_agree():
+    fine = minutes(to_epoch("2021-03-18T00:00:00Z"), 3 * 24 * 60)
+    for interval, session in (("15min", None), ("hour", ("07:00", "15:40")), ("day", ("07:00", "15:40"))):
+        fast = resample._resample_numpy(fine, interval, resample.session_seconds(session))
+        slow = resample._resample(fine, interval, resample.session_seconds(session))
+        assert fast.to_candles() == slow.to_candles()
+
+
+def test_session_drops_candles_outside():
+    fine = minutes(to_epoch("2021-03-18T06:00:00Z"), 12 * 60)
+    days = resample.resample(fine, "day", session=("07:00", "15:40"))
+    assert [from_epoch(t) for t in days.time] == ["2021-03-18T07:00:00Z"]
+    assert days.v[0] == sum(fine.between("2021-03-18T07:00:00Z", "2021-03-18T15:39:00Z").v)
+
+
+def test_resampler_matches_one_shot():
+    fine = minutes(to_epoch("2021-03-18T10:00:00Z"), 200)
+    hourly = Resampler("hour")
+    for start in range(0, 200, 7):
+        # every update repeats the last minute, it may have been still forming
+        assert hourly.update(fine[max(0, start - 1):start + 7]) is None
+    assert hourly.series.to_candles() == resample.resample(fine, "hour").to_candles()
+    assert len(hourly.fine) <= 60
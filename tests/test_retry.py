@@ -0,0 +1,151 @@
+import time
+import pytest
+import threading
+from conftest import once
+from retry import RetryPolicy, CircuitBreaker
+from transport import Transport
+from metrics import Metrics
+
+
+FIGI = "BBG000HLJ7M4"
+
+
+def test_retry_after_is_waited_in_full():
+    policy = RetryPolicy(max_backoff=30)
+    assert policy.wait(0, "60") == 60
+    assert policy.should_retry(0, "GET", 429, retry_after="60")
+    assert not policy.should_retry(0, "GET", 429, retry_after="600")
+
+
+def test_long_retry_after_gives_up(make_client, server):
+    client = make_client(retry=RetryPolicy(max_retry_after=5))
+    client.register()
+    server.rate_limits = {"portfolio": 1}
+    assert client.get_portfolio() == []
+    start = time.monotonic()
+    assert "429" in client.get_portfolio()
+    assert time.monotonic() - start < 1
+    assert server.requests["/portfolio"] == 2
+
+
+def test_get_is_retried_on_500(make_client, server):
+    client = make_client()
+    server.routes["/portfolio"] = once(server.routes["/portfolio"], 500, "Injected")
+    assert client.get_portfolio() == []
+
+
+def test_post_is_not_retried_on_500(make_client, server):
+    client = make_client()
+    server.routes["/orders/limit-order"] = once(server.routes["/orders/limit-order"], 500, "Injected")
+    assert "500" in client.place_order(FIGI, 1, "Buy", 10)
+    assert server.requests["/orders/limit-order"] == 1
+
+
+def test_client_order_id_is_sent_once(make_client, server):
+    client = make_client()
+    first = client.place_order(FIGI, 1, "Buy", 10, client_order_id="a")
+    assert client.place_order(FIGI, 1, "Buy", 10, client_order_id="a") == first
+    assert server.requests["/orders/limit-order"] == 1
+
+
+def test_client_order_id_after_error_is_sent_again(make_client, server):
+    # an error response surely placed nothing, the key is not used up
+    client = make_client()
+    server.routes["/orders/limit-order"] = once(server.routes["/orders/limit-order"], 500, "Outage")
+    assert "500" in client.place_order(FIGI, 1, "Buy", 10, client_order_id="b")
+    assert isinstance(client.place_order(FIGI, 1, "Buy", 10, client_order_id="b"), dict)
+    assert "Error" in client.place_order(FIGI, 1, "Hold", 10, client_order_id="c")
+    assert isinstance(client.place_order(FIGI, 1, "Buy", 10, client_order_id="c"), dict)
+    assert len(server.orders) == 2
+
+
+def test_client_order_id_after_read_timeout_is_kept(make_client, server):
+    # the order may have been placed, it is not sent again
+    client = make_client(retry=RetryPolicy(read_timeout=0.1))
+    client.register()
+    server.latency = 0.3
+    first = client.place_order(FIGI, 1, "Buy", 10, client_order_id="d")
+    assert "Read timed out" in first
+    server.latency = 0
+    assert client.place_order(FIGI, 1, "Buy", 10, client_order_id="d") == first
+    assert server.requests["/orders/limit-order"] == 1
+
+
+def test_concurrent_client_order_id(make_client, server):
+    client = make_client()
+    client.register()
+    server.latency = 0.1
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        client.place_order(FIGI, 1, "Buy", 10, client_order_id="e"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(server.orders) == 1
+    assert all(result == results[0] for result in results)
+
+
+def test_circuit_breaker(make_client, server):
+    client = make_client(retry=RetryPolicy(retries=0), breaker=CircuitBreaker(threshold=2, reset=60))
+    client.register()
+    server.error_rate = 1
+    client.get_portfolio()
+    client.get_portfolio()
+    assert "Circuit is open" in client.get_portfolio()
+    assert server.requests["/portfolio"] == 2
+
+
+def test_hedged_gets_keep_concurrency(make_client, server):
+    client = make_client(
+        retry=RetryPolicy(hedge_delay=5), transport=Transport(pool_maxsize=32))
+    client.register()
+    server.latency = 0.3
+    threads = [threading.Thread(target=client.get_portfolio) for _ in range(32)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - start < 0.55
+
+
+def test_streamed_get_is_retried_and_observed(make_client, server):
+    metrics = Metrics()
+    client = make_client(metrics=metrics)
+    server.routes["/market/stocks"] = once(server.routes["/market/stocks"], 500, "Injected")
+    assert len(list(client.iter_market("stocks"))) == len(server.stocks)
+    stats = metrics.snapshot()["/market/stocks"]
+    assert stats["retries"] == 1
+    assert stats["bytes_in"] > 200  # the streamed body, not only the error
+
+
+@pytest.mark.parametrize("http2", [False, True])
+def test_streamed_error_message(make_client, server, http2):
+    if http2:
+        pytest.importorskip("httpx")
+        pytest.importorskip("h2")
+    client = make_client(retry=RetryPolicy(retries=0), transport=Transport(http2=http2))
+    server.routes["/market/stocks"] = once(server.routes["/market/stocks"], 500, "Injected")
+    with pytest.raises(Exception, match="Injected"):
+        list(client.iter_market("stocks"))
+    assert len(list(client.iter_market("stocks"))) == len(server.stocks)
+
+
+def test_close_stops_hedge_pools(make_client, server):
+    closed = []
+
+    class Shared(Transport):
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    with make_client(retry=RetryPolicy(hedge_delay=1)) as client:
+        assert client.get_portfolio() == []
+        pools = client.primary_pool, client.hedge_pool
+    assert client.primary_pool is None and all(pool._shutdown for pool in pools)
+
+    shared = Shared()
+    with make_client(transport=shared) as client:
+        client.get_portfolio()
+    assert closed == []
@@ -0,0 +1,64 @@
+from catalog import InstrumentCatalog
+from fake_server import make_stocks
+from ratelimit import RATE_LIMITS, RateLimiter
+from scanner import Scanner, static_filter
+
+
+def unlimited(make_client):
+    return make_client(limiter=RateLimiter({group: 10**9 for group in RATE_LIMITS}))
+
+
+def test_static_filter():
+    instrument = {"currency": "USD", "type": "Stock", "lot": 10}
+    assert static_filter(instrument, {"currency": "USD", "type": ("Stock", "Etf")})
+    assert static_filter(instrument, {"lot": lambda lot: lot <= 10})
+    assert not static_filter(instrument, {"currency": "RUB"})
+    assert not static_filter(instrument, {"type": ("Bond",)})
+
+
+def test_scan_resumes_from_checkpoint(make_client, server, tmp_path):
+    server.stocks = make_stocks(120)
+    checkpoint = str(tmp_path / "scan")
+    has_candles = lambda instrument, series: len(series) > 0
+    scanner = Scanner(unlimited(make_client), checkpoint=checkpoint, workers=4)
+
+    first = []
+    for instrument, series in scanner.scan([has_candles], depth=10):
+        first.append(instrument["figi"])
+        if len(first) == 70:
+            break
+    assert set(Scanner(None, checkpoint=checkpoint).matched()) >= set(first)
+
+    # a new scanner of the same checkpoint scans only the rest
+    scanner = Scanner(unlimited(make_client), checkpoint=checkpoint, workers=4)
+    rest = [instrument["figi"] for instrument, _ in scanner.scan([has_candles], depth=10)]
+    assert not set(first) & set(rest) and len(first) + len(rest) == 120
+    # requests in flight at the interrupt are the only ones repeated
+    assert server.requests["/market/candles"] <= 120 + 2 * 4
+    assert sorted(scanner.matched()) == sorted(stock["figi"] for stock in server.stocks)
+
+    # a finished scan starts over
+    assert len(list(scanner.scan([has_candles], depth=10))) == 120
+
+
+def test_failed_instruments_are_scanned_again(make_client, server, tmp_path):
+    server.stocks = make_stocks(10)
+    failed = server.stocks[3]["figi"]
+    route = server.routes["/market/candles"]
+    server.routes["/market/candles"] = lambda query, body: (
+        (500, {"payload": {"message": "Injected", "code": "Error"}})
+        if query.get("figi") == [failed] else route(query, body))
+    scanner = Scanner(make_client(), checkpoint=str(tmp_path / "scan"))
+    assert len(list(scanner.scan([lambda i, s: True], depth=10))) == 9
+    assert "Injected" in scanner.errors[failed]
+
+    server.routes["/market/candles"] = route
+    assert [i["figi"] for i, _ in scanner.scan([lambda i, s: True], depth=10)] == [failed]
+
+
+def test_universe_from_catalog_is_copied(make_client, tmp_path):
+    client = make_client()
+    catalog = InstrumentCatalog(client, db=str(tmp_path / "catalog"))
+    for instrument in Scanner(client, catalog=catalog).universe():
+        instrument["candles"] = []
+    assert all("candles" not in instrument for instrument in catalog.load().instruments)
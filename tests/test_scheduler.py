@@ -0,0 +1,100 @@
+import math
+from scheduler import FakeClock, PollScheduler
+
+
+CALM, VOLATILE = "BBG000CALM00", "BBG000VOLAT0"
+
+
+class Client(object):
+
+    """ Offline client, every poll is recorded with the clock time """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.polls = []
+        self.orders = []
+        self.error = None
+
+
+    def get_candles(self, instruments, depth, interval):
+        figi = instruments[0]['figi']
+        self.polls.append((self.clock(), figi))
+        step = 0.05 if figi == VOLATILE else 0.001
+        closes = [math.exp(step * (-1) ** i) for i in range(30)]
+        return [{'figi': figi, 'candles': [{'c': c} for c in closes]}]
+
+
+    def get_orders(self, account_id=None):
+        self.polls.append((self.clock(), "orders"))
+        return self.error or list(self.orders)
+
+
+    def get_portfolio(self, account_id=None):
+        self.polls.append((self.clock(), "portfolio"))
+        return []
+
+
+def scheduler(budget=60):
+    clock = FakeClock()
+    client = Client(clock)
+    scheduler = PollScheduler(client, budget=budget, clock=clock, sleep=clock.sleep)
+    scheduler.watch_candles(CALM)
+    scheduler.watch_candles(VOLATILE)
+    scheduler.watch_orders()
+    scheduler.watch_portfolio()
+    return scheduler, client
+
+
+def test_budget_is_respected():
+    s, client = scheduler(budget=60)
+    s.run(duration=600)
+    times = [t for t, _ in client.polls]
+    assert 590 <= len(times) <= 601
+    assert all(sum(1 for t in times if start <= t < start + 60) <= 60 for start in times)
+
+
+def test_deterministic_with_fake_clock():
+    first, second = scheduler(), scheduler()
+    first[0].run(steps=100)
+    second[0].run(steps=100)
+    assert first[1].polls == second[1].polls
+
+
+def test_volatile_and_ordered_instruments_are_polled_more():
+    s, client = scheduler()
+    s.run(duration=600)
+    counts = {name: sum(1 for _, n in client.polls if n == name) for _, name in client.polls}
+    assert counts[VOLATILE] > counts[CALM]
+
+    client.orders = [{'figi': CALM}] * 3
+    client.polls = []
+    s.run(duration=600)
+    counts = {name: sum(1 for _, n in client.polls if n == name) for _, name in client.polls}
+    assert counts["orders"] > counts["portfolio"]
+    assert counts[CALM] > counts["portfolio"]
+
+
+def test_subscribers_get_changes_and_errors():
+    s, client = scheduler()
+    events = []
+    s.subscribe(lambda name, data, error: events.append((name, data, error)), "orders")
+    s.run(duration=120)
+    assert events == [("orders", [], None)]
+
+    client.error = "Error 500"
+    s.run(duration=120)
+    assert events[-1] == ("orders", None, "Error 500")
+
+
+def test_windowed_candles_are_charged_per_request():
+    clock = FakeClock()
+    client = Client(clock)
+    s = PollScheduler(client, budget=60, clock=clock, sleep=clock.sleep)
+    s.watch_candles(CALM, depth=3)  # three one day windows of 1min candles
+    s.watch_orders()
+    s.run(duration=600)
+
+    requests = [(t, 3 if name == CALM else 1) for t, name in client.polls]
+    assert sum(cost for _, cost in requests) <= 600 + 3
+    assert all(sum(cost for t, cost in requests if start <= t < start + 60) <= 60 + 3
+        for start, _ in requests)
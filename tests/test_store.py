@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from store import CandleStore, from_epoch, to_epoch
+
+
+FIGI = "BBG000HLJ7M4"
+T0 = datetime(2021, 3, 18, 10, 0)
+
+
+def minutes(n):
+    return T0 + timedelta(minutes=n)
+
+
+def candles(start, end, close=1.):
+    return [{"time": from_epoch(to_epoch(minutes(m))), "o": close, "h": close, "l": close,
+        "c": close, "v": 1} for m in range(start, end)]
+
+
+def test_empty_store_misses_everything(tmp_path):
+    store = CandleStore(str(tmp_path))
+    assert store.missing(FIGI, "1min", minutes(0), minutes(10)) == [(minutes(0), minutes(10))]
+
+
+def test_tail_starts_at_last_candle(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.append(FIGI, "1min", candles(0, 10), minutes(0), minutes(10))
+    assert store.missing(FIGI, "1min", minutes(0), minutes(10)) == []
+    assert store.missing(FIGI, "1min", minutes(0), minutes(20)) == [(minutes(9), minutes(20))]
+
+
+def test_gaps(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.append(FIGI, "1min", candles(0, 10), minutes(0), minutes(10))
+    store.append(FIGI, "1min", candles(20, 30), minutes(20), minutes(30))
+    assert store.missing(FIGI, "1min", minutes(0), minutes(30)) == [(minutes(10), minutes(20))]
+
+    # a gap shorter than min_gap is served from the store
+    store = CandleStore(str(tmp_path), min_gap=3600)
+    assert store.missing(FIGI, "1min", minutes(0), minutes(30)) == []
+
+
+def test_append_replaces_last_candle(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.append(FIGI, "1min", candles(0, 3), minutes(0), minutes(3))
+    store.append(FIGI, "1min", candles(2, 5, close=2.), minutes(2), minutes(5))
+    assert [c["c"] for c in store.candles(FIGI, "1min")] == [1., 1., 2., 2., 2.]
+    assert store.ranges(FIGI, "1min") == [[to_epoch(minutes(0)), to_epoch(minutes(5))]]
+
+
+def test_append_older_candles_keeps_time_order(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.append(FIGI, "1min", candles(5, 8), minutes(5), minutes(8))
+    store.append(FIGI, "1min", candles(0, 6, close=2.), minutes(0), minutes(6))
+    series = store.candles(FIGI, "1min")
+    assert [c["time"] for c in series] == [c["time"] for c in candles(0, 8)]
+    assert [c["c"] for c in series] == [2.] * 6 + [1.] * 2
+    assert len(store.read(FIGI, "1min", minutes(2), minutes(4))["time"]) == 3
+
+
+def test_tail_shorter_than_interval_is_fetched(tmp_path):
+    store = CandleStore(str(tmp_path))
+    day = [{"time": "2021-03-18T00:00:00Z", "o": 1., "h": 1., "l": 1., "c": 1., "v": 1}]
+    store.append(FIGI, "day", day, datetime(2021, 3, 17), datetime(2021, 3, 18, 10))
+    assert store.missing(FIGI, "day", datetime(2021, 3, 17), datetime(2021, 3, 18, 18)) == [
+        (datetime(2021, 3, 18), datetime(2021, 3, 18, 18))]
+
+    store.append(FIGI, "1min", candles(0, 5), minutes(0), minutes(5))
+    assert store.missing(FIGI, "1min", minutes(0), minutes(5) + timedelta(seconds=10)) == [
+        (minutes(4), minutes(5) + timedelta(seconds=10))]
@@ -0,0 +1,135 @@
+import asyncio
+import pytest
+from fake_stream import StreamServer, EVENTS
+from streaming import MarketStream
+
+
+FIGI = "BBG000HLJ7M4"
+
+
+def candles(n):
+    return [{"event": "candle", "payload": dict(EVENTS[0]["payload"], v=i)} for i in range(n)]
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+
+def test_iterate_events():
+    async def main():
+        server = StreamServer()
+        url = await server.start()
+        async with MarketStream("token", url=url) as stream:
+            await stream.subscribe_candles(FIGI, "1min")
+            await stream.subscribe_orderbook(FIGI, 2)
+            events = []
+            async for event in stream:
+                events.append(event["event"])
+                if len(events) == 2:
+                    break
+        await server.stop()
+        return events
+
+    assert run(main()) == ["candle", "orderbook"]
+
+
+def test_callbacks_without_iterator():
+    # the queue is filled only for an iterating consumer
+    async def main():
+        server = StreamServer(candles(20))
+        url = await server.start()
+        received = []
+        async with MarketStream("token", url=url, queue_size=5) as stream:
+            stream.on("candle", received.append)
+            await stream.subscribe_candles(FIGI, "1min")
+            while len(received) < 20:
+                await asyncio.sleep(0.01)
+        await server.stop()
+        return received
+
+    assert [event["payload"]["v"] for event in run(main())] == list(range(20))
+
+
+def test_reconnect_resubscribes():
+    async def main():
+        server = StreamServer(candles(3), disconnect_after=1)
+        url = await server.start()
+        errors = []
+        async with MarketStream("token", url=url, reconnect_delay=0.01) as stream:
+            stream.on("error", errors.append)
+            await stream.subscribe_candles(FIGI, "1min")
+            events = []
+            async for event in stream:
+                events.append(event["payload"]["v"])
+                if len(events) == 4:
+                    break
+        await server.stop()
+        return events, server.connections, server.received
+
+    events, connections, received = run(main())
+    # 1 event before the disconnect, all 3 replayed after the resubscribe
+    assert events == [0, 0, 1, 2]
+    assert connections == 2
+    assert [message["event"] for message in received] == ["candle:subscribe"] * 2
+
+
+def test_connect_error_is_raised():
+    async def main():
+        async with MarketStream("token", url="ws://127.0.0.1:1/ws"):
+            pass
+
+    with pytest.raises(Exception, match="Can not connect"):
+        run(main())
+
+
+def test_connect_timeout():
+    async def main():
+        async def accept(reader, writer):
+            await asyncio.sleep(10)
+
+        server = await asyncio.start_server(accept, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            await MarketStream("token", url="ws://127.0.0.1:{}/ws".format(port),
+                connect_timeout=0.2).connect()
+        finally:
+            server.close()
+
+    with pytest.raises(Exception, match="no connection in 0.2 sec"):
+        run(main())
+
+
+def test_close_ends_full_queue():
+    async def main():
+        server = StreamServer(candles(10))
+        url = await server.start()
+        stream = await MarketStream("token", url=url, queue_size=3).connect()
+        aiter = stream.__aiter__()
+        await stream.subscribe_candles(FIGI, "1min")
+        while not stream.queue.full():
+            await asyncio.sleep(0.01)
+        await stream.close()
+        events = [event async for event in aiter]
+        await server.stop()
+        return events
+
+    assert len(run(main())) == 3
+
+
+def test_no_queue_is_callbacks_only():
+    async def main():
+        server = StreamServer(candles(3))
+        url = await server.start()
+        received = []
+        async with MarketStream("token", url=url, queue_size=0) as stream:
+            stream.on("candle", received.append)
+            await stream.subscribe_candles(FIGI, "1min")
+            with pytest.raises(Exception, match="queue_size=0"):
+                async for event in stream:
+                    pass
+            while len(received) < 3:
+                await asyncio.sleep(0.01)
+        await server.stop()
+        return received
+
+    assert len(run(main())) == 3
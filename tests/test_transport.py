@@ -0,0 +1,17 @@
+import pytest
+from transport import Transport
+
+
+def test_keep_alive_header_on_http1():
+    transport = Transport()
+    assert transport.session.headers["Connection"] == "keep-alive"
+    transport.close()
+
+
+def test_no_connection_header_on_http2():
+    pytest.importorskip("httpx")
+    pytest.importorskip("h2")
+    transport = Transport(http2=True)
+    assert "Connection" not in transport.headers
+    assert "connection" not in transport.session.headers
+    transport.close()
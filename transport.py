@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# 18oct26 hjltu@ya.ru
+# Copyright (c) 2020 hjltu
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+MSG_ERR = "Error! "
+MSG_TRANSPORT = "Transport. {}"
+MSG_TRANSPORT_ERR = MSG_ERR + MSG_TRANSPORT
+MSG_HTTP2 = "http2 requires httpx[http2]: pip install 'httpx[http2]'"
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 32
+CHUNK_SIZE = 65536
+
+
+class Transport(object):
+
+    """ Persistent HTTP transport owned by the client,
+        keeps TCP+TLS connections alive between calls.
+        Thread-safe, each thread takes a connection from the pool,
+        pool_maxsize should be >= number of threads sharing the client """
+
+    def __init__(self,
+        pool_connections: int = POOL_CONNECTIONS,
+        pool_maxsize: int = POOL_MAXSIZE,
+        http2: bool = False,
+        gzip: bool = True):
+
+        """ Create connection pool
+        Input:
+            pool_connections: int, number of hosts to keep pools for,
+            pool_maxsize: int, connections kept alive per host,
+            http2: bool, use httpx with HTTP/2 multiplexing, optional,
+            gzip: bool, negotiate gzip/deflate response encoding """
+
+        self.http2 = http2
+        self.pool_maxsize = pool_maxsize
+        self.headers = {'Accept-Encoding': 'gzip, deflate' if gzip else 'identity'}
+
+        if http2:
+            try:
+                import httpx
+            except ImportError:
+                raise Exception(MSG_TRANSPORT_ERR.format(MSG_HTTP2))
+            limits = httpx.Limits(
+                max_connections=pool_connections * pool_maxsize,
+                max_keepalive_connections=pool_maxsize)
+            self.httpx = httpx
+            self.session = httpx.Client(http2=True, limits=limits, headers=self.headers)
+            # httpx sends Connection: keep-alive by default, illegal in HTTP/2
+            self.session.headers.pop('Connection', None)
+        else:
+            # connection-specific headers are illegal in HTTP/2, HTTP/1.1 only
+            self.headers['Connection'] = 'keep-alive'
+            self.session = requests.Session()
+            self.session.headers.update(self.headers)
+            adapter = HTTPAdapter(
+                pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+
+
+    def request(self,
+        method: str,
+        url: str,
+        headers: dict = None,
+        params: dict = None,
+        data: str = None,
+        timeout = 11):
+
+        """ Send request over a pooled connection
+            Input:
+                method: str, "GET" or "POST",
+                url: str,
+                headers: dict,
+                params: dict,
+                data: str, json encoded body, optional,
+                timeout: int or tuple, seconds, (connect, read)
+            Output:
+                response, requests.Response or httpx.Response """
+
+        if self.http2:
+            if isinstance(timeout, tuple):
+                timeout = self.httpx.Timeout(timeout[1], connect=timeout[0])
+            return self.session.request(
+                method, url, headers=headers, params=params, content=data, timeout=timeout)
+
+        return self.session.request(
+            method, url, headers=headers, params=params, data=data, timeout=timeout)
+
+
+    def stream(self,
+        method: str,
+        url: str,
+        headers: dict = None,
+        params: dict = None,
+        data: str = None,
+        timeout = 11):
+
+        """ Send request without reading the body, see iter_bytes,
+            the response must be closed to return its connection to the pool
+            Input: see request
+            Output:
+                response, requests.Response or httpx.Response """
+
+        if self.http2:
+            if isinstance(timeout, tuple):
+                timeout = self.httpx.Timeout(timeout[1], connect=timeout[0])
+            request = self.session.build_request(
+                method, url, headers=headers, params=params, content=data, timeout=timeout)
+            return self.session.send(request, stream=True)
+
+        return self.session.request(
+            method, url, headers=headers, params=params, data=data, timeout=timeout, stream=True)
+
+
+    def read(self, response) -> bytes:
+
+        """ Read body of the streamed response, then response.content is set """
+
+        if self.http2:
+            return response.read()
+
+        return response.content
+
+
+    def iter_bytes(self, response, chunk_size: int = CHUNK_SIZE):
+
+        """ Read body of the streamed response in decoded chunks
+            Output: generator of bytes """
+
+        if self.http2:
+            return response.iter_bytes(chunk_size)
+
+        return response.iter_content(chunk_size)
+
+
+    def close(self):
+
+        """ Close all pooled connections """
+
+        self.session.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()